@@ -8,6 +8,7 @@ import {
   FiMessageCircle,
 } from "react-icons/fi";
 import { useAuth } from "../context/AuthContext";
+import { fetchSessions } from "../lib/agentHistory";
 
 interface ChatSession {
   id: string;
@@ -26,27 +27,23 @@ const ChatSessionsList: React.FC<ChatSessionsListProps> = ({
   currentSessionId,
   onNewSession,
 }) => {
-  const { supabase, user } = useAuth();
+  const { supabase, user, getAccessToken } = useAuth();
   const [sessions, setSessions] = useState<ChatSession[]>([]);
   const [loading, setLoading] = useState(true);
+  const [olderBefore, setOlderBefore] = useState<string | null>(null);
   const [editingSession, setEditingSession] = useState<string | null>(null);
   const [editTitle, setEditTitle] = useState("");
 
   // Fetch chat sessions
   useEffect(() => {
-    const fetchSessions = async () => {
+    const loadSessions = async () => {
       if (!user) return;
 
       try {
         setLoading(true);
-        const { data, error } = await supabase
-          .from("chat_sessions")
-          .select("id, title, created_at")
-          .eq("user_id", user.id)
-          .order("created_at", { ascending: false });
-
-        if (error) throw error;
-        setSessions(data || []);
+        const page = await fetchSessions(await getAccessToken());
+        setSessions(page.items);
+        setOlderBefore(page.nextBefore);
       } catch (error) {
         console.error("Error fetching chat sessions:", error);
       } finally {
@@ -54,9 +51,22 @@ const ChatSessionsList: React.FC<ChatSessionsListProps> = ({
       }
     };
 
-    fetchSessions();
+    loadSessions();
   }, [supabase, user]);
 
+  // Append the next page of older sessions
+  const handleLoadMore = async () => {
+    if (!user || !olderBefore) return;
+
+    try {
+      const page = await fetchSessions(await getAccessToken(), olderBefore);
+      setSessions((prev) => [...prev, ...page.items]);
+      setOlderBefore(page.nextBefore);
+    } catch (error) {
+      console.error("Error fetching chat sessions:", error);
+    }
+  };
+
   // Delete a chat session
   const handleDeleteSession = async (
     sessionId: string,
@@ -223,6 +233,16 @@ const ChatSessionsList: React.FC<ChatSessionsListProps> = ({
               </motion.li>
             ))}
           </AnimatePresence>
+          {olderBefore && (
+            <li className="flex justify-center pt-1">
+              <button
+                onClick={handleLoadMore}
+                className="text-xs text-gray-600 bg-blue-50 px-3 py-1 rounded-lg hover:bg-blue-100 transition-colors"
+              >
+                Load older sessions
+              </button>
+            </li>
+          )}
         </ul>
       )}
     </div>
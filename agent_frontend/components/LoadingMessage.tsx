@@ -2,7 +2,11 @@ import React from "react";
 import { motion } from "framer-motion";
 import { FiCpu } from "react-icons/fi";
 
-const LoadingMessage: React.FC = () => {
+interface LoadingMessageProps {
+  status?: string;
+}
+
+const LoadingMessage: React.FC<LoadingMessageProps> = ({ status }) => {
   return (
     <motion.div
       initial={{ opacity: 0, y: 10 }}
@@ -28,7 +32,7 @@ const LoadingMessage: React.FC = () => {
                 <span></span>
               </div>
               <span className="ml-2 text-gray-600 text-sm">
-                AI is thinking...
+                {status || "AI is thinking..."}
               </span>
             </div>
           </div>
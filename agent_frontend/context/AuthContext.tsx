@@ -26,6 +26,7 @@ type AuthContextType = {
     error?: string;
   }>;
   getUserId: () => string | null;
+  getAccessToken: () => Promise<string>;
 };
 
 // Create context
@@ -156,6 +157,16 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({
     return user?.id || null;
   };
 
+  // The session's access token (refreshed first if it has expired), which the
+  // agent server verifies to know who is calling
+  const getAccessToken = async () => {
+    const {
+      data: { session },
+    } = await supabase.auth.getSession();
+    if (!session) throw new Error("Not signed in");
+    return session.access_token;
+  };
+
   // Provide auth context value
   const value = {
     user,
@@ -166,6 +177,7 @@ export const AuthProvider: React.FC<{ children: React.ReactNode }> = ({
     signOut,
     resetPassword,
     getUserId,
+    getAccessToken,
   };
 
   return <AuthContext.Provider value={value}>{children}</AuthContext.Provider>;
@@ -0,0 +1,83 @@
+// lib/agentHistory.ts
+// Chat history through the agent server, which pages it (newest page first,
+// `before` a message id for older ones) and caches each session's recent messages.
+// Every call carries the user's Supabase access token, which is how the agent
+// server knows whose history it is.
+
+export interface StoredMessage {
+  id: string;
+  session_id: string;
+  sender: "user" | "ai";
+  content: string;
+  created_at: string;
+}
+
+export interface StoredSession {
+  id: string;
+  title: string;
+  created_at: string;
+}
+
+export interface Page<T> {
+  items: T[];
+  hasMore: boolean;
+  nextBefore: string | null;
+}
+
+async function getJson(
+  url: string,
+  accessToken: string,
+  init: RequestInit = {}
+): Promise<any> {
+  const res = await fetch(url, {
+    ...init,
+    headers: { ...init.headers, Authorization: `Bearer ${accessToken}` },
+  });
+  if (!res.ok) {
+    const errorData = await res.json().catch(() => null);
+    throw new Error(errorData?.error || `Server error: ${res.status} ${res.statusText}`);
+  }
+  return res.json();
+}
+
+/** A page of the session's messages, oldest first. */
+export async function fetchMessages(
+  sessionId: string,
+  accessToken: string,
+  before?: string | null,
+  limit = 50
+): Promise<Page<StoredMessage>> {
+  const params = new URLSearchParams({
+    session_id: sessionId,
+    limit: String(limit),
+  });
+  if (before) params.set("before", before);
+  const data = await getJson(`/api/history/messages?${params}`, accessToken);
+  return { items: data.messages, hasMore: data.has_more, nextBefore: data.next_before };
+}
+
+/** A page of the signed-in user's sessions, newest first. */
+export async function fetchSessions(
+  accessToken: string,
+  before?: string | null,
+  limit = 20
+): Promise<Page<StoredSession>> {
+  const params = new URLSearchParams({ limit: String(limit) });
+  if (before) params.set("before", before);
+  const data = await getJson(`/api/history/sessions?${params}`, accessToken);
+  return { items: data.sessions, hasMore: data.has_more, nextBefore: data.next_before };
+}
+
+/** Store a message that isn't part of an agent turn (welcome or error messages). */
+export async function postMessage(
+  sessionId: string,
+  accessToken: string,
+  sender: "user" | "ai",
+  content: string
+): Promise<StoredMessage> {
+  return getJson("/api/history/messages", accessToken, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ session_id: sessionId, sender, content }),
+  });
+}
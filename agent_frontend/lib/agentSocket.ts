@@ -0,0 +1,113 @@
+// lib/agentSocket.ts
+// Persistent chat connection to the agent server's /ws endpoint.
+// One socket per chat session; the server keeps the conversation history.
+
+import type { StoredMessage } from "./agentHistory";
+
+export type AgentEvent =
+  | { type: "session"; session_id: string; turns: number }
+  | { type: "agent"; name: string }
+  | { type: "tool_call"; tool: string | null; call_id: string | null }
+  | { type: "tool_output"; tool: string | null; call_id: string | null }
+  | { type: "delta"; text: string }
+  | {
+      type: "final";
+      final_output: string;
+      turn: number;
+      messages?: StoredMessage[];
+    }
+  | { type: "error"; status: number; detail: string; retry_after?: number };
+
+export const AGENT_WS_URL = process.env.NEXT_PUBLIC_AGENT_WS_URL || "";
+
+interface PendingTurn {
+  onEvent: (event: AgentEvent) => void;
+  resolve: (answer: string) => void;
+  reject: (error: Error) => void;
+}
+
+export class AgentSocket {
+  private socket: WebSocket | null = null;
+  private opening: Promise<WebSocket> | null = null;
+  private pending: PendingTurn | null = null;
+
+  constructor(
+    private userId: string,
+    private sessionId: string,
+    // the user's Supabase access token, for saving turns to the chat history
+    private getAccessToken: () => Promise<string>
+  ) {}
+
+  private open(): Promise<WebSocket> {
+    if (this.socket && this.socket.readyState === WebSocket.OPEN) {
+      return Promise.resolve(this.socket);
+    }
+    if (this.opening) return this.opening;
+
+    this.opening = this.getAccessToken().then((accessToken) =>
+      this.connect(accessToken)
+    );
+    this.opening.catch(() => {
+      this.opening = null;
+    });
+    return this.opening;
+  }
+
+  private connect(accessToken: string): Promise<WebSocket> {
+    // browsers can't set headers on a WebSocket, so the token goes in the URL
+    const params = new URLSearchParams({
+      user_id: this.userId,
+      session_id: this.sessionId,
+      access_token: accessToken,
+    });
+    return new Promise((resolve, reject) => {
+      const socket = new WebSocket(`${AGENT_WS_URL}?${params}`);
+      socket.onopen = () => {
+        this.socket = socket;
+        this.opening = null;
+        resolve(socket);
+      };
+      socket.onmessage = (msg) => this.dispatch(JSON.parse(msg.data));
+      socket.onclose = (ev) => {
+        this.socket = null;
+        this.opening = null;
+        reject(new Error(ev.reason || "Connection to agent server closed"));
+        this.pending?.reject(
+          new Error(ev.reason || "Connection to agent server lost")
+        );
+        this.pending = null;
+      };
+    });
+  }
+
+  private dispatch(event: AgentEvent) {
+    const turn = this.pending;
+    if (!turn) return;
+    turn.onEvent(event);
+    if (event.type === "final") {
+      this.pending = null;
+      turn.resolve(event.final_output);
+    } else if (event.type === "error") {
+      this.pending = null;
+      turn.reject(new Error(event.detail));
+    }
+  }
+
+  /** Send one message; `onEvent` sees progress events until the final answer. */
+  async ask(
+    message: string,
+    onEvent: (event: AgentEvent) => void = () => {}
+  ): Promise<string> {
+    if (this.pending) throw new Error("A message is already in progress");
+    const socket = await this.open();
+    return new Promise((resolve, reject) => {
+      this.pending = { onEvent, resolve, reject };
+      socket.send(JSON.stringify({ message }));
+    });
+  }
+
+  close() {
+    this.socket?.close();
+    this.socket = null;
+  }
+}
@@ -19,7 +19,11 @@ export default async function handler(
   try {
     response = await fetch("http://localhost:8000/query", {
       method: "POST",
-      headers: { "Content-Type": "application/json" },
+      headers: {
+        "Content-Type": "application/json",
+        // required with a session_id: the session must be the signed-in user's
+        Authorization: req.headers.authorization || "",
+      },
       body: JSON.stringify(payload),
     });
   } catch (err) {
@@ -37,10 +41,20 @@ export default async function handler(
   }
   console.log("[ask.ts] ← JSON from agent-server:", data);
 
+  if (!response.ok) {
+    console.error("[ask.ts] ❌ Agent server error:", data);
+    return res
+      .status(response.status)
+      .json({ error: data?.detail || "Agent server error" });
+  }
+
   if (!data?.response) {
     console.error("[ask.ts] ❌ Missing `response` field:", data);
     return res.status(500).json({ error: "No response from agent server" });
   }
 
-  return res.status(200).json({ response: data.response });
+  // With a session_id, the agent server has stored both messages; pass their rows on
+  return res
+    .status(200)
+    .json({ response: data.response, messages: data.messages });
 }
@@ -0,0 +1,53 @@
+// pages/api/history/messages.ts
+import type { NextApiRequest, NextApiResponse } from "next";
+
+const AGENT_SERVER_URL = "http://localhost:8000";
+
+export default async function handler(
+  req: NextApiRequest,
+  res: NextApiResponse
+) {
+  // The agent server works out the user from their access token
+  const authorization = req.headers.authorization || "";
+
+  let response;
+  try {
+    if (req.method === "GET") {
+      const { session_id, before, limit } = req.query;
+      const params = new URLSearchParams();
+      if (before) params.set("before", String(before));
+      if (limit) params.set("limit", String(limit));
+      response = await fetch(
+        `${AGENT_SERVER_URL}/sessions/${encodeURIComponent(String(session_id))}/messages?${params}`,
+        { headers: { Authorization: authorization } }
+      );
+    } else if (req.method === "POST") {
+      const { session_id, sender, content } = req.body;
+      response = await fetch(
+        `${AGENT_SERVER_URL}/sessions/${encodeURIComponent(String(session_id))}/messages`,
+        {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            Authorization: authorization,
+          },
+          body: JSON.stringify({ sender, content }),
+        }
+      );
+    } else {
+      res.setHeader("Allow", "GET, POST");
+      return res.status(405).json({ error: "Method not allowed" });
+    }
+  } catch (err) {
+    console.error("[history/messages.ts] ❌ Fetch error:", err);
+    return res.status(500).json({ error: "Could not reach agent server" });
+  }
+
+  const data = await response.json().catch(() => null);
+  if (!response.ok) {
+    return res
+      .status(response.status)
+      .json({ error: data?.detail || "Agent server error" });
+  }
+  return res.status(response.status).json(data);
+}
@@ -0,0 +1,33 @@
+// pages/api/history/sessions.ts
+import type { NextApiRequest, NextApiResponse } from "next";
+
+const AGENT_SERVER_URL = "http://localhost:8000";
+
+export default async function handler(
+  req: NextApiRequest,
+  res: NextApiResponse
+) {
+  const { before, limit } = req.query;
+  const params = new URLSearchParams();
+  if (before) params.set("before", String(before));
+  if (limit) params.set("limit", String(limit));
+
+  let response;
+  try {
+    // The agent server works out the user from their access token
+    response = await fetch(`${AGENT_SERVER_URL}/sessions?${params}`, {
+      headers: { Authorization: req.headers.authorization || "" },
+    });
+  } catch (err) {
+    console.error("[history/sessions.ts] ❌ Fetch error:", err);
+    return res.status(500).json({ error: "Could not reach agent server" });
+  }
+
+  const data = await response.json().catch(() => null);
+  if (!response.ok) {
+    return res
+      .status(response.status)
+      .json({ error: data?.detail || "Agent server error" });
+  }
+  return res.status(200).json(data);
+}
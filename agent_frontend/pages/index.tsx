@@ -21,6 +21,8 @@ import { useRouter } from "next/router";
 import { useAuth } from "../context/AuthContext";
 import ProtectedRoute from "../components/ProtectedRoute";
 import ChatSessionsList from "../components/ChatSessionsList";
+import { AGENT_WS_URL, AgentSocket } from "../lib/agentSocket";
+import { StoredMessage, fetchMessages, postMessage } from "../lib/agentHistory";
 
 interface ChatMessageData {
   id?: string;
@@ -30,6 +32,14 @@ interface ChatMessageData {
   session_id?: string;
 }
 
+const toChatMessage = (msg: StoredMessage): ChatMessageData => ({
+  id: msg.id,
+  sender: msg.sender,
+  content: msg.content,
+  timestamp: new Date(msg.created_at),
+  session_id: msg.session_id,
+});
+
 interface QuickAction {
   label: string;
   value: string;
@@ -131,6 +141,9 @@ interface ChatInterfaceProps {
   isLoading: boolean;
   quickActions: QuickAction[];
   currentSessionId: string | null;
+  progress?: string;
+  hasOlder?: boolean;
+  onLoadOlder?: () => void;
 }
 
 const ChatInterface: React.FC<ChatInterfaceProps> = ({
@@ -139,13 +152,18 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
   isLoading,
   quickActions,
   currentSessionId,
+  progress,
+  hasOlder,
+  onLoadOlder,
 }) => {
   const chatEndRef = useRef<null | HTMLDivElement>(null);
   const [inputValue, setInputValue] = useState("");
+  const lastMessage = chatHistory[chatHistory.length - 1];
 
+  // Scroll down for new messages, not when older ones are prepended
   useEffect(() => {
     chatEndRef.current?.scrollIntoView({ behavior: "smooth" });
-  }, [chatHistory]);
+  }, [lastMessage, isLoading]);
 
   const handleQuickActionClick = (text: string) => {
     setInputValue(text);
@@ -186,6 +204,16 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
           </div>
         ) : (
           <>
+            {hasOlder && (
+              <div className="flex justify-center">
+                <button
+                  onClick={onLoadOlder}
+                  className="text-xs text-gray-600 bg-blue-50 px-3 py-1 rounded-lg hover:bg-blue-100 transition-colors"
+                >
+                  Load earlier messages
+                </button>
+              </div>
+            )}
             {chatHistory.map((message: ChatMessageData, index: number) => (
               <ChatMessage
                 key={message.id || index}
@@ -194,7 +222,7 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
                 timestamp={message.timestamp}
               />
             ))}
-            {isLoading && <LoadingMessage />}
+            {isLoading && <LoadingMessage status={progress} />}
           </>
         )}
         <div ref={chatEndRef} />
@@ -271,12 +299,27 @@ const ChatInterface: React.FC<ChatInterfaceProps> = ({
 };
 
 export default function Home() {
-  const { user, signOut, supabase } = useAuth();
+  const { user, signOut, supabase, getAccessToken } = useAuth();
   const [chatHistory, setChatHistory] = useState<ChatMessageData[]>([]);
   const [isLoading, setIsLoading] = useState(false);
   const [currentSessionId, setCurrentSessionId] = useState<string | null>(null);
+  const [progress, setProgress] = useState("");
+  // cursor for the page of messages before the oldest one shown, if there is one
+  const [olderBefore, setOlderBefore] = useState<string | null>(null);
+  const agentSocket = useRef<AgentSocket | null>(null);
   const router = useRouter();
 
+  // With NEXT_PUBLIC_AGENT_WS_URL set, keep one connection per chat session
+  useEffect(() => {
+    if (!AGENT_WS_URL || !user?.id || !currentSessionId) return;
+    const socket = new AgentSocket(user.id, currentSessionId, getAccessToken);
+    agentSocket.current = socket;
+    return () => {
+      socket.close();
+      if (agentSocket.current === socket) agentSocket.current = null;
+    };
+  }, [user?.id, currentSessionId]);
+
   // Generate a welcome message based on the session
   const generateWelcomeMessage = () => {
     return {
@@ -312,25 +355,15 @@ export default function Home() {
       // Add welcome message to new session
       const welcomeMessage = generateWelcomeMessage();
 
-      const { data: msgData, error: msgError } = await supabase
-        .from("messages")
-        .insert([
-          {
-            session_id: newSessionId,
-            sender: welcomeMessage.sender,
-            content: welcomeMessage.content,
-            created_at: welcomeMessage.timestamp.toISOString(),
-          },
-        ])
-        .select()
-        .single();
-
-      if (msgError) throw msgError;
+      const stored = await postMessage(
+        newSessionId,
+        await getAccessToken(),
+        welcomeMessage.sender,
+        welcomeMessage.content
+      );
 
-      // Set the new message with its ID from the database
-      setChatHistory([
-        { ...welcomeMessage, id: msgData.id, session_id: newSessionId },
-      ]);
+      setOlderBefore(null);
+      setChatHistory([toChatMessage(stored)]);
     } catch (error) {
       console.error("Error creating new session:", error);
     }
@@ -344,26 +377,10 @@ export default function Home() {
       setIsLoading(true);
       setCurrentSessionId(sessionId);
 
-      const { data: messages, error } = await supabase
-        .from("messages")
-        .select("*")
-        .eq("session_id", sessionId)
-        .order("created_at", { ascending: true });
-
-      if (error) throw error;
-
-      // Transform messages to ChatMessageData format
-      const formattedMessages: ChatMessageData[] = (messages || []).map(
-        (msg) => ({
-          id: msg.id,
-          sender: msg.sender,
-          content: msg.content,
-          timestamp: new Date(msg.created_at),
-          session_id: msg.session_id,
-        })
-      );
-
-      setChatHistory(formattedMessages);
+      // Only the latest page; older messages load on demand
+      const page = await fetchMessages(sessionId, await getAccessToken());
+      setChatHistory(page.items.map(toChatMessage));
+      setOlderBefore(page.nextBefore);
     } catch (error) {
       console.error("Error loading chat session:", error);
     } finally {
@@ -371,6 +388,23 @@ export default function Home() {
     }
   };
 
+  // Prepend the page of messages before the oldest one shown
+  const loadOlderMessages = async () => {
+    if (!user || !currentSessionId || !olderBefore) return;
+
+    try {
+      const page = await fetchMessages(
+        currentSessionId,
+        await getAccessToken(),
+        olderBefore
+      );
+      setChatHistory((prev) => [...page.items.map(toChatMessage), ...prev]);
+      setOlderBefore(page.nextBefore);
+    } catch (error) {
+      console.error("Error loading earlier messages:", error);
+    }
+  };
+
   // Handle selecting a chat session
   const handleSessionSelect = (sessionId: string) => {
     if (sessionId === currentSessionId) return;
@@ -437,86 +471,81 @@ export default function Home() {
         throw new Error("User ID is missing. Please sign in again.");
       }
 
-      // Store user message in Supabase
-      const { data: msgData, error: msgError } = await supabase
-        .from("messages")
-        .insert([
-          {
-            session_id: currentSessionId,
-            sender: userMessage.sender,
-            content: userMessage.content,
-            created_at: userMessage.timestamp.toISOString(),
+      // The agent server stores the message and the reply with the turn
+      let finalOutput: string | undefined;
+      let stored: StoredMessage[] | undefined;
+      if (agentSocket.current) {
+        // Stream progress over the session's WebSocket
+        let streamed = "";
+        finalOutput = await agentSocket.current.ask(
+          userMessage.content,
+          (event) => {
+            if (event.type === "agent") {
+              setProgress(`${event.name} is working...`);
+            } else if (event.type === "tool_call") {
+              setProgress(`Running ${event.tool}...`);
+            } else if (event.type === "delta") {
+              streamed += event.text;
+              setProgress(streamed);
+            } else if (event.type === "final") {
+              stored = event.messages;
+            }
+          }
+        );
+      } else {
+        // Prepare request payload with user ID
+        const payload = {
+          message: userMessage.content,
+          user_id: user.id,
+          session_id: currentSessionId,
+        };
+
+        const res = await fetch("/api/ask", {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            Authorization: `Bearer ${await getAccessToken()}`,
           },
-        ])
-        .select()
-        .single();
-
-      if (msgError) throw msgError;
+          body: JSON.stringify(payload),
+        });
+
+        if (!res.ok) {
+          // Handle HTTP errors
+          const errorData = await res.json().catch(() => null);
+          throw new Error(
+            errorData?.error || `Server error: ${res.status} ${res.statusText}`
+          );
+        }
 
-      // Update the message with its ID
-      userMessage.id = msgData.id;
+        const data = await res.json();
+        console.log("[UI] ❇️  Data from /api/ask:", data);
 
-      // Prepare request payload with user ID
-      const payload = {
-        message: userMessage.content,
-        user_id: user.id,
-        session_id: currentSessionId,
-      };
-
-      const res = await fetch("/api/ask", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(payload),
-      });
-
-      if (!res.ok) {
-        // Handle HTTP errors
-        const errorData = await res.json().catch(() => null);
-        throw new Error(
-          errorData?.error || `Server error: ${res.status} ${res.statusText}`
-        );
-      }
-
-      const data = await res.json();
-      console.log("[UI] ❇️  Data from /api/ask:", data);
 
+        if (!data || !data.response) {
+          throw new Error("Invalid response from server");
+        }
 
-      if (!data || !data.response) {
-        throw new Error("Invalid response from server");
+        finalOutput = data.response?.final_output;
+        stored = data.messages;
       }
 
       const aiResponse: ChatMessageData = {
         sender: "ai",
-        content:
-          data.response?.final_output || "Sorry, I couldn't get a response.",
+        content: finalOutput || "Sorry, I couldn't get a response.",
         timestamp: new Date(),
         session_id: currentSessionId,
       };
 
-      // Store AI response in Supabase
-      const { data: aiMsgData, error: aiMsgError } = await supabase
-        .from("messages")
-        .insert([
-          {
-            session_id: currentSessionId,
-            sender: aiResponse.sender,
-            content: aiResponse.content,
-            created_at: aiResponse.timestamp.toISOString(),
-          },
-        ])
-        .select()
-        .single();
-
-      if (aiMsgError) throw aiMsgError;
-
-      // Update AI message with its ID
-      aiResponse.id = aiMsgData.id;
-
-      // Update chat history with AI response
-      setChatHistory((prev) => [...prev, aiResponse]);
-
-      // Update session title if it's still the default "New Chat"
-      updateSessionTitleIfNeeded(currentSessionId, userMessage.content);
+      // Use the stored rows (with their IDs) when the server saved the turn
+      if (stored && stored.length === 2) {
+        const [storedUser, storedAi] = stored.map(toChatMessage);
+        setChatHistory((prev) => [
+          ...prev.map((m) => (m === userMessage ? storedUser : m)),
+          storedAi,
+        ]);
+      } else {
+        setChatHistory((prev) => [...prev, aiResponse]);
+      }
     } catch (error) {
       console.error("Error:", error);
       const errorMessage: ChatMessageData = {
@@ -529,24 +558,22 @@ export default function Home() {
         session_id: currentSessionId,
       };
 
-      // Store error message in Supabase
+      // Store the unanswered message and the error in the session's history
       try {
-        const { data: errorMsgData } = await supabase
-          .from("messages")
-          .insert([
-            {
-              session_id: currentSessionId,
-              sender: errorMessage.sender,
-              content: errorMessage.content,
-              created_at: errorMessage.timestamp.toISOString(),
-            },
-          ])
-          .select()
-          .single();
-
-        if (errorMsgData) {
-          errorMessage.id = errorMsgData.id;
-        }
+        const accessToken = await getAccessToken();
+        await postMessage(
+          currentSessionId,
+          accessToken,
+          userMessage.sender,
+          userMessage.content
+        );
+        const errorMsgData = await postMessage(
+          currentSessionId,
+          accessToken,
+          errorMessage.sender,
+          errorMessage.content
+        );
+        errorMessage.id = errorMsgData.id;
       } catch (saveError) {
         console.error("Error saving error message:", saveError);
       }
@@ -554,43 +581,10 @@ export default function Home() {
       setChatHistory((prev) => [...prev, errorMessage]);
     } finally {
       setIsLoading(false);
+      setProgress("");
     }
   }
 
-  // Update session title based on first user message
-  const updateSessionTitleIfNeeded = async (
-    sessionId: string,
-    message: string
-  ) => {
-    try {
-      // Get current session
-      const { data: session, error: fetchError } = await supabase
-        .from("chat_sessions")
-        .select("title")
-        .eq("id", sessionId)
-        .single();
-
-      if (fetchError) throw fetchError;
-
-      // If title is "New Chat", update with first few words from message
-      if (session && session.title === "New Chat") {
-        // Generate title from first message (max 5 words)
-        const words = message.split(" ");
-        const title =
-          words.slice(0, 5).join(" ") + (words.length > 5 ? "..." : "");
-
-        const { error: updateError } = await supabase
-          .from("chat_sessions")
-          .update({ title })
-          .eq("id", sessionId);
-
-        if (updateError) throw updateError;
-      }
-    } catch (error) {
-      console.error("Error updating session title:", error);
-    }
-  };
-
   const handleLogout = async () => {
     try {
       await signOut();
@@ -681,6 +675,9 @@ export default function Home() {
                 isLoading={isLoading}
                 quickActions={quickActions}
                 currentSessionId={currentSessionId}
+                progress={progress}
+                hasOlder={!!olderBefore}
+                onLoadOlder={loadOlderMessages}
               />
             </div>
           </div>
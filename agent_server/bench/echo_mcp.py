@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# echo_mcp.py — a stdio MCP server built from mcp_server_template.py, for benchmarking.
+# Its one tool sleeps for a configurable time and returns a payload of a configurable
+# size, so framing, JSON encoding and dispatch costs can be measured in isolation.
+import sys, json, time
+
+def echo(text: str = "", sleep_ms: float = 0, response_bytes: int = 0) -> str:
+    if sleep_ms:
+        time.sleep(sleep_ms / 1000)
+    return text + "x" * max(0, response_bytes - len(text))
+
+TOOLS = {
+  "echo": {
+    "description": "Echo text back after an optional delay, padded to response_bytes",
+    "inputSchema": { "type":"object",
+                     "properties": { "text": {"type":"string"},
+                                     "sleep_ms": {"type":"number"},
+                                     "response_bytes": {"type":"integer"} } },
+    "outputSchema": { "type":"string" },
+    "func": echo
+  },
+}
+
+def send(id_, *, result=None, error=None, code=-32000):
+    resp = { "jsonrpc":"2.0", "id": id_ }
+    if (error):
+      resp["error"] = { "code": code, "message": str(error) }
+    else:
+      resp["result"] = result
+    sys.stdout.write(json.dumps(resp) + "\n")
+    sys.stdout.flush()
+
+for line in sys.stdin:
+    try:
+      req = json.loads(line)
+    except:
+      continue
+
+    mth   = req.get("method")
+    id_   = req.get("id")
+    param = req.get("params", {})
+
+    if mth == "initialize":
+      send(id_, result={ "protocolVersion": param.get("protocolVersion", ""), "capabilities": {},
+                         "serverInfo": { "name":"echo_mcp", "version": "0.1.0" }})
+    elif mth == "notifications/initialized":
+      continue
+    elif mth == "tools/list":
+      send(id_, result={ "tools": [ { "name": name, "description": meta["description"],
+                                      "inputSchema": meta["inputSchema"] }
+                                    for name,meta in TOOLS.items() ] })
+    elif mth == "tools/call":
+      name = param.get("name") or param.get("tool_name")
+      args = param.get("arguments", {}) or {}
+      if name not in TOOLS:
+         send(id_, error=f"Unknown tool '{name}'"); continue
+      try:
+        send(id_, result={ "content": [{ "type":"text", "text": TOOLS[name]["func"](**args) }] })
+      except Exception as e:
+        send(id_, error=str(e))
+    elif mth == "shutdown":
+      send(id_, result={})
+      sys.exit(0)
+    else:
+      send(id_, error=f"Unknown method '{mth}'", code=-32601)
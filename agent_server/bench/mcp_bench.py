@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# mcp_bench.py
+"""
+Stdio MCP transport microbenchmark.
+
+Spawns an MCP stdio server, performs the handshake and drives `tools/call`
+with N concurrent callers over the single pipe. Reports throughput, per-call
+latency percentiles, pipe back-pressure (time blocked writing to the server's
+stdin, peak in-flight requests) and the server's RSS growth.
+
+Run from agent_server/:
+  # framing/dispatch cost with a stub tool (bench/echo_mcp.py)
+  python -m bench.mcp_bench --calls 2000 --concurrency 16 --payload-bytes 1024 --response-bytes 4096
+  # the real weather server, against the fake OpenWeather from bench/stubs.py
+  python -m bench.mcp_bench --server mcp_servers/weather_mcp.py --with-stubs \\
+      --tool get_weather --arguments '{"city": "Lisbon"}' --upstream-latency-ms 20
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+from bench.run import BASE_DIR, percentile, _wait_ready
+
+
+def rss_kb(pid: int):
+    """Resident set size of `pid` in KiB (Linux /proc), or None if unavailable."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class StdioClient:
+    """Minimal pipelined JSON-RPC client: many requests in flight over one pipe."""
+
+    def __init__(self, proc: asyncio.subprocess.Process):
+        self.proc = proc
+        self._ids = itertools.count(1)
+        self._pending: dict[int, asyncio.Future] = {}
+        self.in_flight_peak = 0
+        self.write_blocked = 0.0
+        self.write_blocked_max = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self._reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                break
+            self.bytes_in += len(line)
+            msg = json.loads(line)
+            fut = self._pending.pop(msg.get("id"), None)
+            if fut and not fut.done():
+                fut.set_result(msg)
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.set_exception(ConnectionError("server closed stdout"))
+
+    async def _write(self, payload: dict):
+        data = (json.dumps(payload) + "\n").encode()
+        self.bytes_out += len(data)
+        self.proc.stdin.write(data)
+        started = time.perf_counter()
+        await self.proc.stdin.drain()  # blocks while the pipe buffer is full
+        blocked = time.perf_counter() - started
+        self.write_blocked += blocked
+        self.write_blocked_max = max(self.write_blocked_max, blocked)
+
+    async def request(self, method: str, params: dict = None) -> dict:
+        id_ = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[id_] = fut
+        self.in_flight_peak = max(self.in_flight_peak, len(self._pending))
+        await self._write({"jsonrpc": "2.0", "id": id_, "method": method, "params": params or {}})
+        msg = await fut
+        if "error" in msg:
+            raise RuntimeError(msg["error"].get("message"))
+        return msg["result"]
+
+    async def notify(self, method: str, params: dict = None):
+        await self._write({"jsonrpc": "2.0", "method": method, "params": params or {}})
+
+    async def close(self):
+        try:
+            await asyncio.wait_for(self.request("shutdown"), 5)
+        except Exception:
+            pass
+        if self.proc.returncode is None:
+            self.proc.terminate()
+        await self.proc.wait()
+        self._reader.cancel()
+
+
+def call_arguments(args) -> dict:
+    if args.arguments:
+        return json.loads(args.arguments)
+    return {"text": "p" * args.payload_bytes, "sleep_ms": args.tool_latency_ms,
+            "response_bytes": args.response_bytes}
+
+
+async def run(args, env: dict) -> dict:
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-u", args.server,
+        cwd=BASE_DIR, env=env,
+        stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+        stderr=None if args.server_stderr else asyncio.subprocess.DEVNULL,
+        limit=2 ** 24,
+    )
+    client = StdioClient(proc)
+    try:
+        await client.request("initialize", {"protocolVersion": "2025-06-18", "capabilities": {},
+                                            "clientInfo": {"name": "mcp_bench", "version": "0"}})
+        await client.notify("notifications/initialized")
+        tools = (await client.request("tools/list"))["tools"]
+        if args.tool not in {t["name"] for t in tools}:
+            raise SystemExit(f"tool {args.tool!r} not offered by {args.server}")
+
+        arguments = call_arguments(args)
+        for _ in range(args.warmup):
+            await client.request("tools/call", {"name": args.tool, "arguments": arguments})
+
+        rss_start = rss_kb(proc.pid)
+        rss_peak = rss_start or 0
+        latencies, errors = [], 0
+        remaining = args.calls
+
+        async def caller():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    await client.request("tools/call", {"name": args.tool, "arguments": arguments})
+                    latencies.append((time.perf_counter() - started) * 1000)
+                except Exception:
+                    errors += 1
+
+        async def sample_memory():
+            nonlocal rss_peak
+            while True:
+                rss_peak = max(rss_peak, rss_kb(proc.pid) or 0)
+                await asyncio.sleep(0.1)
+
+        sampler = asyncio.create_task(sample_memory())
+        started = time.perf_counter()
+        await asyncio.gather(*(caller() for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+        sampler.cancel()
+        rss_end = rss_kb(proc.pid)
+    finally:
+        await client.close()
+
+    return {
+        "server": args.server,
+        "tool": args.tool,
+        "calls": args.calls,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "calls_per_sec": round(len(latencies) / wall, 1) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies, default=0.0), 3),
+        },
+        "backpressure": {
+            "in_flight_peak": client.in_flight_peak,
+            "write_blocked_ms_total": round(client.write_blocked * 1000, 3),
+            "write_blocked_ms_max": round(client.write_blocked_max * 1000, 3),
+            "mb_out": round(client.bytes_out / 2 ** 20, 2),
+            "mb_in": round(client.bytes_in / 2 ** 20, 2),
+        },
+        "rss_kb": {"start": rss_start, "peak": rss_peak or None, "end": rss_end,
+                   "growth": (rss_end - rss_start) if rss_start and rss_end else None},
+    }
+
+
+def print_report(r: dict):
+    lat, bp, mem = r["latency_ms"], r["backpressure"], r["rss_kb"]
+    print(f"\n{r['server']} · {r['tool']} · {r['calls']} calls · concurrency {r['concurrency']}")
+    print(f"throughput   {r['calls_per_sec']} calls/s   errors {r['errors']}")
+    print(f"latency ms   p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}")
+    print(f"pipe         in-flight peak {bp['in_flight_peak']}  write blocked {bp['write_blocked_ms_total']}ms "
+          f"(max {bp['write_blocked_ms_max']}ms)  out {bp['mb_out']}MB  in {bp['mb_in']}MB")
+    print(f"server RSS   start {mem['start']}KiB  peak {mem['peak']}KiB  end {mem['end']}KiB  "
+          f"growth {mem['growth']}KiB")
+
+
+async def main_async(args) -> int:
+    env = dict(os.environ)
+    env.setdefault("LOG_LEVEL", "WARNING")
+    stubs = None
+    if args.with_stubs:
+        stub = f"http://127.0.0.1:{args.stub_port}"
+        stubs = subprocess.Popen([
+            sys.executable, "-m", "bench.stubs", "--port", str(args.stub_port),
+            "--upstream-latency-ms", str(args.upstream_latency_ms), "--upstream-jitter-ms", "0",
+        ], cwd=BASE_DIR)
+        await _wait_ready(f"{stub}/healthz", stubs)
+        env.update({"OPENWEATHER_BASE_URL": f"{stub}/owm", "OPENWEATHER_API_KEY": "bench"})
+    try:
+        result = await run(args, env)
+    finally:
+        if stubs:
+            stubs.terminate()
+            stubs.wait()
+
+    print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    return 1 if result["errors"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark an MCP stdio server's tools/call path.")
+    parser.add_argument("--server", default="bench/echo_mcp.py", help="path of the MCP server script")
+    parser.add_argument("--tool", default="echo")
+    parser.add_argument("--arguments", help="JSON tool arguments (default: echo payload from the flags below)")
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=8, help="callers sharing the pipe")
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--payload-bytes", type=int, default=256, help="echo: request argument size")
+    parser.add_argument("--response-bytes", type=int, default=256, help="echo: response text size")
+    parser.add_argument("--tool-latency-ms", type=float, default=0, help="echo: time spent in the tool")
+    parser.add_argument("--with-stubs", action="store_true", help="start bench/stubs.py as fake OpenWeather")
+    parser.add_argument("--upstream-latency-ms", type=float, default=20)
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--server-stderr", action="store_true", help="show the server's stderr")
+    parser.add_argument("--output", help="write the result JSON here")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
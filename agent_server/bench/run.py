@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# run.py
+"""
+Offline load test for /query.
+
+Starts the upstream stand-ins (bench/stubs.py) and the agent server wired to
+them, drives scripted scenarios at the requested concurrency and reports
+latency percentiles, throughput and per-stage breakdowns. With --baseline the
+run fails (exit 1) when it regresses beyond --tolerance.
+
+No baseline is committed: timings depend on the machine, so record one locally
+first (a missing --baseline file is written rather than compared against).
+
+Run from agent_server/:
+  python -m bench.run --concurrency 8 --requests 200
+  python -m bench.run --baseline /tmp/bench-baseline.json --update-baseline
+  python -m bench.run --baseline /tmp/bench-baseline.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# a token.json the Google client accepts as valid without refreshing
+FAKE_TOKEN = {
+    "token": "bench-access-token",
+    "refresh_token": "bench-refresh-token",
+    "client_id": "bench.apps.googleusercontent.com",
+    "client_secret": "bench-secret",
+    "token_uri": "https://oauth2.googleapis.com/token",
+    "expiry": "2999-01-01T00:00:00Z",
+}
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile; 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered) + 0.5) - 1))
+    return ordered[k]
+
+
+def _spawn(args: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen(args, cwd=BASE_DIR, env=env)
+
+
+async def _wait_ready(url: str, proc: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"process for {url} exited with {proc.returncode}")
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+def server_env(stub: str, token_path: str) -> dict:
+    """Environment pointing every upstream of the agent server at the stubs."""
+    env = dict(os.environ)
+    env.update({
+        "OPENROUTER_API_KEY": "bench",
+        "OPENROUTER_BASE_URL": f"{stub}/llm/v1/",
+        "OPENAI_API_KEY": "",
+        "OPENWEATHER_API_KEY": "bench",
+        "OPENWEATHER_BASE_URL": f"{stub}/owm",
+        "GOOGLE_API_ENDPOINT": f"{stub}/google",
+        "GOOGLE_TOKEN_PATH": token_path,
+        "GOOGLE_SHARED_TOKEN_FALLBACK": "1",  # the bench users have no stored credentials
+        "SUPABASE_URL": f"{stub}/supabase",
+        "SUPABASE_KEY": "bench-service-key",
+        "TODO_APP_URL": f"{stub}/todo",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    # the benchmark measures the server, not its admission limits, unless asked to
+    env.setdefault("ADMISSION_MAX_CONCURRENT", "1000")
+    env.setdefault("ADMISSION_MAX_PER_USER", "1000")
+    return env
+
+
+async def drive(url: str, scenarios: list[dict], concurrency: int, total: int, users: int) -> list[dict]:
+    """Send `total` scripted queries with `concurrency` workers; return one record per request."""
+    weights = [s.get("weight", 1) for s in scenarios]
+    rng = random.Random(42)
+    plan = rng.choices(scenarios, weights=weights, k=total)
+    results = []
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal next_index
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            scenario = plan[i]
+            body = {"message": scenario["message"], "user_id": f"bench-user-{i % users}",
+                    "include_timings": True}
+            started = time.perf_counter()
+            try:
+                r = await client.post(url, json=body)
+                ok = r.status_code == 200
+                data = r.json() if ok else {}
+                status = r.status_code
+            except httpx.HTTPError as e:
+                ok, data, status = False, {}, type(e).__name__
+            results.append({
+                "scenario": scenario["name"],
+                "ok": ok,
+                "status": status,
+                "seconds": time.perf_counter() - started,
+                "stages": {k: v["ms"] for k, v in data.get("timings", {}).get("by_kind", {}).items()},
+            })
+
+    async with httpx.AsyncClient(timeout=120, limits=httpx.Limits(max_connections=concurrency)) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return results
+
+
+def summarize(results: list[dict], wall: float) -> dict:
+    ok = [r for r in results if r["ok"]]
+    latencies = [r["seconds"] * 1000 for r in ok]
+    summary = {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "scenarios": {},
+        "stages": {},
+    }
+    by_scenario = defaultdict(list)
+    for r in ok:
+        by_scenario[r["scenario"]].append(r["seconds"] * 1000)
+    for name, values in sorted(by_scenario.items()):
+        summary["scenarios"][name] = {"count": len(values), "p50_ms": round(percentile(values, 50), 1),
+                                      "p95_ms": round(percentile(values, 95), 1)}
+    by_stage = defaultdict(list)
+    for r in ok:
+        for stage, ms in r["stages"].items():
+            by_stage[stage].append(ms)
+    for stage, values in sorted(by_stage.items()):
+        summary["stages"][stage] = {"mean_ms": round(sum(values) / len(values), 1),
+                                    "p95_ms": round(percentile(values, 95), 1)}
+    statuses = defaultdict(int)
+    for r in results:
+        if not r["ok"]:
+            statuses[str(r["status"])] += 1
+    if statuses:
+        summary["error_statuses"] = dict(statuses)
+    return summary
+
+
+def print_report(summary: dict):
+    print(f"\nrequests {summary['requests']}  errors {summary['errors']}  rps {summary['rps']}")
+    print(f"latency  p50 {summary['p50_ms']}ms  p95 {summary['p95_ms']}ms  p99 {summary['p99_ms']}ms")
+    print("\nscenario             count   p50 ms   p95 ms")
+    for name, s in summary["scenarios"].items():
+        print(f"{name:<20} {s['count']:>5} {s['p50_ms']:>8} {s['p95_ms']:>8}")
+    print("\nstage (per request)   mean ms   p95 ms")
+    for name, s in summary["stages"].items():
+        print(f"{name:<20} {s['mean_ms']:>8} {s['p95_ms']:>8}")
+    if "error_statuses" in summary:
+        print(f"\nerror statuses: {summary['error_statuses']}")
+
+
+def compare(summary: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Regressions of `summary` against `baseline` beyond `tolerance` (a fraction)."""
+    problems = []
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        if baseline.get(key) and summary[key] > baseline[key] * (1 + tolerance):
+            problems.append(f"{key} {summary[key]} > baseline {baseline[key]} (+{tolerance:.0%})")
+    if baseline.get("rps") and summary["rps"] < baseline["rps"] * (1 - tolerance):
+        problems.append(f"rps {summary['rps']} < baseline {baseline['rps']} (-{tolerance:.0%})")
+    if summary["errors"] > baseline.get("errors", 0):
+        problems.append(f"errors {summary['errors']} > baseline {baseline.get('errors', 0)}")
+    return problems
+
+
+async def main_async(args) -> int:
+    with open(args.scenarios, encoding="utf-8") as f:
+        scenarios = json.load(f)["scenarios"]
+    if args.only:
+        scenarios = [s for s in scenarios if s["name"] in args.only.split(",")]
+
+    stub = f"http://127.0.0.1:{args.stub_port}"
+    server = f"http://127.0.0.1:{args.server_port}"
+    tmp = tempfile.mkdtemp(prefix="agent-bench-")
+    token_path = os.path.join(tmp, "token.json")
+    with open(token_path, "w") as f:
+        json.dump(FAKE_TOKEN, f)
+
+    procs = []
+    try:
+        procs.append(_spawn([
+            sys.executable, "-m", "bench.stubs", "--port", str(args.stub_port),
+            "--scenarios", args.scenarios,
+            "--llm-latency-ms", str(args.llm_latency_ms),
+            "--llm-jitter-ms", str(args.llm_jitter_ms),
+            "--llm-slow-rate", str(args.llm_slow_rate),
+            "--llm-slow-ms", str(args.llm_slow_ms),
+            "--upstream-latency-ms", str(args.upstream_latency_ms),
+        ], dict(os.environ)))
+        await _wait_ready(f"{stub}/healthz", procs[-1])
+
+        procs.append(_spawn([
+            sys.executable, "-m", "uvicorn", "server:app", "--port", str(args.server_port),
+            "--workers", str(args.workers), "--log-level", "warning",
+        ], server_env(stub, token_path)))
+        await _wait_ready(f"{server}/ready", procs[-1], timeout=60)
+
+        if args.warmup:
+            await drive(f"{server}/query", scenarios, min(args.concurrency, args.warmup), args.warmup, args.users)
+
+        started = time.perf_counter()
+        results = await drive(f"{server}/query", scenarios, args.concurrency, args.requests, args.users)
+        summary = summarize(results, time.perf_counter() - started)
+    finally:
+        for p in reversed(procs):
+            p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+
+    summary["config"] = {k: getattr(args, k) for k in (
+        "concurrency", "requests", "users", "workers", "llm_latency_ms", "llm_slow_rate", "upstream_latency_ms")}
+    print_report(summary)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    if args.baseline:
+        if args.update_baseline or not os.path.exists(args.baseline):
+            os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+            with open(args.baseline, "w") as f:
+                json.dump(summary, f, indent=2)
+            print(f"\nbaseline written to {args.baseline}")
+            return 0
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(summary, baseline, args.tolerance)
+        if problems:
+            print("\nREGRESSION:\n  " + "\n  ".join(problems))
+            return 1
+        print(f"\nwithin {args.tolerance:.0%} of baseline {args.baseline}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the agent server.")
+    parser.add_argument("--scenarios", default="bench/scenarios.json")
+    parser.add_argument("--only", help="comma-separated scenario names to run")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10, help="requests sent before measuring")
+    parser.add_argument("--users", type=int, default=20, help="distinct user_ids to spread load over")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--llm-slow-rate", type=float, default=0, help="fraction of LLM calls that are slow")
+    parser.add_argument("--llm-slow-ms", type=float, default=5000)
+    parser.add_argument("--upstream-latency-ms", type=float, default=40)
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--server-port", type=int, default=8901)
+    parser.add_argument("--output", help="write the summary JSON here")
+    parser.add_argument("--baseline", help="baseline JSON to compare against (created if missing)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed regression, as a fraction")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
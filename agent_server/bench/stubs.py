@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+# stubs.py
+"""
+Local stand-ins for every upstream the agent server talks to, on one port:
+
+  /llm/v1/chat/completions   OpenAI-compatible chat completions (plain or streamed) with scripted tool calls
+  /owm/...                   OpenWeather geocoding, current weather and One Call
+  /google/...                Calendar, Gmail and Drive REST endpoints, plus Calendar batch requests
+  /supabase/rest/v1/...      the todo_api_keys lookup and in-memory chat_sessions/messages tables
+  /supabase/auth/v1/user     access tokens of the form user-token:<user id>
+  /todo/api/new_tasks        the to-do app
+
+Run: python -m bench.stubs --port 8900 --scenarios bench/scenarios.json
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from datetime import datetime, timezone
+
+from fastapi import FastAPI, Header, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+app = FastAPI()
+
+CONFIG = {
+    "llm_latency_ms": 300.0,
+    "llm_jitter_ms": 100.0,
+    "upstream_latency_ms": 40.0,
+    "upstream_jitter_ms": 20.0,
+    "llm_slow_rate": 0.0,  # fraction of completions that take llm_slow_ms instead (tail latency)
+    "llm_slow_ms": 5000.0,
+    "scenarios": {},  # first user message -> scenario
+}
+
+
+async def _delay(kind: str):
+    base = CONFIG[f"{kind}_latency_ms"]
+    jitter = CONFIG[f"{kind}_jitter_ms"]
+    await asyncio.sleep(max(0.0, base + random.uniform(-jitter, jitter)) / 1000)
+
+
+def load_scenarios(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)["scenarios"]
+
+
+# ----------------------------------------------------------------------
+# LLM: chat completions with scripted tool calls
+# ----------------------------------------------------------------------
+def _text(content) -> str:
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content or ""
+
+
+def _next_step(body: dict):
+    """Pick the scenario step to emit for this turn, or None for the final answer."""
+    messages = body.get("messages", [])
+    first_user = next((_text(m.get("content")) for m in messages if m.get("role") == "user"), "")
+    scenario = CONFIG["scenarios"].get(first_user.strip())
+    if scenario is None:
+        return None, None
+
+    available = {t["function"]["name"] for t in body.get("tools") or [] if t.get("type") == "function"}
+    called = [
+        call["function"]["name"]
+        for m in messages if m.get("role") == "assistant"
+        for call in m.get("tool_calls") or []
+    ]
+    for step in scenario.get("steps", []):
+        if step["tool"] in available and step["tool"] not in called:
+            return scenario, step
+    return scenario, None
+
+
+@app.post("/llm/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if random.random() < CONFIG["llm_slow_rate"]:
+        await asyncio.sleep(CONFIG["llm_slow_ms"] / 1000)
+    else:
+        await _delay("llm")
+    scenario, step = _next_step(body)
+
+    if step is not None:
+        message = {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": step["tool"], "arguments": json.dumps(step.get("arguments", {}))},
+            }],
+        }
+        finish = "tool_calls"
+    else:
+        answer = scenario.get("answer", "Done.") if scenario else "I can help with that."
+        message = {"role": "assistant", "content": answer}
+        finish = "stop"
+
+    prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+    usage = {"prompt_tokens": prompt_tokens, "completion_tokens": 20, "total_tokens": prompt_tokens + 20}
+    completion = {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+    }
+    if body.get("stream"):
+        return StreamingResponse(_stream(completion, message, finish, usage), media_type="text/event-stream")
+    return {
+        **completion,
+        "object": "chat.completion",
+        "choices": [{"index": 0, "message": message, "finish_reason": finish}],
+        "usage": usage,
+    }
+
+
+async def _stream(completion: dict, message: dict, finish: str, usage: dict):
+    """The same completion as chat.completion.chunk events: tool calls whole, text word by word."""
+    def chunk(delta: dict, finish_reason=None, **extra) -> str:
+        choice = {"index": 0, "delta": delta, "finish_reason": finish_reason}
+        return "data: " + json.dumps({**completion, "object": "chat.completion.chunk",
+                                      "choices": [choice], **extra}) + "\n\n"
+
+    if message.get("tool_calls"):
+        calls = [{"index": i, **call} for i, call in enumerate(message["tool_calls"])]
+        yield chunk({"role": "assistant", "tool_calls": calls})
+    else:
+        for i, word in enumerate(message["content"].split(" ")):
+            yield chunk({"role": "assistant", "content": word if i == 0 else " " + word})
+            await asyncio.sleep(0.005)
+    yield chunk({}, finish)
+    yield "data: " + json.dumps({**completion, "object": "chat.completion.chunk", "choices": [], "usage": usage}) + "\n\n"
+    yield "data: [DONE]\n\n"
+
+
+# ----------------------------------------------------------------------
+# OpenWeather
+# ----------------------------------------------------------------------
+def _coords(city: str) -> tuple[float, float]:
+    h = hashlib.sha256(city.strip().lower().encode()).digest()
+    return round(h[0] / 255 * 120 - 60, 4), round(h[1] / 255 * 340 - 170, 4)
+
+
+def _conditions(seed: int) -> dict:
+    rng = random.Random(seed)
+    return {
+        "temp": round(rng.uniform(5, 30), 1),
+        "feels_like": round(rng.uniform(5, 30), 1),
+        "humidity": rng.randint(30, 90),
+        "wind_speed": round(rng.uniform(0, 12), 1),
+        "pop": round(rng.random(), 2),
+        "weather": [{"description": rng.choice(["clear sky", "few clouds", "light rain", "overcast clouds"])}],
+    }
+
+
+@app.get("/owm/geo/1.0/direct")
+async def geocode(q: str):
+    await _delay("upstream")
+    lat, lon = _coords(q)
+    return [{"name": q, "lat": lat, "lon": lon}]
+
+
+@app.get("/owm/data/2.5/weather")
+async def current_weather(lat: float, lon: float):
+    await _delay("upstream")
+    c = _conditions(int(lat * 1000 + lon))
+    return {"weather": c["weather"], "main": {"temp": c["temp"], "feels_like": c["feels_like"],
+                                              "humidity": c["humidity"]}}
+
+
+@app.get("/owm/data/3.0/onecall")
+async def onecall(lat: float, lon: float, exclude: str = ""):
+    await _delay("upstream")
+    now = int(time.time()) // 3600 * 3600
+    excluded = set(exclude.split(","))
+    data = {"lat": lat, "lon": lon, "timezone_offset": 0}
+    if "hourly" not in excluded:
+        data["hourly"] = [{"dt": now + i * 3600, **_conditions(i)} for i in range(48)]
+        for h in data["hourly"]:
+            if "rain" in h["weather"][0]["description"]:
+                h["rain"] = {"1h": round(h["pop"] * 2, 1)}
+    if "daily" not in excluded:
+        data["daily"] = []
+        for i in range(8):
+            c = _conditions(100 + i)
+            c["temp"] = {"day": c["temp"], "night": round(c["temp"] - 6, 1),
+                         "min": round(c["temp"] - 8, 1), "max": round(c["temp"] + 3, 1)}
+            data["daily"].append({"dt": now + i * 86400, **c})
+    return data
+
+
+# ----------------------------------------------------------------------
+# Google: Calendar, Gmail, Drive
+# ----------------------------------------------------------------------
+BENCH_EMAIL = "bench@example.com"
+
+
+def _event(i: int) -> dict:
+    start = time.strftime("%Y-%m-%dT%H:00:00Z", time.gmtime(time.time() + (i + 1) * 7200))
+    end = time.strftime("%Y-%m-%dT%H:30:00Z", time.gmtime(time.time() + (i + 1) * 7200))
+    return {
+        "id": f"evt{i}",
+        "summary": f"Meeting {i}",
+        "description": "Discuss the quarterly roadmap. " * 5,
+        "start": {"dateTime": start},
+        "end": {"dateTime": end},
+        "organizer": {"email": "boss@example.com"},
+        "attendees": [{"email": BENCH_EMAIL, "self": True,
+                       "responseStatus": "needsAction" if i % 3 == 0 else "accepted"}],
+        "htmlLink": f"https://calendar.example.com/evt{i}",
+    }
+
+
+@app.get("/google/calendar/v3/calendars/{calendar_id}/events")
+async def calendar_events(calendar_id: str, maxResults: int = 50):
+    await _delay("upstream")
+    return {"items": [_event(i) for i in range(min(maxResults, 12))]}
+
+
+@app.get("/google/calendar/v3/calendars/{calendar_id}/events/{event_id}")
+async def calendar_event(calendar_id: str, event_id: str):
+    await _delay("upstream")
+    return _event(int(event_id.removeprefix("evt") or 0))
+
+
+def _updated(event_id: str, body: dict) -> dict:
+    event = _event(int(event_id.removeprefix("evt") or 0))
+    if body.pop("attendeesOmitted", False):
+        # a response-only patch: update the matching attendee, keep the others
+        changes = {a["email"]: a for a in body.pop("attendees", [])}
+        event["attendees"] = [{**a, **changes.get(a["email"], {})} for a in event["attendees"]]
+    event.update(body)
+    return event
+
+
+def _inserted(body: dict) -> dict:
+    return {**body, "id": body.get("id") or uuid.uuid4().hex, "htmlLink": "https://calendar.example.com/new"}
+
+
+@app.api_route("/google/calendar/v3/calendars/{calendar_id}/events/{event_id}", methods=["PUT", "PATCH"])
+async def calendar_update(calendar_id: str, event_id: str, request: Request):
+    await _delay("upstream")
+    return _updated(event_id, await request.json())
+
+
+@app.post("/google/calendar/v3/calendars/{calendar_id}/events")
+async def calendar_insert(calendar_id: str, request: Request):
+    await _delay("upstream")
+    return _inserted(await request.json())
+
+
+def _batch_call(method: str, path: str, body: dict) -> tuple[int, dict]:
+    """(status, JSON body) of one call inside a Calendar batch request."""
+    path = path.split("?")[0]
+    if method == "POST" and re.fullmatch(r"/google/calendar/v3/calendars/[^/]+/events", path):
+        return 200, _inserted(body)
+    match = re.fullmatch(r"/google/calendar/v3/calendars/[^/]+/events/(evt\d+)", path)
+    if method in ("PATCH", "PUT") and match:
+        return 200, _updated(match.group(1), body)
+    return 404, {"error": {"code": 404, "message": "Not Found"}}
+
+
+@app.post("/google/batch/calendar/v3")
+async def calendar_batch(request: Request):
+    """multipart/mixed batch: every part is an HTTP request, answered by a part with the matching Content-ID."""
+    await _delay("upstream")
+    boundary = request.headers["content-type"].split("boundary=")[1].strip('"')
+    parts = [p for p in (await request.body()).decode().split(f"--{boundary}") if p.strip() not in ("", "--")]
+    out = []
+    for part in parts:
+        head, _, http = part.strip().partition("\r\n\r\n") if "\r\n\r\n" in part else part.strip().partition("\n\n")
+        content_id = re.search(r"Content-ID:\s*<(.+?)>", head, re.I).group(1)
+        request_line, _, rest = http.partition("\n")
+        _, _, payload = rest.partition("\r\n\r\n") if "\r\n\r\n" in rest else rest.partition("\n\n")
+        method, path = request_line.split()[:2]
+        status, result = _batch_call(method, path, json.loads(payload) if payload.strip() else {})
+        out.append(
+            f"--batch_stub\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Not Found'}\r\nContent-Type: application/json\r\n\r\n"
+            f"{json.dumps(result)}\r\n"
+        )
+    return Response("".join(out) + "--batch_stub--\r\n", media_type="multipart/mixed; boundary=batch_stub")
+
+
+@app.get("/google/calendar/v3/users/me/calendarList/{calendar_id}")
+async def calendar_list_entry(calendar_id: str):
+    await _delay("upstream")
+    return {"id": BENCH_EMAIL, "timeZone": "Europe/Lisbon"}
+
+
+@app.post("/google/calendar/v3/freeBusy")
+async def calendar_freebusy(request: Request):
+    await _delay("upstream")
+    body = await request.json()
+    calendars = {}
+    for n, item in enumerate(body.get("items", [])):
+        busy = [{"start": e["start"]["dateTime"], "end": e["end"]["dateTime"]} for e in map(_event, range(n, 12, 2))]
+        calendars[item["id"]] = {"busy": busy}
+    return {"kind": "calendar#freeBusy", "timeMin": body.get("timeMin"), "timeMax": body.get("timeMax"),
+            "calendars": calendars}
+
+
+@app.get("/google/gmail/v1/users/{user_id}/messages")
+async def gmail_list(user_id: str, maxResults: int = 10):
+    await _delay("upstream")
+    return {"messages": [{"id": f"msg{i}", "threadId": f"t{i}"} for i in range(min(maxResults, 20))]}
+
+
+@app.get("/google/gmail/v1/users/{user_id}/messages/{message_id}")
+async def gmail_get(user_id: str, message_id: str):
+    await _delay("upstream")
+    headers = [
+        {"name": "From", "value": f"sender-{message_id}@example.com"},
+        {"name": "Subject", "value": f"Subject of {message_id}"},
+        {"name": "Date", "value": time.strftime("%a, %d %b %Y %H:%M:%S +0000", time.gmtime())},
+    ]
+    return {"id": message_id, "snippet": "Hello, just following up on our last conversation...",
+            "payload": {"headers": headers}}
+
+
+@app.post("/google/gmail/v1/users/{user_id}/messages/send")
+async def gmail_send(user_id: str):
+    await _delay("upstream")
+    return {"id": uuid.uuid4().hex}
+
+
+@app.get("/google/drive/v3/files")
+async def drive_files(pageSize: int = 10):
+    await _delay("upstream")
+    return {"files": [{"id": f"file{i}", "name": f"Document {i}"} for i in range(min(pageSize, 10))]}
+
+
+# ----------------------------------------------------------------------
+# Supabase (todo API keys) and the to-do app
+# ----------------------------------------------------------------------
+@app.get("/supabase/rest/v1/todo_api_keys")
+async def todo_api_keys():
+    await _delay("upstream")
+    return [{"token": "bench-todo-token"}]
+
+
+# Supabase Auth: "user-token:<id>" is <id>'s access token
+@app.get("/supabase/auth/v1/user")
+async def auth_user(authorization: str = Header("")):
+    await _delay("upstream")
+    token = authorization.removeprefix("Bearer ")
+    if not token.startswith("user-token:"):
+        return JSONResponse({"code": 401, "error_code": "bad_jwt", "msg": "invalid JWT"}, status_code=401)
+    return {"id": token.removeprefix("user-token:"), "aud": "authenticated", "role": "authenticated",
+            "app_metadata": {}, "user_metadata": {}, "created_at": "2025-01-01T00:00:00Z"}
+
+
+# chat history tables, with just enough PostgREST (eq/lt/gt filters, or/and, order, limit) for core/history.py
+TABLES: dict[str, list[dict]] = {"chat_sessions": [], "messages": []}
+_OPS = {"eq": lambda a, b: a == b, "lt": lambda a, b: a < b, "gt": lambda a, b: a > b,
+        "lte": lambda a, b: a <= b, "gte": lambda a, b: a >= b}
+
+
+def _split(expr: str) -> list[str]:
+    """Split `expr` on the commas outside parentheses and quotes."""
+    parts, depth, quoted, start = [], 0, False, 0
+    for i, ch in enumerate(expr):
+        if ch == '"':
+            quoted = not quoted
+        elif not quoted and ch in "()":
+            depth += 1 if ch == "(" else -1
+        elif not quoted and ch == "," and depth == 0:
+            parts.append(expr[start:i])
+            start = i + 1
+    return parts + [expr[start:]]
+
+
+def _condition(expr: str):
+    """A row predicate for `col.op.value`, `and(...)` or `or(...)`."""
+    for logic, combine in (("and(", all), ("or(", any)):
+        if expr.startswith(logic):
+            preds = [_condition(p) for p in _split(expr[len(logic):-1])]
+            return lambda row: combine(p(row) for p in preds)
+    column, op, value = expr.split(".", 2)
+    value = value.strip('"')
+    return lambda row: _OPS[op](str(row.get(column)), value)
+
+
+def _filters(params) -> list:
+    preds = []
+    for key, value in params.multi_items():
+        if key == "or":
+            preds.append(_condition(f"or{value}"))
+        elif key not in ("select", "order", "limit", "columns"):
+            preds.append(_condition(f"{key}.{value}"))
+    return preds
+
+
+@app.get("/supabase/rest/v1/{table}")
+async def table_select(table: str, request: Request):
+    await _delay("upstream")
+    preds = _filters(request.query_params)
+    rows = [r for r in TABLES.get(table, []) if all(p(r) for p in preds)]
+    for spec in reversed((request.query_params.get("order") or "").split(",")):
+        if spec:
+            column, _, direction = spec.partition(".")
+            rows.sort(key=lambda r: str(r.get(column)), reverse=direction.startswith("desc"))
+    if "limit" in request.query_params:
+        rows = rows[:int(request.query_params["limit"])]
+    columns = (request.query_params.get("select") or "*").split(",")
+    return [r if columns == ["*"] else {c: r.get(c) for c in columns} for r in rows]
+
+
+@app.post("/supabase/rest/v1/{table}", status_code=201)
+async def table_insert(table: str, request: Request):
+    await _delay("upstream")
+    body = await request.json()
+    rows = [{"id": str(uuid.uuid4()), "created_at": datetime.now(timezone.utc).isoformat(timespec="microseconds"), **r}
+            for r in (body if isinstance(body, list) else [body])]
+    TABLES.setdefault(table, []).extend(rows)
+    return rows
+
+
+@app.patch("/supabase/rest/v1/{table}")
+async def table_update(table: str, request: Request):
+    await _delay("upstream")
+    preds = _filters(request.query_params)
+    changes = await request.json()
+    rows = [r for r in TABLES.get(table, []) if all(p(r) for p in preds)]
+    for row in rows:
+        row.update(changes)
+    return rows
+
+
+@app.post("/todo/api/new_tasks")
+async def todo_new_task(request: Request):
+    await _delay("upstream")
+    return {"ok": True, "task": await request.json()}
+
+
+@app.get("/healthz")
+async def healthz():
+    return {"ok": True}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline upstream stand-ins for benchmarking.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--scenarios", default="bench/scenarios.json")
+    parser.add_argument("--llm-latency-ms", type=float, default=CONFIG["llm_latency_ms"])
+    parser.add_argument("--llm-jitter-ms", type=float, default=CONFIG["llm_jitter_ms"])
+    parser.add_argument("--llm-slow-rate", type=float, default=CONFIG["llm_slow_rate"])
+    parser.add_argument("--llm-slow-ms", type=float, default=CONFIG["llm_slow_ms"])
+    parser.add_argument("--upstream-latency-ms", type=float, default=CONFIG["upstream_latency_ms"])
+    parser.add_argument("--upstream-jitter-ms", type=float, default=CONFIG["upstream_jitter_ms"])
+    args = parser.parse_args()
+
+    CONFIG.update(
+        llm_latency_ms=args.llm_latency_ms,
+        llm_jitter_ms=args.llm_jitter_ms,
+        llm_slow_rate=args.llm_slow_rate,
+        llm_slow_ms=args.llm_slow_ms,
+        upstream_latency_ms=args.upstream_latency_ms,
+        upstream_jitter_ms=args.upstream_jitter_ms,
+        scenarios={s["message"].strip(): s for s in load_scenarios(args.scenarios)},
+    )
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# admission.py
+import asyncio
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Optional
+
+ANONYMOUS = "anonymous"
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries a Retry-After hint in seconds."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounds concurrent agent runs globally and per user.
+
+    Requests over the limits wait in a bounded FIFO queue for up to `queue_timeout`
+    seconds. When the queue (or the user's share of it) is full, requests are
+    rejected immediately so callers can back off instead of piling up.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 16,
+        max_per_user: int = 2,
+        max_queue: int = 64,
+        max_queued_per_user: int = 2,
+        queue_timeout: float = 10.0,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.queue_timeout = queue_timeout
+
+        self._active = 0
+        self._active_by_user = defaultdict(int)
+        self._queued_by_user = defaultdict(int)
+        self._waiters = deque()  # (user, future)
+
+        # running statistics
+        self._admitted = 0
+        self._rejected = defaultdict(int)
+        self._wait_ewma = 0.0
+        self._wait_max = 0.0
+        self._run_ewma = 1.0
+
+    # ------------------------------------------------------------------
+    # internal bookkeeping
+    # ------------------------------------------------------------------
+    def _can_run(self, user: str) -> bool:
+        return self._active < self.max_concurrent and self._active_by_user[user] < self.max_per_user
+
+    def _grant(self, user: str):
+        self._active += 1
+        self._active_by_user[user] += 1
+
+    def _release(self, user: str):
+        self._active -= 1
+        self._active_by_user[user] -= 1
+        if not self._active_by_user[user]:
+            del self._active_by_user[user]
+        self._wake()
+
+    def _wake(self):
+        # Hand free slots to the oldest waiters whose user is under its own limit,
+        # so one busy user can't block everybody queued behind them.
+        for entry in list(self._waiters):
+            if self._active >= self.max_concurrent:
+                break
+            user, fut = entry
+            if fut.done() or not self._can_run(user):
+                continue
+            self._waiters.remove(entry)
+            self._dequeue(user)
+            self._grant(user)
+            fut.set_result(None)
+
+    def _dequeue(self, user: str):
+        self._queued_by_user[user] -= 1
+        if not self._queued_by_user[user]:
+            del self._queued_by_user[user]
+
+    def _retry_after(self) -> int:
+        # rough estimate: time to drain the current queue at the observed service rate
+        backlog = len(self._waiters) + 1
+        return max(1, round(self._run_ewma * backlog / self.max_concurrent))
+
+    def _reject(self, reason: str, kind: str):
+        self._rejected[kind] += 1
+        raise AdmissionRejected(reason, self._retry_after())
+
+    # ------------------------------------------------------------------
+    # public API
+    # ------------------------------------------------------------------
+    async def acquire(self, user_id: Optional[str]) -> float:
+        """Wait for a slot for `user_id`. Returns the time spent queued, in seconds."""
+        user = user_id or ANONYMOUS
+        if not self._waiters and self._can_run(user):
+            self._grant(user)
+            self._admitted += 1
+            return 0.0
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject("Server is busy, please retry later.", "queue_full")
+        if self._queued_by_user[user] >= self.max_queued_per_user:
+            self._reject("Too many concurrent requests for this user.", "user_limit")
+
+        fut = asyncio.get_running_loop().create_future()
+        entry = (user, fut)
+        self._waiters.append(entry)
+        self._queued_by_user[user] += 1
+        self._wake()  # slots may be free but held back for users at their limit
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(fut, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # granted just as we gave up: hand the slot back
+                self._release(user)
+            else:
+                self._waiters.remove(entry)
+                self._dequeue(user)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject("Timed out waiting for capacity, please retry later.", "queue_timeout")
+            raise
+
+        waited = time.monotonic() - started
+        self._admitted += 1
+        self._wait_ewma = 0.9 * self._wait_ewma + 0.1 * waited
+        self._wait_max = max(self._wait_max, waited)
+        return waited
+
+    def release(self, user_id: Optional[str], run_seconds: Optional[float] = None):
+        """Free the slot taken by `acquire`."""
+        if run_seconds is not None:
+            self._run_ewma = 0.9 * self._run_ewma + 0.1 * run_seconds
+        self._release(user_id or ANONYMOUS)
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str]):
+        """`async with admission.slot(user_id):` — acquire, run, release."""
+        waited = await self.acquire(user_id)
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(user_id, time.monotonic() - started)
+
+    def stats(self) -> dict:
+        """Queue depth, occupancy and wait time, for capacity sizing."""
+        return {
+            "active": self._active,
+            "queued": len(self._waiters),
+            "active_users": len(self._active_by_user),
+            "admitted_total": self._admitted,
+            "rejected_total": dict(self._rejected),
+            "wait_seconds_avg": round(self._wait_ewma, 3),
+            "wait_seconds_max": round(self._wait_max, 3),
+            "run_seconds_avg": round(self._run_ewma, 3),
+            "limits": {
+                "max_concurrent": self.max_concurrent,
+                "max_per_user": self.max_per_user,
+                "max_queue": self.max_queue,
+                "max_queued_per_user": self.max_queued_per_user,
+                "queue_timeout": self.queue_timeout,
+            },
+        }
+
+
+def from_env() -> AdmissionController:
+    """Build a controller from the ADMISSION_* environment variables."""
+    return AdmissionController(
+        max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "16")),
+        max_per_user=int(os.getenv("ADMISSION_MAX_PER_USER", "2")),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+        max_queued_per_user=int(os.getenv("ADMISSION_MAX_QUEUED_PER_USER", "2")),
+        queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10")),
+    )
@@ -0,0 +1,358 @@
+# agent_graph.py
+"""
+The agent graph as data: agents, their tools, handoffs and MCP servers are
+read from a JSON file (see agent_graph.json), validated, then compiled into
+Agent objects.
+
+A reload compiles a new graph next to the running one and swaps it in with a
+single assignment. Runs already in progress finish on the graph they started
+with, and MCP servers whose definitions didn't change are carried over rather
+than restarted; the others are stopped once no run uses them.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Optional
+
+from agents import Agent
+
+from core import metrics
+from core.logger import get_logger
+from core.mcp_stdio import InstrumentedMCPServerStdio
+
+log = get_logger("agent_graph")
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+GRAPH_PATH = os.getenv("AGENT_GRAPH_PATH", os.path.join(BASE_DIR, "agent_graph.json"))
+
+GRAPH_RELOADS = metrics.Counter("agent_graph_reloads_total", "Agent graph loads, by outcome")
+
+TOP_KEYS = {"entry", "agents", "mcp_servers"}
+AGENT_KEYS = {"instructions", "handoff_description", "tools", "handoffs", "mcp_servers"}
+MCP_KEYS = {"command", "args", "cwd", "env", "cache_tools_list"}
+
+
+class GraphError(ValueError):
+    """An invalid graph config; `errors` lists every problem found."""
+
+    def __init__(self, errors: list[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def _strings(value) -> bool:
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def validate(config: Any, tool_names) -> list[str]:
+    """Every problem with `config`, given the tools that can be referenced (empty if it is valid)."""
+    if not isinstance(config, dict):
+        return ["the config must be a JSON object"]
+    errors = [f"unknown key {key!r}" for key in set(config) - TOP_KEYS]
+
+    servers = config.get("mcp_servers", {})
+    if not isinstance(servers, dict):
+        errors.append("mcp_servers must be an object")
+        servers = {}
+    for name, spec in servers.items():
+        where = f"mcp_servers.{name}"
+        if not isinstance(spec, dict):
+            errors.append(f"{where} must be an object")
+            continue
+        errors += [f"{where}: unknown key {key!r}" for key in set(spec) - MCP_KEYS]
+        if not _strings(spec.get("args", [])):
+            errors.append(f"{where}.args must be a list of strings")
+        for key in ("command", "cwd"):
+            if not isinstance(spec.get(key, ""), str):
+                errors.append(f"{where}.{key} must be a string")
+        env = spec.get("env", {})
+        if not isinstance(env, dict) or not all(isinstance(v, str) for v in env.values()):
+            errors.append(f"{where}.env must map names to strings")
+
+    agents = config.get("agents")
+    if not isinstance(agents, dict) or not agents:
+        return errors + ["agents must be a non-empty object"]
+    if config.get("entry") not in agents:
+        errors.append(f"entry {config.get('entry')!r} is not one of the agents")
+    for name, spec in agents.items():
+        where = f"agents.{name}"
+        if not isinstance(spec, dict):
+            errors.append(f"{where} must be an object")
+            continue
+        errors += [f"{where}: unknown key {key!r}" for key in set(spec) - AGENT_KEYS]
+        instructions = spec.get("instructions")
+        if not (isinstance(instructions, str) or _strings(instructions)):
+            errors.append(f"{where}.instructions must be a string or a list of strings")
+        for key, known, kind in (("tools", tool_names, "tool"), ("handoffs", agents, "agent"),
+                                 ("mcp_servers", servers, "MCP server")):
+            refs = spec.get(key, [])
+            if not _strings(refs):
+                errors.append(f"{where}.{key} must be a list of names")
+                continue
+            errors += [f"{where}.{key}: unknown {kind} {ref!r}" for ref in refs if ref not in known]
+        if name in spec.get("handoffs", []):
+            errors.append(f"{where}.handoffs: an agent can't hand off to itself")
+    return errors
+
+
+def _fingerprint(spec: dict) -> str:
+    return json.dumps(spec, sort_keys=True)
+
+
+class MCPProcess:
+    """
+    One MCP server subprocess. It is entered and exited in a task of its own,
+    so a graph loaded in one request can be stopped from another.
+    """
+
+    def __init__(self, name: str, spec: dict):
+        self.name = name
+        self.fingerprint = _fingerprint(spec)
+        self.server = InstrumentedMCPServerStdio(
+            name=name,
+            params={
+                "command": spec.get("command") or sys.executable,
+                "args": spec.get("args", []),
+                "cwd": os.path.join(BASE_DIR, spec.get("cwd", ".")),
+                "env": {**os.environ, **spec.get("env", {})},  # the stdio client only forwards a minimal env otherwise
+            },
+            cache_tools_list=spec.get("cache_tools_list", True),
+        )
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        ready = asyncio.get_running_loop().create_future()
+
+        async def own():
+            try:
+                async with self.server:
+                    ready.set_result(None)
+                    await self._stop.wait()
+            except Exception as e:
+                if not ready.done():
+                    ready.set_exception(e)
+                else:
+                    log.warning("MCP server %s failed: %s", self.name, e)
+
+        self._task = asyncio.create_task(own())
+        await ready
+
+    async def stop(self):
+        if self._task and not self._stop.is_set():
+            self._stop.set()
+            await self._task
+
+
+class AgentGraph:
+    """One compiled version of the graph; `active` counts the runs using it."""
+
+    def __init__(self, version: int, config: dict, agents: dict[str, Agent], mcp: dict[str, MCPProcess]):
+        self.version = version
+        self.config = config
+        self.agents = agents
+        self.entry = agents[config["entry"]]
+        self.mcp = mcp
+        self.loaded_at = time.time()
+        self.active = 0
+
+    def mcp_server(self, name: str):
+        process = self.mcp.get(name)
+        return process.server if process else None
+
+    def mcp_servers(self) -> list:
+        return [p.server for p in self.mcp.values()]
+
+    def describe(self) -> dict:
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "entry": self.entry.name,
+            "agents": {
+                name: {key: spec.get(key, []) for key in ("tools", "handoffs", "mcp_servers")}
+                for name, spec in self.config["agents"].items()
+            },
+            "mcp_servers": list(self.mcp),
+            "active_runs": self.active,
+        }
+
+
+class GraphManager:
+    """
+    Loads the graph from `path` and swaps in reloads.
+
+    `tools` maps the names a config may reference to tool objects, and
+    `make_model(agent_name)` builds an agent's model (once per name, so
+    models keep their state across reloads). `extra_tools` are added to every
+    agent with tools or MCP servers.
+    """
+
+    def __init__(self, tools: dict[str, Any], make_model: Callable[[str], Any],
+                 extra_tools: Optional[list] = None, path: str = GRAPH_PATH):
+        self.tools = tools
+        self.make_model = make_model
+        self.extra_tools = extra_tools or []
+        self.path = path
+        self.current: Optional[AgentGraph] = None
+        self._draining: list[AgentGraph] = []
+        self._models: dict[str, Any] = {}
+        self._lock = asyncio.Lock()
+        self._mtime: Optional[float] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._watcher: Optional[asyncio.Task] = None
+
+    def read(self) -> dict:
+        """The config at `path`, validated; raises GraphError."""
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            raise GraphError([f"can't read {self.path}: {e}"])
+        errors = validate(config, self.tools)
+        if errors:
+            raise GraphError(errors)
+        reachable, pending = set(), [config["entry"]]
+        while pending:
+            name = pending.pop()
+            if name not in reachable:
+                reachable.add(name)
+                pending += config["agents"][name].get("handoffs", [])
+        for name in set(config["agents"]) - reachable:
+            log.warning("Agent %s can't be reached from %s", name, config["entry"])
+        return config
+
+    def _model(self, name: str):
+        if name not in self._models:
+            self._models[name] = self.make_model(name)
+        return self._models[name]
+
+    def _compile(self, config: dict, mcp: dict[str, MCPProcess]) -> dict[str, Agent]:
+        agents = {}
+        for name, spec in config["agents"].items():
+            instructions = spec["instructions"]
+            tools = [self.tools[t] for t in spec.get("tools", [])]
+            servers = [mcp[m].server for m in spec.get("mcp_servers", [])]
+            agents[name] = Agent(
+                name=name,
+                model=self._model(name),
+                instructions=instructions if isinstance(instructions, str) else "\n".join(instructions),
+                handoff_description=spec.get("handoff_description"),
+                tools=tools + self.extra_tools if tools or servers else [],
+                mcp_servers=servers,
+            )
+        for name, spec in config["agents"].items():
+            agents[name].handoffs = [agents[h] for h in spec.get("handoffs", [])]
+        return agents
+
+    def _alive(self) -> list[AgentGraph]:
+        return ([self.current] if self.current else []) + self._draining
+
+    async def load(self) -> dict:
+        """
+        (Re)load the graph from `path`. On any error (invalid config, an MCP
+        server that won't start) the running graph stays in place.
+        """
+        async with self._lock:
+            try:
+                mtime = os.path.getmtime(self.path) if os.path.exists(self.path) else None
+                config = self.read()
+                running = {(p.name, p.fingerprint): p for g in self._alive() for p in g.mcp.values()}
+                mcp, started = {}, []
+                try:
+                    for name, spec in config.get("mcp_servers", {}).items():
+                        process = running.get((name, _fingerprint(spec)))
+                        if process is None:
+                            process = MCPProcess(name, spec)
+                            await process.start()
+                            started.append(process)
+                        mcp[name] = process
+                    agents = self._compile(config, mcp)
+                except Exception:
+                    for process in started:
+                        await process.stop()
+                    raise
+            except Exception:
+                GRAPH_RELOADS.inc(outcome="failed")
+                raise
+
+            old = self.current
+            self.current = AgentGraph(old.version + 1 if old else 1, config, agents, mcp)
+            self._mtime = mtime
+            if old:
+                self._draining.append(old)
+            await self._retire()
+            GRAPH_RELOADS.inc(outcome="ok")
+            report = {
+                "version": self.current.version,
+                "mcp_started": [p.name for p in started],
+                "mcp_kept": [name for name, p in mcp.items() if p not in started],
+            }
+            log.info("🧭 Agent graph v%d loaded from %s (%d agents; MCP started %s, kept %s)",
+                     self.current.version, self.path, len(agents),
+                     report["mcp_started"] or "none", report["mcp_kept"] or "none")
+            return report
+
+    async def _retire(self):
+        """Drop drained graphs, stopping MCP servers no live graph uses. Call with the lock held."""
+        drained = [g for g in self._draining if g.active == 0]
+        self._draining = [g for g in self._draining if g.active]
+        in_use = {id(p) for g in self._alive() for p in g.mcp.values()}
+        for graph in drained:
+            for process in graph.mcp.values():
+                if id(process) not in in_use:
+                    log.info("Stopping MCP server %s (graph v%d retired)", process.name, graph.version)
+                    await process.stop()
+
+    async def _retire_later(self):
+        async with self._lock:
+            await self._retire()
+
+    @asynccontextmanager
+    async def use(self):
+        """The current graph, held for the length of a run."""
+        graph = self.current
+        graph.active += 1
+        try:
+            yield graph
+        finally:
+            graph.active -= 1
+            if graph.active == 0 and graph in self._draining:
+                # not awaited here: this may run in a task that is being cancelled
+                task = asyncio.create_task(self._retire_later())
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    def watch(self, interval: float):
+        """Reload whenever the config file's modification time changes, checking every `interval` seconds."""
+        async def poll():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    mtime = os.path.getmtime(self.path)
+                except OSError:
+                    continue
+                if mtime != self._mtime:
+                    self._mtime = mtime
+                    try:
+                        await self.load()
+                    except Exception as e:
+                        log.error("❌ Agent graph reload failed, keeping v%d: %s", self.current.version, e)
+
+        if interval > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(poll())
+
+    async def close(self):
+        if self._watcher:
+            self._watcher.cancel()
+        async with self._lock:
+            for process in {id(p): p for g in self._alive() for p in g.mcp.values()}.values():
+                await process.stop()
+
+    def stats(self) -> dict:
+        return {
+            "current": self.current.describe() if self.current else None,
+            "draining": [{"version": g.version, "active_runs": g.active} for g in self._draining],
+        }
@@ -0,0 +1,138 @@
+# briefing.py
+import asyncio
+import os
+import time
+from typing import Callable, Optional
+
+from core import deadline, metrics
+from core.cache import get_cache
+from core.identity import acting_as, current_user_id
+from core.logger import get_logger
+
+log = get_logger("briefing")
+
+BRIEFING_REFRESHES = metrics.Counter("briefing_refreshes_total", "Daily briefing prefetches, by trigger and outcome")
+
+MAX_AGE = float(os.getenv("BRIEFING_MAX_AGE", "900"))  # older snapshots are refetched rather than served
+
+# per-user snapshots, shared with other workers when CACHE_BACKEND=sqlite
+_snapshots = get_cache("briefing")
+
+
+def _key(user_id: Optional[str]) -> str:
+    return user_id or "anonymous"
+
+
+def snapshot(user_id: Optional[str]) -> Optional[dict]:
+    """The stored snapshot of `user_id` ({"fetched_at": epoch seconds, "sections": {...}}), if any."""
+    return _snapshots.get(_key(user_id))
+
+
+def store(user_id: Optional[str], sections: dict):
+    _snapshots.set(_key(user_id), {"fetched_at": time.time(), "sections": sections}, ttl=MAX_AGE)
+
+
+def invalidate(*names: str):
+    """Drop sections of the current user's snapshot that a write (reply, new event, sent mail) made stale."""
+    key = _key(current_user_id())
+    snap = _snapshots.get(key)
+    if snap:
+        for name in names:
+            snap["sections"].pop(name, None)
+        ttl = MAX_AGE - (time.time() - snap["fetched_at"])
+        if ttl > 0:
+            _snapshots.set(key, snap, ttl=ttl)
+
+
+class BriefingScheduler:
+    """
+    Keeps a warm daily-briefing snapshot for recently active users.
+
+    Every `interval` seconds, each user seen within `active_within` seconds whose
+    snapshot is older than `min_refresh` gets `prefetch(user_id)` run in a worker
+    thread (on their behalf, within `timeout`), at most `concurrency` at a time.
+    `min_refresh` bounds upstream traffic per user, whatever the interval.
+    """
+
+    def __init__(self, prefetch: Callable[[Optional[str]], dict], interval: float = 300.0,
+                 min_refresh: float = 600.0, active_within: float = 86400.0,
+                 concurrency: int = 4, timeout: float = 60.0, enabled: bool = True):
+        self.prefetch = prefetch
+        self.interval = interval
+        self.min_refresh = min_refresh
+        self.active_within = active_within
+        self.timeout = timeout
+        self.enabled = enabled
+        self._limit = asyncio.Semaphore(concurrency)
+        self._seen: dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def seen(self, user_id: Optional[str]):
+        """Mark `user_id` active; anonymous queries aren't prefetched for."""
+        if user_id:
+            self._seen[user_id] = time.time()
+
+    def active_users(self) -> list[str]:
+        cutoff = time.time() - self.active_within
+        for user_id in [u for u, t in self._seen.items() if t < cutoff]:
+            del self._seen[user_id]
+        return list(self._seen)
+
+    def _due(self, user_id: str) -> bool:
+        snap = snapshot(user_id)
+        return snap is None or time.time() - snap["fetched_at"] >= self.min_refresh
+
+    def _fetch(self, user_id: Optional[str]) -> dict:
+        with acting_as(user_id), deadline.within(self.timeout):
+            return self.prefetch(user_id)
+
+    async def refresh(self, user_id: Optional[str], trigger: str = "schedule") -> dict:
+        """Prefetch and store `user_id`'s briefing now."""
+        async with self._limit:
+            started = time.perf_counter()
+            try:
+                sections = await asyncio.to_thread(self._fetch, user_id)
+            except Exception as e:
+                BRIEFING_REFRESHES.inc(trigger=trigger, outcome="error")
+                log.warning("Briefing prefetch failed (user_id=%r): %s", user_id, e)
+                raise
+            store(user_id, sections)
+            BRIEFING_REFRESHES.inc(trigger=trigger, outcome="ok")
+            log.debug("Prefetched briefing (user_id=%r) in %.0fms", user_id, (time.perf_counter() - started) * 1000)
+            return sections
+
+    async def _run(self):
+        while True:
+            due = [u for u in self.active_users() if self._due(u)]
+            if due:
+                await asyncio.gather(*(self.refresh(u) for u in due), return_exceptions=True)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"active_users": len(self.active_users()), "running": self._task is not None}
+
+
+def from_env(prefetch: Callable[[Optional[str]], dict]) -> BriefingScheduler:
+    """Build a scheduler from the BRIEFING_* environment variables."""
+    return BriefingScheduler(
+        prefetch,
+        interval=float(os.getenv("BRIEFING_INTERVAL", "300")),
+        min_refresh=float(os.getenv("BRIEFING_MIN_REFRESH", "600")),
+        active_within=float(os.getenv("BRIEFING_ACTIVE_WITHIN", "86400")),
+        concurrency=int(os.getenv("BRIEFING_CONCURRENCY", "4")),
+        timeout=float(os.getenv("BRIEFING_TIMEOUT", "60")),
+        enabled=os.getenv("BRIEFING_ENABLED", "1") not in ("0", "false", "no"),
+    )
@@ -0,0 +1,256 @@
+# cache.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from core import deadline
+from core.logger import get_logger
+
+log = get_logger("cache")
+
+_MISSING = object()
+
+
+class CacheBackend:
+    """
+    Key/value cache with per-entry TTLs and bounded size.
+
+    Values must be JSON-serializable so every backend can store them.
+    `get_or_compute` is atomic per key: concurrent callers (threads or, for
+    shared backends, processes) wait for one computation instead of repeating it,
+    though never past their request's deadline (DeadlineExceeded).
+    Computations returning None are not cached.
+    """
+
+    def get(self, key: str, default: Any = None) -> Any:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        raise NotImplementedError
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache; private to the current process."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data: OrderedDict[str, tuple[Any, Optional[float]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: dict[str, list] = {}  # key -> [lock, callers holding or waiting for it]
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def get_or_compute(self, key, compute, ttl=None):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            left = deadline.remaining()
+            if not entry[0].acquire(timeout=-1 if left is None else max(left, 0)):
+                raise deadline.DeadlineExceeded(f"Request deadline exceeded waiting for cache key {key!r}")
+            try:
+                value = self.get(key, _MISSING)  # computed while we waited?
+                if value is _MISSING:
+                    value = compute()
+                    if value is not None:
+                        self.set(key, value, ttl)
+            finally:
+                entry[0].release()
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:  # the last one out; a lock others still wait on must stay
+                    del self._key_locks[key]
+        return value
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Cache shared by every process on the host through one SQLite file in WAL mode.
+
+    Eviction is approximate LRU: access times are refreshed at most once a
+    minute per entry, and the oldest entries are trimmed when the table grows
+    past `max_entries`. `get_or_compute` takes a short-lived lease row so only
+    one process computes a missing key while the others poll for its result.
+    """
+
+    LEASE_SECONDS = 30.0
+    POLL_SECONDS = 0.05
+
+    def __init__(self, path: str, max_entries: int = 50000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+                " expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache(accessed_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        now = time.time()
+        row = self._conn().execute(
+            "SELECT value, expires_at, accessed_at FROM cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires_at, accessed_at = row
+        if expires_at is not None and expires_at < now:
+            self._conn().execute("DELETE FROM cache WHERE key = ? AND expires_at < ?", (key, now))
+            return default
+        if now - accessed_at > 60:
+            self._conn().execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(value)
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now + ttl if ttl else None, now),
+        )
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._evict()
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def _evict(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?", (time.time(),))
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            # trim a little below the bound so we don't evict on every write
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed_at LIMIT ?)",
+                (excess + self.max_entries // 10,),
+            )
+
+    def _try_lease(self, key: str) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM leases WHERE key = ? AND expires_at < ?", (key, now))
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO leases (key, expires_at) VALUES (?, ?)", (key, now + self.LEASE_SECONDS)
+        )
+        return cur.rowcount == 1
+
+    def get_or_compute(self, key, compute, ttl=None):
+        lease_expiry = time.time() + self.LEASE_SECONDS
+        while True:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+            leased = self._try_lease(key)
+            if leased or time.time() > lease_expiry:  # or the lease holder seems stuck: compute it anyway
+                break
+            left = deadline.remaining()
+            if left is not None and left < self.POLL_SECONDS:
+                raise deadline.DeadlineExceeded(f"Request deadline exceeded waiting for cache key {key!r}")
+            time.sleep(self.POLL_SECONDS)  # another process is computing it
+        try:
+            value = self.get(key, _MISSING)
+            if value is _MISSING:
+                value = compute()
+                if value is not None:
+                    self.set(key, value, ttl)
+            return value
+        finally:
+            if leased:  # never another process's lease
+                self._conn().execute("DELETE FROM leases WHERE key = ?", (key,))
+
+
+class Namespace(CacheBackend):
+    """A view of a backend with every key prefixed by `name:`."""
+
+    def __init__(self, backend: CacheBackend, name: str):
+        self.backend = backend
+        self.prefix = f"{name}:"
+
+    def get(self, key, default=None):
+        return self.backend.get(self.prefix + key, default)
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(self.prefix + key, value, ttl)
+
+    def delete(self, key):
+        self.backend.delete(self.prefix + key)
+
+    def get_or_compute(self, key, compute, ttl=None):
+        return self.backend.get_or_compute(self.prefix + key, compute, ttl)
+
+
+_backend: Optional[CacheBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> CacheBackend:
+    """The process-wide backend selected by CACHE_BACKEND (`memory` or `sqlite`)."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            kind = os.getenv("CACHE_BACKEND", "memory").lower()
+            max_entries = int(os.getenv("CACHE_MAX_ENTRIES", "50000"))
+            if kind == "sqlite":
+                path = os.getenv("CACHE_PATH", os.path.join(os.path.dirname(__file__), "..", ".cache", "cache.sqlite"))
+                _backend = SQLiteCache(path, max_entries=max_entries)
+            else:
+                if kind != "memory":
+                    log.warning("Unknown CACHE_BACKEND %r, using in-process memory cache", kind)
+                _backend = MemoryCache(max_entries=max_entries)
+        return _backend
+
+
+def get_cache(namespace: str) -> CacheBackend:
+    """Cache scoped to `namespace` on the configured backend."""
+    return Namespace(get_backend(), namespace)
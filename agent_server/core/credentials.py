@@ -0,0 +1,83 @@
+# credentials.py
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from core.logger import get_logger
+
+log = get_logger("credentials")
+
+
+class CredentialStore:
+    """
+    Per-user secrets (e.g. Google OAuth tokens) encrypted at rest in SQLite.
+
+    Rows are Fernet-encrypted JSON keyed by user_id. Without a key the store
+    is disabled: lookups return None and writes raise RuntimeError.
+    """
+
+    def __init__(self, path: str, key: Optional[str], table: str = "credentials"):
+        self.path = path
+        self.table = table
+        self._local = threading.local()
+        self._fernet = None
+        if key:
+            from cryptography.fernet import Fernet
+            self._fernet = Fernet(key)
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn().execute(
+                f"CREATE TABLE IF NOT EXISTS {table} ("
+                " user_id TEXT PRIMARY KEY, secret BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self._fernet is not None
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, user_id: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        row = self._conn().execute(f"SELECT secret FROM {self.table} WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        from cryptography.fernet import InvalidToken
+        try:
+            return json.loads(self._fernet.decrypt(row[0]))
+        except InvalidToken:
+            log.error("Stored credentials for user %s cannot be decrypted with the current key", user_id)
+            return None
+
+    def put(self, user_id: str, secret: dict):
+        if not self.enabled:
+            raise RuntimeError("Credential store is disabled: set CREDENTIALS_KEY to enable it")
+        self._conn().execute(
+            f"INSERT OR REPLACE INTO {self.table} (user_id, secret, updated_at) VALUES (?, ?, ?)",
+            (user_id, self._fernet.encrypt(json.dumps(secret).encode()), time.time()),
+        )
+
+    def delete(self, user_id: str) -> bool:
+        if not self.enabled:
+            return False
+        cur = self._conn().execute(f"DELETE FROM {self.table} WHERE user_id = ?", (user_id,))
+        return cur.rowcount > 0
+
+
+def from_env(table: str = "credentials") -> CredentialStore:
+    """
+    Store configured by CREDENTIALS_KEY (a Fernet key, see
+    `python -c "from cryptography.fernet import Fernet; print(Fernet.generate_key().decode())"`)
+    and CREDENTIALS_DB.
+    """
+    default_path = os.path.join(os.path.dirname(__file__), "..", ".cache", "credentials.sqlite")
+    return CredentialStore(os.getenv("CREDENTIALS_DB", default_path), os.getenv("CREDENTIALS_KEY"), table)
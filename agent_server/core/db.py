@@ -0,0 +1,67 @@
+# db.py
+import hashlib
+import os
+
+from dotenv import load_dotenv
+
+from core import deadline
+from core.cache import get_cache
+from core.logger import get_logger
+
+log = get_logger("db")
+
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")  # AI assistant's Supabase project
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")  # Service role key (used only server-side)
+
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))  # how long a verified access token is trusted
+
+_supabase = None
+_verified = get_cache("auth:user")  # sha256 of an access token -> its user id
+
+
+class InvalidToken(PermissionError):
+    pass
+
+
+def configured() -> bool:
+    return bool(SUPABASE_URL and SUPABASE_KEY)
+
+
+def get_supabase():
+    """Returns the Supabase client, creating it on first use (None if misconfigured)."""
+    global _supabase
+    if _supabase is None:
+        # install with `pip install supabase`; imported here because it is slow to import
+        from supabase import ClientOptions, create_client
+        try:
+            # the client is shared across requests, so it gets the default upstream timeout
+            _supabase = create_client(SUPABASE_URL, SUPABASE_KEY,
+                                      options=ClientOptions(postgrest_client_timeout=deadline.UPSTREAM_TIMEOUT))
+            log.debug("Supabase client initialized successfully")
+        except Exception as e:
+            log.error("Failed to initialize Supabase client: %s", e)
+    return _supabase
+
+
+def verify_access_token(token: str) -> str:
+    """
+    The id of the Supabase Auth user an access token (the frontend's session
+    JWT) belongs to; raises InvalidToken. Verified tokens are cached briefly.
+    """
+    def verify():
+        client = get_supabase()
+        if client is None:
+            raise RuntimeError("Supabase is not configured")
+        from supabase_auth.errors import AuthApiError
+        deadline.timeout()  # don't start the check once the request is out of time
+        try:
+            response = client.auth.get_user(token)
+        except AuthApiError as e:
+            raise InvalidToken(f"Invalid access token: {e.message}")
+        if response is None or response.user is None:
+            raise InvalidToken("Invalid access token")
+        return response.user.id
+
+    return _verified.get_or_compute(hashlib.sha256(token.encode()).hexdigest(), verify, ttl=AUTH_CACHE_TTL)
@@ -0,0 +1,50 @@
+# deadline.py
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# the default per-call timeout for upstream HTTP calls, used outside a request too
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "15"))
+MIN_TIMEOUT = 0.05  # smallest timeout handed to a client library; below it the call is skipped
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised before an upstream call when the request's deadline has already passed."""
+
+
+@contextmanager
+def within(seconds: Optional[float]):
+    """
+    Run the block (and the tools it calls, including in worker threads) with a
+    deadline `seconds` from now. A deadline set further out never extends an
+    earlier one already in effect; None or 0 leaves the current deadline as is.
+    """
+    current = _deadline.get()
+    deadline = time.monotonic() + seconds if seconds else None
+    if current is not None and (deadline is None or current < deadline):
+        deadline = current
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline (negative once past), or None if there is none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout(default: float = UPSTREAM_TIMEOUT) -> float:
+    """Timeout for one upstream call: `default`, capped by the time left before the deadline."""
+    left = remaining()
+    if left is None:
+        return default
+    if left < MIN_TIMEOUT:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return min(default, left)
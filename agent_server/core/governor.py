@@ -0,0 +1,135 @@
+# governor.py
+import dataclasses
+import json
+import os
+import uuid
+from typing import Any, Optional
+
+from core import metrics
+from core.cache import get_cache
+from core.logger import get_logger
+
+log = get_logger("governor")
+
+TOOL_OUTPUT_TRUNCATED = metrics.Counter(
+    "tool_output_truncated_total", "Tool results cut down to their token budget, by tool"
+)
+
+CHARS_PER_TOKEN = 4  # rough, but good enough for budgeting
+DEFAULT_BUDGET = int(os.getenv("TOOL_OUTPUT_MAX_TOKENS", "2000"))
+# tools known to return large payloads get tighter budgets; TOOL_OUTPUT_BUDGETS (JSON) overrides
+BUDGETS = {
+    "read_file": 2000,
+    "read_drive_file": 2000,
+    "read_emails": 1500,
+    "list_calendar_events": 1500,
+    **json.loads(os.getenv("TOOL_OUTPUT_BUDGETS", "{}")),
+}
+MAX_FIELD_CHARS = int(os.getenv("TOOL_OUTPUT_MAX_FIELD_CHARS", "500"))
+CURSOR_TTL = float(os.getenv("TOOL_OUTPUT_CURSOR_TTL", "900"))
+MAX_RETAINED_CHARS = 2_000_000  # what's left beyond this can't be paged through
+
+_pages = get_cache("tool_output")
+
+
+def _tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _size(item: Any) -> int:
+    return _tokens(item if isinstance(item, str) else json.dumps(item, default=str))
+
+
+def _save(tool_name: str, data: Any) -> str:
+    key = uuid.uuid4().hex[:12]
+    _pages.set(key, {"tool": tool_name, "data": data}, ttl=CURSOR_TTL)
+    return key
+
+
+def _clip_fields(item: Any) -> Any:
+    """Shorten long string fields of a dict item (e.g. event descriptions, email bodies)."""
+    if not isinstance(item, dict):
+        return item
+    clipped = {}
+    for key, value in item.items():
+        if isinstance(value, str) and len(value) > MAX_FIELD_CHARS:
+            value = value[:MAX_FIELD_CHARS] + f"… [{len(value) - MAX_FIELD_CHARS} more characters]"
+        clipped[key] = value
+    return clipped
+
+
+def _page_text(tool_name: str, text: str, start: int, key: Optional[str], budget: int) -> str:
+    rest = text[start:]
+    limit = budget * CHARS_PER_TOKEN
+    if len(rest) <= limit:
+        return rest
+    # cut at a line break when there's one reasonably close to the limit
+    cut = rest.rfind("\n", limit // 2, limit)
+    cut = cut + 1 if cut > 0 else limit
+    key = key or _save(tool_name, text[:MAX_RETAINED_CHARS])
+    left = len(rest) - cut
+    return (
+        f"{rest[:cut].rstrip()}\n[… truncated: {left} more characters (~{_tokens(rest[cut:])} tokens). "
+        f'Call read_more(cursor="{key}:{start + cut}") to continue.]'
+    )
+
+
+def _page_items(tool_name: str, items: list, start: int, key: Optional[str], budget: int) -> list:
+    kept, used = [], 0
+    for i in range(start, len(items)):
+        item = _clip_fields(items[i])
+        size = _size(item)
+        if kept and used + size > budget:
+            key = key or _save(tool_name, items)
+            cursor = f"{key}:{i}"
+            kept.append({"truncated": f"{len(items) - i} more items", "cursor": cursor,
+                         "hint": f'Call read_more(cursor="{cursor}") for the next page.'})
+            return kept
+        kept.append(item)
+        used += size
+    return kept
+
+
+def _page(tool_name: str, data: Any, start: int = 0, key: Optional[str] = None) -> Any:
+    budget = BUDGETS.get(tool_name, DEFAULT_BUDGET)
+    if isinstance(data, str):
+        return _page_text(tool_name, data, start, key, budget)
+    if isinstance(data, (list, tuple)):
+        return _page_items(tool_name, list(data), start, key, budget)
+    if isinstance(data, dict):
+        return _clip_fields(data)
+    return data
+
+
+def govern(tool_name: str, output: Any) -> Any:
+    """
+    Fit a tool result into the tool's token budget before it reaches the LLM.
+
+    Text is cut (at a line break where possible) and lists keep as many items
+    as fit, with long string fields shortened. The full result is kept for a
+    while so `read_more` can page through it with the cursor named in the marker.
+    """
+    governed = _page(tool_name, output)
+    if governed is not output and governed != output:
+        TOOL_OUTPUT_TRUNCATED.inc(tool=tool_name)
+        log.debug("Truncated %s output to its token budget", tool_name)
+    return governed
+
+
+def next_page(cursor: str) -> Any:
+    """The page of a truncated result starting at `cursor`, or None if it is unknown or expired."""
+    key, _, start = cursor.strip().partition(":")
+    saved = _pages.get(key)
+    if saved is None or not start.isdigit():
+        return None
+    return _page(saved["tool"], saved["data"], int(start), key)
+
+
+def governed(tool):
+    """Copy of a FunctionTool whose results go through `govern`."""
+    invoke = tool.on_invoke_tool
+
+    async def on_invoke_tool(ctx, input):
+        return govern(tool.name, await invoke(ctx, input))
+
+    return dataclasses.replace(tool, on_invoke_tool=on_invoke_tool)
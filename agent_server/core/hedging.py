@@ -0,0 +1,210 @@
+# hedging.py
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from agents import ModelSettings
+from agents.models.default_models import get_default_model_settings
+from agents.models.interface import Model, ModelProvider
+from agents.models.multi_provider import MultiProvider
+
+from core import metrics
+from core.model_tiers import STATS as MODEL_STATS, MODEL_SELECTED, ModelSelector, selector_for
+from core.logger import get_logger
+
+log = get_logger("hedging")
+
+LLM_HEDGES = metrics.Counter("llm_hedges_total", "Hedged duplicate LLM requests sent, by agent")
+LLM_HEDGE_WINS = metrics.Counter("llm_hedge_wins_total", "Hedged LLM requests that answered first, by agent")
+LLM_FALLBACKS = metrics.Counter("llm_fallbacks_total", "LLM requests answered by the fallback model, by agent and reason")
+
+
+class LatencyWindow:
+    """Rolling window of recent completion latencies (seconds)."""
+
+    def __init__(self, size: int = 200):
+        self._values: deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._values.append(seconds)
+
+    def __len__(self):
+        return len(self._values)
+
+    def percentile(self, p: float) -> float:
+        if not self._values:
+            return 0.0
+        ordered = sorted(self._values)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class HedgedModel(Model):
+    """
+    Model wrapper for one agent that hedges slow completions.
+
+    The model for each request comes from `selector` (the agent's tier) when
+    given, otherwise `model`. When a request has not answered within the agent's rolling p`percentile`
+    latency, a duplicate is sent (to `hedge_model`, the same model by default);
+    the first answer wins and the other request is cancelled. If neither
+    answers within `deadline` seconds, or both fail, the request is retried
+    once on `fallback_model` when one is configured.
+    """
+
+    def __init__(
+        self,
+        agent_name: str,
+        model: Optional[str] = None,
+        hedge_model: Optional[str] = None,
+        fallback_model: Optional[str] = None,
+        provider: Optional[ModelProvider] = None,
+        selector: Optional[ModelSelector] = None,
+        enabled: bool = True,
+        percentile: float = 95,
+        min_delay: float = 0.5,
+        initial_delay: float = 3.0,
+        min_samples: int = 20,
+        deadline: float = 60.0,
+        window: int = 200,
+    ):
+        self.agent_name = agent_name
+        self.selector = selector or ModelSelector([model])
+        self.model_name = self.selector.primary
+        self.hedge_model_name = hedge_model
+        self.fallback_model_name = fallback_model
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.deadline = deadline
+        self.latencies = LatencyWindow(window)
+        self._provider = provider
+        self._models: dict[Optional[str], Model] = {}
+
+    def _model(self, name: Optional[str]) -> Model:
+        # resolved on first use, after server.py has configured the default client
+        if name not in self._models:
+            if self._provider is None:
+                self._provider = MultiProvider()
+            self._models[name] = self._provider.get_model(name)
+        return self._models[name]
+
+    @staticmethod
+    def _settings(name: Optional[str], settings: ModelSettings) -> ModelSettings:
+        # an Agent given a Model instance skips the SDK's per-model defaults (e.g. reasoning effort)
+        return get_default_model_settings(name).resolve(settings)
+
+    def hedge_delay(self) -> float:
+        """Seconds to wait for the primary request before sending a hedge."""
+        if len(self.latencies) < self.min_samples:
+            return self.initial_delay
+        return max(self.min_delay, self.latencies.percentile(self.percentile))
+
+    async def _call(self, name: Optional[str], request: dict):
+        started = time.perf_counter()
+        settings = self._settings(name, request["model_settings"])
+        try:
+            response = await self._model(name).get_response(**{**request, "model_settings": settings})
+        except Exception:
+            MODEL_STATS.record(name, time.perf_counter() - started, ok=False)
+            raise
+        seconds = time.perf_counter() - started
+        MODEL_STATS.record(name, seconds, ok=True)
+        return response, seconds
+
+    async def _race(self, name: Optional[str], request: dict):
+        primary = asyncio.create_task(self._call(name, request))
+        tasks = {primary}
+        delay = self.hedge_delay() if self.enabled else None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                LLM_HEDGES.inc(agent=self.agent_name)
+                log.debug("Hedging %s after %.2fs", self.agent_name, delay)
+                tasks.add(asyncio.create_task(self._call(self.hedge_model_name or name, request)))
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            LLM_HEDGE_WINS.inc(agent=self.agent_name)
+                        return task.result()
+                if not tasks:
+                    raise next(iter(done)).exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def get_response(
+        self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs
+    ):
+        request = dict(system_instructions=system_instructions, input=input, model_settings=model_settings,
+                       tools=tools, output_schema=output_schema, handoffs=handoffs, tracing=tracing, **kwargs)
+        name = self.selector.choose()
+        MODEL_SELECTED.inc(agent=self.agent_name, model=name or "default")
+        try:
+            response, seconds = await asyncio.wait_for(self._race(name, request), self.deadline or None)
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            if timed_out:
+                MODEL_STATS.record(name, self.deadline, ok=False)
+            if not self.fallback_model_name:
+                raise
+            reason = "deadline" if timed_out else "error"
+            log.warning("%s: falling back to %s (%s: %s)", self.agent_name, self.fallback_model_name, reason, e)
+            LLM_FALLBACKS.inc(agent=self.agent_name, reason=reason)
+            response, _ = await self._call(self.fallback_model_name, request)
+            return response
+        self.latencies.add(seconds)
+        return response
+
+    async def stream_response(
+        self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs
+    ):
+        # streams are not hedged: events are forwarded as they arrive. The fallback
+        # model only takes over when the primary fails before producing anything.
+        request = dict(system_instructions=system_instructions, input=input,
+                       tools=tools, output_schema=output_schema, handoffs=handoffs, tracing=tracing, **kwargs)
+        name = self.selector.choose()
+        MODEL_SELECTED.inc(agent=self.agent_name, model=name or "default")
+        started = False
+        try:
+            async for event in self._model(name).stream_response(
+                **request, model_settings=self._settings(name, model_settings)
+            ):
+                started = True
+                yield event
+        except Exception as e:
+            if started or not self.fallback_model_name:
+                raise
+            log.warning("%s: stream falling back to %s (%s)", self.agent_name, self.fallback_model_name, e)
+            LLM_FALLBACKS.inc(agent=self.agent_name, reason="error")
+            async for event in self._model(self.fallback_model_name).stream_response(
+                **request, model_settings=self._settings(self.fallback_model_name, model_settings)
+            ):
+                yield event
+
+    def get_retry_advice(self, request):
+        return self._model(self.model_name).get_retry_advice(request)
+
+    async def close(self):
+        for model in self._models.values():
+            await model.close()
+
+
+def from_env(agent_name: str) -> HedgedModel:
+    """HedgedModel for `agent_name`'s model tier (see core/model_tiers.py), hedged per HEDGE_* variables."""
+    return HedgedModel(
+        agent_name,
+        selector=selector_for(agent_name),
+        hedge_model=os.getenv("HEDGE_MODEL") or None,
+        fallback_model=os.getenv("LLM_FALLBACK_MODEL") or None,
+        enabled=os.getenv("HEDGE_ENABLED", "1") not in ("0", "false", "no"),
+        percentile=float(os.getenv("HEDGE_PERCENTILE", "95")),
+        min_delay=float(os.getenv("HEDGE_MIN_DELAY", "0.5")),
+        initial_delay=float(os.getenv("HEDGE_INITIAL_DELAY", "3")),
+        min_samples=int(os.getenv("HEDGE_MIN_SAMPLES", "20")),
+        deadline=float(os.getenv("LLM_DEADLINE", "60")),
+    )
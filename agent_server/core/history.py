@@ -0,0 +1,174 @@
+# history.py
+"""
+Chat history in Supabase (`chat_sessions` and `messages`).
+
+Pages use keyset pagination on (created_at, id): a page is "the `limit`
+messages before message X", so opening a long session costs the same as a
+short one. The most recent messages of each session are kept in the cache,
+so reopening a session doesn't hit the database; a write drops them and the
+next read refills them.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from core import db, deadline, metrics
+from core.cache import get_cache
+from core.logger import get_logger
+
+log = get_logger("history")
+
+PAGE_SIZE = 50
+PAGE_MAX = 200
+RECENT = int(os.getenv("HISTORY_CACHE_MESSAGES", "50"))  # per session
+CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "600"))
+
+DEFAULT_TITLE = "New Chat"
+TITLE_WORDS = 5
+MESSAGE_COLUMNS = "id,session_id,sender,content,created_at"
+SESSION_COLUMNS = "id,user_id,title,created_at"
+
+HISTORY_READS = metrics.Counter("history_reads_total", "Chat history pages served, by source (cache or db)")
+
+# session rows and recent messages, shared with other workers when CACHE_BACKEND=sqlite
+_cache = get_cache("history")
+
+
+class HistoryUnavailable(RuntimeError):
+    pass
+
+
+class SessionNotFound(LookupError):
+    pass
+
+
+def enabled() -> bool:
+    return db.configured()
+
+
+def _table(name: str):
+    client = db.get_supabase()
+    if client is None:
+        raise HistoryUnavailable("Chat history is unavailable: Supabase is not configured")
+    deadline.timeout()  # don't start a query once the request is out of time
+    return client.table(name)
+
+
+def _older_than(query, cursor: dict):
+    """Rows strictly before `cursor` in (created_at, id) order."""
+    ts = cursor["created_at"]
+    return query.or_(f'created_at.lt."{ts}",and(created_at.eq."{ts}",id.lt.{cursor["id"]})')
+
+
+def _page(rows: list[dict], key: str, has_more: bool) -> dict:
+    return {key: rows, "has_more": has_more, "next_before": rows[0]["id"] if has_more and rows else None}
+
+
+def session_info(session_id: str) -> dict:
+    """The session's row (id, user_id, title, created_at); raises SessionNotFound."""
+    def load():
+        rows = _table("chat_sessions").select(SESSION_COLUMNS).eq("id", session_id).limit(1).execute().data
+        return rows[0] if rows else None
+
+    info = _cache.get_or_compute(f"session:{session_id}", load, ttl=CACHE_TTL)
+    if info is None:
+        raise SessionNotFound(f"Chat session {session_id} not found")
+    return info
+
+
+def check_owner(session_id: str, user_id: Optional[str]) -> dict:
+    """session_info(), but a session of another user is reported as not found."""
+    info = session_info(session_id)
+    if info["user_id"] != user_id:
+        raise SessionNotFound(f"Chat session {session_id} not found")
+    return info
+
+
+def list_sessions(user_id: str, before: Optional[str] = None, limit: int = 20) -> dict:
+    """The user's sessions, newest first, `limit` at a time."""
+    limit = max(1, min(limit, PAGE_MAX))
+    query = _table("chat_sessions").select("id,title,created_at").eq("user_id", user_id)
+    if before:
+        query = _older_than(query, check_owner(before, user_id))
+    rows = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute().data
+    page = _page(rows[:limit], "sessions", len(rows) > limit)
+    if page["has_more"]:
+        page["next_before"] = rows[limit - 1]["id"]  # newest first: the cursor is the last row
+    return page
+
+
+def messages(session_id: str, before: Optional[str] = None, limit: int = PAGE_SIZE) -> dict:
+    """
+    The `limit` messages before message `before` (or the latest ones), oldest
+    first. `next_before` is the cursor for the page before this one.
+    """
+    limit = max(1, min(limit, PAGE_MAX))
+    recent = _cache.get(f"recent:{session_id}")
+    cursor = None
+    if recent is not None:
+        cached = recent["messages"]
+        end = len(cached) if before is None else next((i for i, m in enumerate(cached) if m["id"] == before), None)
+        if end is not None:
+            if end >= limit or recent["complete"]:
+                HISTORY_READS.inc(source="cache")
+                start = max(0, end - limit)
+                return _page(cached[start:end], "messages", start > 0 or not recent["complete"])
+            if before is not None:
+                cursor = cached[end]
+
+    if before is not None and cursor is None:
+        rows = _table("messages").select("id,created_at").eq("session_id", session_id).eq("id", before).limit(1).execute().data
+        if not rows:
+            raise ValueError(f"Message {before} is not in session {session_id}")
+        cursor = rows[0]
+
+    # the latest page is fetched at least RECENT long, so it can fill the cache
+    fetch = limit if before is not None else max(limit, RECENT)
+    query = _table("messages").select(MESSAGE_COLUMNS).eq("session_id", session_id)
+    if cursor:
+        query = _older_than(query, cursor)
+    rows = query.order("created_at", desc=True).order("id", desc=True).limit(fetch + 1).execute().data
+    more = len(rows) > fetch
+    rows = rows[:fetch][::-1]
+    if before is None:
+        _cache.set(f"recent:{session_id}", {"messages": rows, "complete": not more}, ttl=CACHE_TTL)
+    HISTORY_READS.inc(source="db")
+    return _page(rows[-limit:], "messages", more or len(rows) > limit)
+
+
+def append(session_id: str, new: list[dict]) -> list[dict]:
+    """
+    Store messages ({"sender", "content"}, optionally "created_at") in one
+    insert and drop the session's cached recent messages. Returns the stored rows.
+    """
+    now = datetime.now(timezone.utc)
+    rows = [{
+        "session_id": session_id,
+        "sender": m["sender"],
+        "content": m["content"],
+        # keeps the order of a batch stable under (created_at, id) ordering
+        "created_at": m.get("created_at") or (now + timedelta(microseconds=i)).isoformat(timespec="microseconds"),
+    } for i, m in enumerate(new)]
+    stored = [{k: r.get(k) for k in MESSAGE_COLUMNS.split(",")} for r in _table("messages").insert(rows).execute().data]
+    # not merged into the cached list: concurrent appends in other workers would overwrite each other's
+    _cache.delete(f"recent:{session_id}")
+    return stored
+
+
+def title_for(message: str) -> str:
+    words = message.split()
+    return " ".join(words[:TITLE_WORDS]) + ("..." if len(words) > TITLE_WORDS else "")
+
+
+def record_turn(session_id: str, message: str, reply: str, asked_at: datetime) -> list[dict]:
+    """Store a user message and the assistant's reply; names an untitled session after the message."""
+    stored = append(session_id, [
+        {"sender": "user", "content": message, "created_at": asked_at.isoformat(timespec="microseconds")},
+        {"sender": "ai", "content": reply},
+    ])
+    info = session_info(session_id)
+    if info["title"] == DEFAULT_TITLE and message.strip():
+        title = title_for(message)
+        _table("chat_sessions").update({"title": title}).eq("id", session_id).execute()
+        _cache.set(f"session:{session_id}", {**info, "title": title}, ttl=CACHE_TTL)
+    return stored
@@ -0,0 +1,21 @@
+# identity.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+_user_id: ContextVar[Optional[str]] = ContextVar("user_id", default=None)
+
+
+def current_user_id() -> Optional[str]:
+    """The user the current agent run acts for (None outside a run or for anonymous queries)."""
+    return _user_id.get()
+
+
+@contextmanager
+def acting_as(user_id: Optional[str]):
+    """Run the block (and the tools it calls, including in worker threads) on behalf of `user_id`."""
+    token = _user_id.set(user_id)
+    try:
+        yield
+    finally:
+        _user_id.reset(token)
@@ -0,0 +1,165 @@
+# jobs.py
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Optional
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+class JobQueueFull(Exception):
+    """Raised when the pending-job queue is at capacity."""
+
+
+class IdempotencyConflict(Exception):
+    """Raised when an idempotency key is reused with a different payload."""
+
+
+class Job:
+    def __init__(self, payload: dict, idempotency_key: Optional[str] = None, owner: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.idempotency_key = idempotency_key
+        self.owner = owner  # the user who submitted it
+        self.status = QUEUED
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    @property
+    def done(self) -> bool:
+        return self.status in (SUCCEEDED, FAILED)
+
+    def _set(self, status: str, **fields):
+        self.status = status
+        for k, v in fields.items():
+            setattr(self, k, v)
+        # wake everyone waiting on this job, then arm a fresh event for the next change
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def wait_changed(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the next status change. Returns False on timeout."""
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs agent queries in the background on a bounded pool of worker tasks.
+
+    `submit` returns immediately with a Job; clients poll or stream its status.
+    Jobs submitted with the same (user_id, idempotency key) map to the same run,
+    so client retries don't repeat expensive work. Finished jobs are kept for
+    `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[dict], Awaitable[Any]],
+        workers: int = 4,
+        max_pending: int = 100,
+        ttl: float = 3600.0,
+    ):
+        self.runner = runner
+        self.workers = workers
+        self.ttl = ttl
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._jobs: dict[str, Job] = {}
+        self._by_key: dict[tuple, tuple[str, str]] = {}  # (user, key) -> (job id, payload hash)
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self):
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, payload: dict, idempotency_key: Optional[str] = None,
+               owner: Optional[str] = None) -> tuple[Job, bool]:
+        """Enqueue a run for `owner`. Returns (job, created); `created` is False for idempotent replays."""
+        self._prune()
+        scope = None
+        digest = hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+        if idempotency_key:
+            scope = (payload.get("user_id"), idempotency_key)
+            known = self._by_key.get(scope)
+            if known and known[0] in self._jobs:
+                if known[1] != digest:
+                    raise IdempotencyConflict("Idempotency key was already used with a different request.")
+                return self._jobs[known[0]], False
+
+        job = Job(payload, idempotency_key, owner)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFull("Too many pending jobs, please retry later.")
+        self._jobs[job.id] = job
+        if scope:
+            self._by_key[scope] = (job.id, digest)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def stats(self) -> dict:
+        counts = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {"workers": self.workers, "pending": self._queue.qsize(), "jobs": counts}
+
+    async def _worker(self, n: int):
+        while True:
+            job = await self._queue.get()
+            job._set(RUNNING, started_at=time.time())
+            try:
+                result = await self.runner(job.payload)
+                job._set(SUCCEEDED, result=result, finished_at=time.time())
+            except asyncio.CancelledError:
+                job._set(FAILED, error="Server shutting down.", finished_at=time.time())
+                raise
+            except Exception as e:
+                job._set(FAILED, error=str(e), finished_at=time.time())
+            finally:
+                self._queue.task_done()
+
+    def _prune(self):
+        cutoff = time.time() - self.ttl
+        expired = [jid for jid, j in self._jobs.items() if j.done and j.finished_at < cutoff]
+        for jid in expired:
+            job = self._jobs.pop(jid)
+            if job.idempotency_key:
+                self._by_key.pop((job.payload.get("user_id"), job.idempotency_key), None)
+
+
+def from_env(runner: Callable[[dict], Awaitable[Any]]) -> JobManager:
+    """Build a job manager from the JOBS_* environment variables."""
+    return JobManager(
+        runner,
+        workers=int(os.getenv("JOBS_WORKERS", "4")),
+        max_pending=int(os.getenv("JOBS_MAX_PENDING", "100")),
+        ttl=float(os.getenv("JOBS_TTL", "3600")),
+    )
@@ -0,0 +1,115 @@
+# logger.py
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+ROOT = "agent"
+
+# attributes every LogRecord has; anything else came in through `extra=`
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sample"}
+
+_listener = None
+_dropped = 0
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a record with probability `record.sample` (set via `extra=sampled(rate)`)."""
+
+    def filter(self, record):
+        rate = getattr(record, "sample", None)
+        return rate is None or random.random() < rate
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without blocking the caller.
+
+    Message interpolation and serialization happen on the listener thread;
+    when the queue is full the record is dropped and counted instead.
+    """
+
+    def prepare(self, record):
+        # exc_info can't be formatted later (the traceback may be gone), everything else can
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _dropped += 1
+
+
+class _Formatter(logging.Formatter):
+    """`text`: `time LEVEL logger message key=value…`; `json`: one object per line."""
+
+    def __init__(self, fmt: str):
+        super().__init__()
+        self.json = fmt == "json"
+
+    def format(self, record):
+        fields = {k: v for k, v in vars(record).items() if k not in _STANDARD_ATTRS}
+        message = record.getMessage()
+        if self.json:
+            entry = {"ts": round(record.created, 3), "level": record.levelname,
+                     "logger": record.name, "msg": message, **fields}
+            if record.exc_text:
+                entry["exc"] = record.exc_text
+            return json.dumps(entry, default=str, ensure_ascii=False)
+
+        ts = time.strftime("%H:%M:%S", time.localtime(record.created))
+        line = f"{ts} {record.levelname:<5} {record.name} {message}"
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_text:
+            line += "\n" + record.exc_text
+        return line
+
+
+def _configure():
+    global _listener
+    root = logging.getLogger(ROOT)
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    root.propagate = False
+
+    sink = logging.StreamHandler(sys.stderr)  # never stdout: MCP servers speak JSON-RPC there
+    sink.setFormatter(_Formatter(os.getenv("LOG_FORMAT", "text").lower()))
+
+    handler = _NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    handler.addFilter(SamplingFilter())
+    root.addHandler(handler)
+
+    _listener = QueueListener(handler.queue, sink)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Logger for `name` under the shared, queue-backed `agent` hierarchy.
+
+    Use %-style arguments (`log.debug("got %s", x)`) so disabled levels cost no
+    formatting, and guard anything expensive to build with `log.isEnabledFor`.
+    """
+    if _listener is None:
+        _configure()
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+def sampled(rate: float, **fields) -> dict:
+    """`extra=` for high-volume events: keep roughly `rate` of them."""
+    return {"sample": rate, **fields}
+
+
+def dropped() -> int:
+    """Records dropped because the log queue was full."""
+    return _dropped
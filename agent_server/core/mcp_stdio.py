@@ -0,0 +1,39 @@
+# mcp_stdio.py
+import asyncio
+import os
+
+from agents.mcp.server import MCPServerStdio
+
+from core import deadline, governor, timing
+from core.identity import current_user_id
+
+MCP_CALL_TIMEOUT = float(os.getenv("MCP_CALL_TIMEOUT", "30"))
+
+
+class InstrumentedMCPServerStdio(MCPServerStdio):
+    """
+    MCPServerStdio that records every `tools/call` round trip as an `mcp` span
+    and fits text results into the tool's output budget (see core/governor.py).
+
+    Calls are bounded by the request's deadline (see core/deadline.py); the
+    remaining budget is also sent as `_meta.timeout` so the server can stop its
+    own upstream calls in time, and the acting user as `_meta.user_id` so its
+    per-user rate limits apply (see core/ratelimit.py).
+    """
+
+    async def call_tool(self, tool_name, arguments, meta=None):
+        timeout = deadline.timeout(MCP_CALL_TIMEOUT)
+        meta = {**(meta or {}), "timeout": round(timeout, 3), "user_id": current_user_id()}
+        with timing.span("mcp", f"{self.name}:{tool_name}"):
+            try:
+                result = await asyncio.wait_for(super().call_tool(tool_name, arguments, meta=meta), timeout)
+            except asyncio.TimeoutError:
+                raise deadline.DeadlineExceeded(f"{self.name}:{tool_name} timed out after {timeout:.1f}s") from None
+        content = [
+            c.model_copy(update={"text": governor.govern(tool_name, c.text)}) if c.type == "text" else c
+            for c in result.content
+        ]
+        if all(a is b or a.text == b.text for a, b in zip(content, result.content)):
+            return result
+        # structured content would carry the untruncated result along
+        return result.model_copy(update={"content": content, "structured_content": None})
@@ -0,0 +1,137 @@
+# model_tiers.py
+import functools
+import json
+import os
+import random
+import threading
+from collections import defaultdict, deque
+from typing import Optional
+
+from core import metrics
+from core.logger import get_logger
+
+log = get_logger("model_tiers")
+
+MODEL_SELECTED = metrics.Counter("llm_model_selected_total", "LLM requests routed to each model, by agent")
+
+# routing and thin tool wrappers get the fast tier; drafting and scheduling the large one
+DEFAULT_AGENT_TIERS = {
+    "CoordinatorAgent": "fast",
+    "DayToDayAgent": "fast",
+    "LocalFilesAgent": "fast",
+    "TodoAgent": "fast",
+    "GoogleCalendarAgent": "large",
+    "GoogleServicesAgent": "large",
+}
+
+CONFIG_PATH = os.getenv("MODEL_CONFIG_PATH", os.path.join(os.path.dirname(__file__), "..", "model_config.json"))
+
+
+class ModelStats:
+    """Rolling latency and error rate per model, shared by every agent using it."""
+
+    def __init__(self, window: int = 100):
+        self._samples: dict[Optional[str], deque] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+
+    def record(self, model: Optional[str], seconds: float, ok: bool):
+        with self._lock:
+            self._samples[model].append((seconds, ok))
+
+    def count(self, model: Optional[str]) -> int:
+        return len(self._samples.get(model, ()))
+
+    def snapshot(self, model: Optional[str]) -> dict:
+        with self._lock:
+            samples = list(self._samples.get(model, ()))
+        if not samples:
+            return {"samples": 0, "mean_seconds": None, "error_rate": None}
+        return {
+            "samples": len(samples),
+            "mean_seconds": sum(s for s, _ in samples) / len(samples),
+            "error_rate": sum(1 for _, ok in samples if not ok) / len(samples),
+        }
+
+    def cost(self, model: Optional[str]) -> float:
+        """Lower is better: mean latency, inflated steeply by the error rate."""
+        s = self.snapshot(model)
+        if not s["samples"]:
+            return 0.0
+        return s["mean_seconds"] * (1 + 10 * s["error_rate"])
+
+
+STATS = ModelStats()
+
+
+class ModelSelector:
+    """
+    Picks the model for each request from a tier's candidates.
+
+    Static mode always uses the first candidate. Adaptive mode first gives
+    every candidate `min_samples` requests, then sends traffic to the one with
+    the lowest rolling cost while still exploring the others `explore` of the time.
+    """
+
+    def __init__(self, candidates: list[Optional[str]], adaptive: bool = False,
+                 explore: float = 0.05, min_samples: int = 10, stats: ModelStats = STATS):
+        self.candidates = candidates or [None]
+        self.adaptive = adaptive and len(self.candidates) > 1
+        self.explore = explore
+        self.min_samples = min_samples
+        self.stats = stats
+
+    @property
+    def primary(self) -> Optional[str]:
+        return self.candidates[0]
+
+    def choose(self) -> Optional[str]:
+        if not self.adaptive:
+            return self.primary
+        untried = [m for m in self.candidates if self.stats.count(m) < self.min_samples]
+        if untried:
+            return min(untried, key=self.stats.count)
+        if random.random() < self.explore:
+            return random.choice(self.candidates)
+        return min(self.candidates, key=self.stats.cost)
+
+
+def _split(value: Optional[str]) -> list[str]:
+    return [m.strip() for m in (value or "").split(",") if m.strip()]
+
+
+@functools.lru_cache(maxsize=1)
+def load_config(path: str = CONFIG_PATH) -> dict:
+    """
+    Tier settings: MODEL_CONFIG_PATH (JSON, see model_config.example.json) over
+    LLM_MODEL_FAST / LLM_MODEL_LARGE (comma-separated candidates, default LLM_MODEL)
+    and MODEL_SELECTION (`static` or `adaptive`).
+    """
+    default = _split(os.getenv("LLM_MODEL"))
+    config = {
+        "tiers": {
+            "fast": _split(os.getenv("LLM_MODEL_FAST")) or default,
+            "large": _split(os.getenv("LLM_MODEL_LARGE")) or default,
+        },
+        "agents": dict(DEFAULT_AGENT_TIERS),
+        "selection": os.getenv("MODEL_SELECTION", "static").lower(),
+    }
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            overrides = json.load(f)
+        config["tiers"].update(overrides.get("tiers", {}))
+        config["agents"].update(overrides.get("agents", {}))
+        config["selection"] = overrides.get("selection", config["selection"])
+        log.info("Loaded model tiers from %s", path)
+    return config
+
+
+def selector_for(agent_name: str, config: Optional[dict] = None) -> ModelSelector:
+    """ModelSelector for `agent_name`'s tier; an unknown agent or tier uses the default model."""
+    config = config or load_config()
+    tier = config["agents"].get(agent_name, "large")
+    candidates = config["tiers"].get(tier)
+    if candidates is None:
+        log.warning("%s: unknown model tier %r, using the default model", agent_name, tier)
+    if isinstance(candidates, str):
+        candidates = [candidates]
+    return ModelSelector(list(candidates or []), adaptive=config["selection"] == "adaptive")
@@ -0,0 +1,280 @@
+# profiler.py
+"""
+Opt-in sampling profiler for the server process.
+
+While a profile is being taken, a background thread reads every thread's
+stack (sys._current_frames) each PROFILE_INTERVAL_MS. On the event loop a
+stack belongs to the request whose task is running (tasks are tagged as they
+are created); in a worker thread, to the request whose context the executor
+work item runs in. Each stack is prefixed with the agent run's span chain
+(agent:…;function:…). Samples weigh
+the wall time and the thread's CPU time since the previous sample, in
+microseconds, and come out in collapsed-stack format for flamegraph tools.
+
+No thread runs and nothing is recorded while no profile is active.
+"""
+import asyncio
+import concurrent.futures.thread
+import contextvars
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+from agents.tracing.scope import _current_span  # read from other threads' contexts, so not via Scope
+
+from core import metrics
+from core.logger import get_logger
+
+log = get_logger("profiler")
+
+INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "10")) / 1000
+MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+MAX_DEPTH = 128
+
+PROFILES = metrics.Counter("profiles_total", "Profiles taken, by scope (request or process)")
+
+_profile: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+
+# the frame at the base of an executor job, whose work item carries the context it runs in
+_WORK_ITEM_RUN = concurrent.futures.thread._WorkItem.run.__code__
+
+
+class Profile:
+    """Samples for one request (`scope="request"`) or for the whole process."""
+
+    def __init__(self, scope: str):
+        self.scope = scope
+        self.wall: Counter = Counter()
+        self.cpu: Counter = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self.seconds: Optional[float] = None
+
+    def add(self, stack: list[str], wall_us: int, cpu_us: int):
+        key = ";".join(stack)
+        self.wall[key] += wall_us
+        if cpu_us:
+            self.cpu[key] += cpu_us
+        self.samples += 1
+
+    def collapsed(self, mode: str = "wall") -> str:
+        """`frame;frame;… weight` lines (weights in microseconds), heaviest first."""
+        counts = self.cpu if mode == "cpu" else self.wall
+        return "\n".join(f"{stack} {us}" for stack, us in counts.most_common())
+
+    def summary(self) -> dict:
+        return {
+            "seconds": round(self.seconds if self.seconds is not None else time.perf_counter() - self.started, 3),
+            "samples": self.samples,
+            "interval_ms": INTERVAL * 1000,
+            "wall": self.collapsed("wall"),
+            "cpu": self.collapsed("cpu"),
+        }
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    for root in sys.path:
+        if root and path.startswith(root + os.sep):
+            path = path[len(root) + 1:]
+            break
+    return f"{code.co_qualname} ({path})"
+
+
+def _context_of(frame) -> Optional[contextvars.Context]:
+    work_item = frame.f_locals.get("self")
+    run = getattr(getattr(work_item, "fn", None), "func", None)  # to_thread submits partial(context.run, func, …)
+    context = getattr(run, "__self__", None)
+    return context if isinstance(context, contextvars.Context) else None
+
+
+def _walk(frame) -> tuple[list[str], Optional[contextvars.Context]]:
+    """(frame labels root first, the context of the executor job running them, if any)."""
+    stack, context = [], None
+    while frame is not None and len(stack) < MAX_DEPTH:
+        if context is None and frame.f_code is _WORK_ITEM_RUN:
+            context = _context_of(frame)
+        stack.append(_frame_label(frame))
+        frame = frame.f_back
+    return stack[::-1], context
+
+
+class Sampler:
+    def __init__(self, interval: float = INTERVAL):
+        self.interval = interval
+        self._profiles: set[Profile] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._spans: dict[str, tuple[Optional[str], str]] = {}  # span_id -> (parent_id, label)
+        self._tasks: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()  # task -> request Profile
+        self._task_spans: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()  # task -> current span_id
+        self._loops: dict[int, asyncio.AbstractEventLoop] = {}  # thread ident -> event loop it runs
+        self._cpu: dict[int, tuple[int, float]] = {}  # thread ident -> (clock id, last CPU time)
+        self.active = False
+
+    def start(self, profile: Profile):
+        with self._lock:
+            self._profiles.add(profile)
+            self.active = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+                self._thread.start()
+
+    def stop(self, profile: Profile):
+        with self._lock:
+            self._profiles.discard(profile)
+            profile.seconds = time.perf_counter() - profile.started
+
+    def track(self, task: asyncio.Task, profile: Profile):
+        """Attribute `task`, and the tasks it creates while profiling, to `profile`."""
+        loop = self.on_loop(task.get_loop())
+        self._tasks[task] = profile
+        if loop.get_task_factory() is None:
+            loop.set_task_factory(self._new_task)
+
+    def on_loop(self, loop: asyncio.AbstractEventLoop) -> asyncio.AbstractEventLoop:
+        """Note that the calling thread runs `loop`, so its samples are matched to the running task."""
+        self._loops[threading.get_ident()] = loop
+        return loop
+
+    def untrack(self, task: asyncio.Task):
+        self._tasks.pop(task, None)
+        if not any(p.scope == "request" for p in self._profiles):
+            loop = task.get_loop()
+            if loop.get_task_factory() == self._new_task:
+                loop.set_task_factory(None)
+
+    def _new_task(self, loop, coro, **kwargs):
+        task = asyncio.Task(coro, loop=loop, **kwargs)
+        context = kwargs.get("context")
+        profile = context.get(_profile, None) if context is not None else _profile.get()
+        if profile is not None:
+            self._tasks[task] = profile
+        return task
+
+    def span_started(self, span):
+        data = span.span_data
+        name = getattr(data, "name", None) or getattr(data, "to_agent", None)
+        self._spans[span.span_id] = (span.parent_id, f"{data.type}:{name}" if name else data.type)
+        self._set_task_span(span.span_id)
+
+    def span_ended(self, span):
+        parent = self._spans.pop(span.span_id, (span.parent_id, None))[0]
+        self._set_task_span(parent)
+
+    def _set_task_span(self, span_id: Optional[str]):
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:  # not on an event loop (a sync tool's span)
+            return
+        if task is not None:
+            self._task_spans[task] = span_id
+
+    def _span_path(self, span_id: Optional[str]) -> list[str]:
+        path = []
+        while span_id in self._spans and len(path) < 32:
+            span_id, label = self._spans[span_id]
+            path.append(label)
+        return path[::-1]
+
+    def _owner(self, ident: int, context: Optional[contextvars.Context]) -> tuple[Optional[Profile], list[str]]:
+        """The request profile a thread's current work belongs to, and its span chain."""
+        if context is not None:
+            span = context.get(_current_span, None)
+            return context.get(_profile, None), self._span_path(span.span_id if span else None)
+        loop = self._loops.get(ident)
+        task = asyncio.current_task(loop) if loop is not None and not loop.is_closed() else None
+        if task is None:
+            return None, []
+        return self._tasks.get(task), self._span_path(self._task_spans.get(task))
+
+    def _cpu_delta(self, ident: int) -> int:
+        try:
+            clock, last = self._cpu.get(ident) or (time.pthread_getcpuclockid(ident), None)
+            now = time.clock_gettime(clock)
+        except (AttributeError, OSError):  # no per-thread CPU clocks on this platform, or the thread is gone
+            return 0
+        self._cpu[ident] = (clock, now)
+        return 0 if last is None else int((now - last) * 1e6)
+
+    def _run(self):
+        own = threading.get_ident()
+        last = time.perf_counter()
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                profiles = list(self._profiles)
+                if not profiles:
+                    self.active = False
+                    self._thread = None
+                    self._spans.clear()
+                    self._task_spans.clear()
+                    self._cpu.clear()
+                    return
+            now = time.perf_counter()
+            try:
+                self._sample(profiles, own, int((now - last) * 1e6))
+            except Exception as e:  # a thread that exits mid-walk, etc.: skip the sample
+                log.debug("Profiler sample skipped: %s", e)
+            last = now
+
+    def _sample(self, profiles: list[Profile], own: int, wall_us: int):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        whole = [p for p in profiles if p.scope == "process"]
+        seen = set()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack, context = _walk(frame)
+            cpu_us = self._cpu_delta(ident)
+            request, spans = self._owner(ident, context)
+            if request is None and not whole:
+                continue
+            if request is not None and request in profiles:
+                request.add(spans + stack, wall_us, cpu_us)
+                seen.add(request)
+            for profile in whole:
+                profile.add([f"thread:{names.get(ident, ident)}"] + spans + stack, wall_us, cpu_us)
+        for profile in profiles:
+            if profile.scope == "request" and profile not in seen:
+                # the request is waiting on I/O (an LLM call, an MCP round trip) with no code running
+                profile.add(["(waiting)"], wall_us, 0)
+
+
+sampler = Sampler()
+
+
+@contextmanager
+def profiling():
+    """Profile the block (the code it runs in tasks and worker threads included) as one request."""
+    profile = Profile("request")
+    task = asyncio.current_task()
+    token = _profile.set(profile)
+    PROFILES.inc(scope="request")
+    sampler.start(profile)
+    sampler.track(task, profile)
+    try:
+        yield profile
+    finally:
+        sampler.stop(profile)
+        sampler.untrack(task)
+        _profile.reset(token)
+
+
+async def profile_process(seconds: float) -> Profile:
+    """Profile every thread of the process for `seconds` (capped at PROFILE_MAX_SECONDS)."""
+    profile = Profile("process")
+    PROFILES.inc(scope="process")
+    sampler.start(profile)
+    sampler.on_loop(asyncio.get_running_loop())
+    try:
+        await asyncio.sleep(min(seconds, MAX_SECONDS))
+    finally:
+        sampler.stop(profile)
+    return profile
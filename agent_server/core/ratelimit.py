@@ -0,0 +1,279 @@
+# ratelimit.py
+"""
+Token buckets in front of the upstream APIs (OpenWeather, Google, the to-do
+app), one per upstream and one per user of each upstream.
+
+A call reserves a token from both buckets (a batch request, one per call it
+carries). When none is left it waits for the next one, briefly: no longer
+than RATE_LIMIT_MAX_WAIT or the request's remaining deadline, and otherwise
+fails fast with RateLimited instead of letting the provider answer 429. A 429
+that gets through anyway pauses the upstream for its Retry-After.
+
+Buckets live in the cache's backend, so with CACHE_BACKEND=sqlite every
+worker and the MCP subprocess share the provider's quota.
+"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from core import deadline, metrics
+from core.identity import current_user_id
+from core.logger import get_logger
+
+log = get_logger("ratelimit")
+
+THROTTLED = metrics.Counter("ratelimit_throttled_total", "Upstream calls held back by a rate limit, by upstream, scope and outcome")
+WAIT_SECONDS = metrics.Histogram("ratelimit_wait_seconds", "Time upstream calls waited for a rate-limit token")
+UPSTREAM_429 = metrics.Counter("ratelimit_upstream_429_total", "429 (Too Many Requests) answers from upstreams, by upstream")
+
+# upstream -> (overall limit, per-user limit), each "count/period[,burst]"; RATE_LIMIT_<UPSTREAM>[_PER_USER] override
+DEFAULT_LIMITS = {
+    "openweather": ("60/min", "30/min"),  # the free plan's quota
+    "google": ("20/s", "10/s"),  # Calendar/Gmail per-user quotas are ~600/min
+    "todo": ("10/s", "2/s"),
+}
+MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "2"))
+RETRY_AFTER_DEFAULT = 5.0  # when a 429 doesn't say
+PERIODS = {"s": 1, "sec": 1, "min": 60, "h": 3600, "hour": 3600, "day": 86400}
+
+
+class RateLimited(RuntimeError):
+    """An upstream call that would have waited too long for its rate limit."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} rate limit reached, retry in {retry_after:.1f}s")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+class Limit:
+    """`rate` tokens per second, holding at most `burst`."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+
+    @classmethod
+    def parse(cls, spec: str) -> Optional["Limit"]:
+        """"60/min", "5/s", "1000/day", "10/30" (per 30 seconds), optionally ",burst"; None for "off"."""
+        spec = spec.strip().lower()
+        if spec in ("", "0", "off", "none"):
+            return None
+        match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*/\s*([a-z]+|\d+(?:\.\d+)?)\s*(?:,\s*(\d+(?:\.\d+)?))?", spec)
+        if not match:
+            raise ValueError(f"Invalid rate limit {spec!r}, expected e.g. '60/min' or '5/s,10'")
+        count, period, burst = match.groups()
+        seconds = PERIODS.get(period) or float(period)
+        return cls(float(count) / seconds, float(burst or count))
+
+
+class MemoryBuckets:
+    """Bucket state private to this process."""
+
+    def __init__(self):
+        self._state: dict[str, tuple[float, float, float]] = {}  # key -> (tokens, updated_at, blocked_until)
+        self._lock = threading.Lock()
+
+    def reserve(self, key: str, limit: Limit, max_wait: float, cost: float = 1) -> float:
+        """
+        Take `cost` tokens from `key` if they are available within `max_wait`
+        seconds (going into debt for them) and return the wait; otherwise take
+        nothing and return the wait it would have needed.
+        """
+        with self._lock:
+            now = time.time()
+            tokens, updated, blocked = self._state.get(key, (limit.burst, now, 0.0))
+            tokens, wait = _refill(limit, tokens, updated, blocked, now, cost)
+            if wait <= max_wait:
+                self._state[key] = (tokens - cost, now, blocked)
+            return wait
+
+    def refund(self, key: str, cost: float = 1):
+        with self._lock:
+            if key in self._state:
+                tokens, updated, blocked = self._state[key]
+                self._state[key] = (tokens + cost, updated, blocked)
+
+    def block(self, key: str, until: float, limit: Optional[Limit] = None):
+        """Pause `key` until `until`; a bucket it creates starts full, so it doesn't wait longer than that."""
+        with self._lock:
+            now = time.time()
+            tokens, updated, blocked = self._state.get(key, (limit.burst if limit else 0.0, now, 0.0))
+            self._state[key] = (tokens, updated, max(blocked, until))
+
+    def blocked(self, key: str) -> float:
+        """Seconds left of a pause on `key` (for upstreams without a limit, whose bucket is never reserved)."""
+        with self._lock:
+            state = self._state.get(key)
+            return max(0.0, state[2] - time.time()) if state else 0.0
+
+
+class SQLiteBuckets(MemoryBuckets):
+    """Bucket state shared by every process on the host, in the cache's SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_buckets ("
+                " key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL, blocked_until REAL NOT NULL)"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def _update(self, key: str, change):
+        """Apply `change(tokens, updated, blocked, now) -> (new state or None, result)` atomically."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated_at, blocked_until FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            state, result = change(row, now)
+            if state is not None:
+                conn.execute("INSERT OR REPLACE INTO rate_buckets VALUES (?, ?, ?, ?)", (key, *state))
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def reserve(self, key, limit, max_wait, cost=1):
+        def change(row, now):
+            tokens, updated, blocked = row or (limit.burst, now, 0.0)
+            tokens, wait = _refill(limit, tokens, updated, blocked, now, cost)
+            return ((tokens - cost, now, blocked) if wait <= max_wait else None), wait
+        return self._update(key, change)
+
+    def refund(self, key, cost=1):
+        self._update(key, lambda row, now: (((row[0] + cost, row[1], row[2]) if row else None), None))
+
+    def block(self, key, until, limit=None):
+        def change(row, now):
+            tokens, updated, blocked = row or (limit.burst if limit else 0.0, now, 0.0)
+            return (tokens, updated, max(blocked, until)), None
+        self._update(key, change)
+
+    def blocked(self, key):
+        row = self._conn().execute("SELECT blocked_until FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+        return max(0.0, row[0] - time.time()) if row else 0.0
+
+
+def _refill(limit: Limit, tokens: float, updated: float, blocked: float, now: float,
+            cost: float = 1) -> tuple[float, float]:
+    """
+    (tokens after refilling since `updated`, seconds until `cost` of them are
+    free, counting any Retry-After pause). A cost above the burst only waits
+    for a full bucket; the rest is debt that later calls wait out.
+    """
+    tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+    needed = min(cost, limit.burst)
+    wait = 0.0 if tokens >= needed else (needed - tokens) / limit.rate
+    return tokens, max(wait, blocked - now)
+
+
+class RateLimiter:
+    def __init__(self, limits: dict[str, tuple[Optional[Limit], Optional[Limit]]], buckets: MemoryBuckets,
+                 max_wait: float = MAX_WAIT):
+        self.limits = limits
+        self.buckets = buckets
+        self.max_wait = max_wait
+
+    def acquire(self, upstream: str, cost: int = 1):
+        """
+        Wait (briefly) for `cost` tokens (one per upstream call; a batch request
+        carries several) for `upstream` on behalf of the current user; raises RateLimited.
+        """
+        overall, per_user = self.limits.get(upstream, (None, None))
+        user_id = current_user_id()
+        scopes = [("all", upstream, overall)]
+        if user_id:
+            scopes.append(("user", f"{upstream}:user:{user_id}", per_user))
+        max_wait = min(self.max_wait, deadline.remaining() or self.max_wait)
+        waited, reserved = 0.0, []
+        for scope, key, limit in scopes:
+            if limit is None:
+                if scope != "all":
+                    continue
+                wait = self.buckets.blocked(key)  # no limit, but a 429's Retry-After still applies
+            else:
+                wait = self.buckets.reserve(key, limit, max_wait, cost)
+            if wait > max_wait:
+                for taken in reserved:
+                    self.buckets.refund(taken, cost)
+                THROTTLED.inc(upstream=upstream, scope=scope, outcome="rejected")
+                log.warning("🚦 %s rate limit (%s) reached, rejecting (user_id=%r, %.1fs to wait)", upstream, scope, user_id, wait)
+                raise RateLimited(upstream, wait)
+            if limit is not None:
+                reserved.append(key)
+            if wait > 0:
+                THROTTLED.inc(upstream=upstream, scope=scope, outcome="delayed")
+            waited = max(waited, wait)
+        if waited > 0:
+            WAIT_SECONDS.observe(waited, upstream=upstream)
+            time.sleep(waited)
+
+    def backoff(self, upstream: str, retry_after: Optional[float]):
+        """Pause every caller of `upstream` after it answered 429."""
+        seconds = retry_after if retry_after is not None else RETRY_AFTER_DEFAULT
+        UPSTREAM_429.inc(upstream=upstream)
+        log.warning("🚦 %s answered 429, pausing it for %.1fs", upstream, seconds)
+        self.buckets.block(upstream, time.time() + seconds, self.limits.get(upstream, (None, None))[0])
+
+
+def retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header (delta-seconds or HTTP date), None if absent or unparseable."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def from_env() -> RateLimiter:
+    """Limits from RATE_LIMIT_<UPSTREAM> / RATE_LIMIT_<UPSTREAM>_PER_USER; buckets on CACHE_BACKEND's storage."""
+    limits = {}
+    for upstream, (overall, per_user) in DEFAULT_LIMITS.items():
+        name = f"RATE_LIMIT_{upstream.upper()}"
+        limits[upstream] = (Limit.parse(os.getenv(name, overall)), Limit.parse(os.getenv(f"{name}_PER_USER", per_user)))
+    if os.getenv("CACHE_BACKEND", "memory").lower() == "sqlite":
+        path = os.getenv("CACHE_PATH", os.path.join(os.path.dirname(__file__), "..", ".cache", "cache.sqlite"))
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        buckets = SQLiteBuckets(path)
+    else:
+        buckets = MemoryBuckets()
+    return RateLimiter(limits, buckets)
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def _get() -> RateLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = from_env()
+        return _limiter
+
+
+def acquire(upstream: str, cost: int = 1):
+    _get().acquire(upstream, cost)
+
+
+def backoff(upstream: str, retry_after_header: Optional[str] = None):
+    _get().backoff(upstream, retry_after(retry_after_header))
@@ -0,0 +1,93 @@
+# sessions.py
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+
+class SessionMismatch(Exception):
+    """Raised when a session id is reused by a different user."""
+
+
+class ChatSession:
+    """
+    Conversation state for one chat, kept across messages and reconnects.
+
+    `history` is the SDK input list of the previous turns (`RunResult.to_input_list()`),
+    trimmed to the most recent `max_items` items at turn boundaries so a tool
+    call is never separated from its output. `lock` serializes turns.
+    """
+
+    def __init__(self, session_id: str, user_id: Optional[str], max_items: int = 200):
+        self.id = session_id
+        self.user_id = user_id
+        self.max_items = max_items
+        self.history: list = []
+        self.turns = 0
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def input_for(self, message: str) -> list:
+        return self.history + [{"role": "user", "content": message}]
+
+    def record(self, items: list):
+        """Keep the full input list of a finished turn as the history for the next one."""
+        self.turns += 1
+        if len(items) > self.max_items:
+            starts = [i for i, item in enumerate(items) if isinstance(item, dict) and item.get("role") == "user"]
+            fitting = [i for i in starts if len(items) - i <= self.max_items]
+            # a single turn longer than the bound is kept whole
+            start = fitting[0] if fitting else (starts[-1] if starts else 0)
+            items = items[start:]
+        self.history = items
+
+
+class SessionStore:
+    """In-process LRU of chat sessions; sessions idle for `idle_seconds` are dropped."""
+
+    def __init__(self, max_sessions: int = 1000, idle_seconds: float = 3600, max_items: int = 200):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_items = max_items
+        self._sessions: OrderedDict[str, ChatSession] = OrderedDict()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_used >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def open(self, session_id: Optional[str], user_id: Optional[str]) -> ChatSession:
+        """The session `session_id` (resumed if still held), or a new one."""
+        self._expire()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is not None and session.user_id != user_id:
+            raise SessionMismatch("Session belongs to another user")
+        if session is None:
+            session = ChatSession(session_id or uuid.uuid4().hex, user_id, self.max_items)
+            self._sessions[session.id] = session
+        session.last_used = time.monotonic()
+        self._sessions.move_to_end(session.id)
+        self._expire()
+        return session
+
+    def touch(self, session: ChatSession):
+        session.last_used = time.monotonic()
+        if session.id in self._sessions:
+            self._sessions.move_to_end(session.id)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+def from_env() -> SessionStore:
+    """Build a session store from the WS_SESSION_* environment variables."""
+    return SessionStore(
+        max_sessions=int(os.getenv("WS_SESSION_MAX", "1000")),
+        idle_seconds=float(os.getenv("WS_SESSION_IDLE_SECONDS", "3600")),
+        max_items=int(os.getenv("WS_SESSION_MAX_ITEMS", "200")),
+    )
@@ -0,0 +1,25 @@
+# startup.py
+import time
+from contextlib import contextmanager
+
+# first imported at the top of server.py, so this approximates the start of app import
+_started = time.perf_counter()
+_phases: list[tuple[str, float]] = []
+
+
+@contextmanager
+def phase(name: str):
+    """Time one startup step (an import group, the MCP handshake, ...)."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases.append((name, time.perf_counter() - t0))
+
+
+def summary() -> dict:
+    """Per-phase durations and total time since server.py started importing, in ms."""
+    return {
+        "total_ms": round((time.perf_counter() - _started) * 1000, 1),
+        "phases_ms": {name: round(seconds * 1000, 1) for name, seconds in _phases},
+    }
@@ -0,0 +1,147 @@
+# timing.py
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from agents.tracing import TracingProcessor
+
+from core import metrics, profiler
+
+SPAN_SECONDS = metrics.Histogram(
+    "agent_span_seconds", "Duration of agent run spans (llm, handoff, function, mcp, agent)"
+)
+SPAN_ERRORS = metrics.Counter("agent_span_errors_total", "Agent run spans that ended with an error")
+LLM_TOKENS = metrics.Counter("llm_tokens_total", "LLM tokens used, by model and direction")
+
+_current: ContextVar[Optional["RequestTimings"]] = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Span timings collected for a single request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: list[dict] = []
+
+    def add(self, kind: str, name: str, seconds: float, **extra):
+        self.spans.append({"kind": kind, "name": name, "ms": round(seconds * 1000, 1), **extra})
+
+    def summary(self) -> dict:
+        by_kind: dict[str, dict] = {}
+        for s in self.spans:
+            agg = by_kind.setdefault(s["kind"], {"count": 0, "ms": 0.0})
+            agg["count"] += 1
+            agg["ms"] = round(agg["ms"] + s["ms"], 1)
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "by_kind": by_kind,
+            "spans": self.spans,
+        }
+
+
+@contextmanager
+def track_request():
+    """Collect span timings for everything run inside the block (including agent runs)."""
+    timings = RequestTimings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def record(kind: str, name: str, seconds: float, error: bool = False, **extra):
+    """Record one span in the metrics and, if a request is being tracked, its breakdown."""
+    SPAN_SECONDS.observe(seconds, kind=kind, name=name)
+    if error:
+        SPAN_ERRORS.inc(kind=kind, name=name)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(kind, name, seconds, **extra)
+
+
+@contextmanager
+def span(kind: str, name: str):
+    """Time a block that the Agents SDK doesn't trace on its own (e.g. an MCP round trip)."""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        record(kind, name, time.perf_counter() - started, error=error)
+
+
+def _describe(span_data) -> tuple[str, str, dict]:
+    """Map SDK span data to (kind, name, extra fields)."""
+    kind = span_data.type
+    if kind == "generation":
+        usage = span_data.usage or {}
+        return "llm", span_data.model or "unknown", _tokens(span_data.model, usage)
+    if kind == "response":
+        response = span_data.response
+        usage = getattr(response, "usage", None)
+        model = getattr(response, "model", None) or "unknown"
+        if usage is not None:
+            return "llm", model, _tokens(model, {"input_tokens": usage.input_tokens,
+                                                 "output_tokens": usage.output_tokens})
+        return "llm", model, {}
+    if kind == "handoff":
+        return "handoff", f"{span_data.from_agent}->{span_data.to_agent}", {}
+    if kind == "mcp_tools":
+        return "mcp", f"{span_data.server}:tools/list", {}
+    if kind == "turn":
+        return kind, getattr(span_data, "agent_name", None) or kind, {}
+    return kind, getattr(span_data, "name", None) or kind, {}
+
+
+def _tokens(model: Optional[str], usage: dict) -> dict:
+    extra = {}
+    for direction in ("input", "output"):
+        n = usage.get(f"{direction}_tokens")
+        if n:
+            LLM_TOKENS.inc(n, model=model or "unknown", direction=direction)
+            extra[f"{direction}_tokens"] = n
+    return extra
+
+
+class SpanTimer(TracingProcessor):
+    """
+    Tracing processor that turns Agents SDK spans into latency metrics.
+
+    Span callbacks run inside the agent run's task, so the request being
+    tracked by `track_request` is visible through the context variable. While
+    a profile is being taken, spans also name the stacks it samples.
+    """
+
+    def __init__(self):
+        self._started: dict[str, float] = {}
+
+    def on_trace_start(self, trace):
+        pass
+
+    def on_trace_end(self, trace):
+        pass
+
+    def on_span_start(self, span):
+        self._started[span.span_id] = time.perf_counter()
+        if profiler.sampler.active:
+            profiler.sampler.span_started(span)
+
+    def on_span_end(self, span):
+        if profiler.sampler.active:
+            profiler.sampler.span_ended(span)
+        started = self._started.pop(span.span_id, None)
+        if started is None:
+            return
+        kind, name, extra = _describe(span.span_data)
+        record(kind, name, time.perf_counter() - started, error=span.error is not None, **extra)
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self):
+        pass
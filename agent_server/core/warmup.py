@@ -0,0 +1,88 @@
+# warmup.py
+import asyncio
+import json
+import os
+import time
+from typing import Awaitable, Callable, Optional
+
+from core.logger import get_logger
+
+log = get_logger("warmup")
+
+ALL_STEPS = ("mcp", "google", "llm", "geocode", "replay")
+DEFAULT_CITIES = "London,New York,Paris,Berlin,Madrid,Lisbon,Rome,Tokyo"
+
+
+class Warmup:
+    """
+    Startup steps that pay cold costs (handshakes, client builds, cache fills)
+    before real traffic does. Steps run concurrently, each bounded by `timeout`;
+    a failed step is logged and doesn't hold back readiness, since the instance
+    still serves, only slower.
+    """
+
+    def __init__(self, steps: Optional[set] = None, timeout: float = 60.0):
+        self.enabled = set(ALL_STEPS if steps is None else steps)
+        self.timeout = timeout
+        self._steps: dict[str, Callable[[], Awaitable]] = {}
+        self.results: dict[str, dict] = {}
+        self.ready = False
+        self.total_ms: Optional[float] = None
+
+    def step(self, name: str, fn: Callable[[], Awaitable]):
+        """Register `fn` (an async callable) to run as step `name`, if that step is enabled."""
+        if name in self.enabled:
+            self._steps[name] = fn
+
+    async def _run_step(self, name: str, fn: Callable[[], Awaitable]):
+        started = time.perf_counter()
+        try:
+            detail = await asyncio.wait_for(fn(), self.timeout)
+            status = "ok" if detail is not False else "skipped"
+        except Exception as e:
+            log.warning("Warmup step %s failed: %s", name, e)
+            status, detail = "failed", str(e)
+        self.results[name] = {
+            "status": status,
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+            **({"detail": detail} if isinstance(detail, str) else {}),
+        }
+
+    async def run(self):
+        """Run every registered step, then mark the instance ready."""
+        started = time.perf_counter()
+        await asyncio.gather(*(self._run_step(name, fn) for name, fn in self._steps.items()))
+        self.total_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.ready = True
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "total_ms": self.total_ms, "steps": self.results}
+
+
+def cities() -> list[str]:
+    """Cities whose geocodes (and current weather) are fetched at startup (WARMUP_CITIES)."""
+    return [c.strip() for c in os.getenv("WARMUP_CITIES", DEFAULT_CITIES).split(",") if c.strip()]
+
+
+def load_queries(path: Optional[str] = None) -> list[dict]:
+    """
+    Popular queries to replay at startup from WARMUP_QUERIES_PATH: a JSON list
+    of messages or of {"message": ..., "user_id": ...} objects (see
+    warmup_queries.example.json). Replaying runs the full agent graph, so it
+    costs LLM tokens; nothing is replayed unless a file is configured.
+    """
+    path = path or os.getenv("WARMUP_QUERIES_PATH")
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as f:
+        queries = json.load(f)
+    return [q if isinstance(q, dict) else {"message": q} for q in queries]
+
+
+def from_env() -> Warmup:
+    """Build a warmup from WARMUP_STEPS (comma-separated, `none` to disable) and WARMUP_TIMEOUT."""
+    steps = os.getenv("WARMUP_STEPS", ",".join(ALL_STEPS)).lower()
+    enabled = set() if steps == "none" else {s.strip() for s in steps.split(",") if s.strip()}
+    for unknown in enabled - set(ALL_STEPS):
+        log.warning("Unknown warmup step %r", unknown)
+    return Warmup(enabled, timeout=float(os.getenv("WARMUP_TIMEOUT", "60")))
@@ -1,7 +1,13 @@
 #!/usr/bin/env python3
-import sys, json
+import sys, json, os
+# make the project root importable (for tools/ and core/)
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # 1) import your business logic functions
 from tools.my_service import fn_one, fn_two, fn_three
+from core.logger import get_logger
+
+# logs go to stderr through a background queue; stdout is reserved for JSON-RPC
+log = get_logger("mcp.my_service")
 
 # 2) register them here with JSON‑Schema
 TOOLS = {
@@ -15,10 +21,10 @@ TOOLS = {
 }
 
 # helper to write JSON lines
-def send(id_, *, result=None, error=None):
+def send(id_, *, result=None, error=None, code=-32000):
     resp = { "jsonrpc":"2.0", "id": id_ }
     if (error):
-      resp["error"] = { "message": str(error) }
+      resp["error"] = { "code": code, "message": str(error) }
     else:
       resp["result"] = result
     sys.stdout.write(json.dumps(resp) + "\n")
@@ -29,6 +35,7 @@ for line in sys.stdin:
     try:
       req = json.loads(line)
     except:
+      log.warning("Skipping invalid JSON")
       continue
 
     mth   = req.get("method")
@@ -44,7 +51,8 @@ for line in sys.stdin:
             "name":   name,
             "description": meta["description"],
             "inputSchema": meta["inputSchema"],
-            "outputSchema": meta["outputSchema"]
+            # MCP only allows object output schemas; plain-text tools omit it
+            **({ "outputSchema": meta["outputSchema"] } if meta["outputSchema"].get("type") == "object" else {})
           }
           for name,meta in TOOLS.items()
         ]
@@ -59,9 +67,10 @@ for line in sys.stdin:
         result = fn(**args)
         send(id_, result={ "content": [{ "type":"text", "text": result }] })
       except Exception as e:
+        log.exception("Tool %s failed", name)
         send(id_, error=str(e))
     elif mth == "shutdown":
       send(id_, result=None)
       sys.exit(0)
     else:
-      send(id_, error=f"Unknown method '{mth}'")
+      send(id_, error=f"Unknown method '{mth}'", code=-32601)
@@ -17,10 +17,14 @@ from tools.weather import (
     get_weather,
     get_hourly_forecast,
     get_daily_forecast,
+    get_weather_batch,
+    summarize_forecast,
 )
+from core import deadline
+from core.identity import acting_as
+from core.logger import get_logger, sampled
 
-def log(msg: str):
-    print(f"[MCP] {msg}", file=sys.stderr, flush=True)
+log = get_logger("mcp.weather")
 
 # ----------------------------------------------------------------------
 # tool registry
@@ -52,22 +56,48 @@ TOOLS = {
         "outputSchema": {"type": "string"},
         "func": get_daily_forecast,
     },
+    "summarize_forecast": {
+        "description": "Summary of the hourly forecast between from_hour and to_hour hours from now "
+                       "(0-48): temperature/wind/humidity ranges, rain hours and total, and the best "
+                       "outdoor_hours-long window to be outside. Prefer it over get_hourly_forecast.",
+        "inputSchema":  {"type": "object",
+                         "properties": {"city":          {"type": "string"},
+                                        "from_hour":     {"type": "integer"},
+                                        "to_hour":       {"type": "integer"},
+                                        "outdoor_hours": {"type": "integer"}},
+                         "required": ["city"]},
+        "outputSchema": {"type": "string"},
+        "func": summarize_forecast,
+    },
+    "get_weather_batch": {
+        "description": "Compare several cities at once: current weather, an hourly "
+                       "summary (up to 48h) and/or daily forecast (up to 7 days) in one table",
+        "inputSchema":  {"type": "object",
+                         "properties": {"cities":       {"type": "array",
+                                                         "items": {"type": "string"}},
+                                        "current":      {"type": "boolean"},
+                                        "hourly_hours": {"type": "integer"},
+                                        "daily_days":   {"type": "integer"}},
+                         "required": ["cities"]},
+        "outputSchema": {"type": "string"},
+        "func": get_weather_batch,
+    },
 }
 
 # ----------------------------------------------------------------------
 # helper to send a JSON‑RPC response
 # ----------------------------------------------------------------------
-def send(id_, *, result=None, error=None):
+def send(id_, *, result=None, error=None, code=-32000):
     resp = {"jsonrpc": "2.0", "id": id_}
     if error is not None:
-        resp["error"] = {"message": str(error)}
+        resp["error"] = {"code": code, "message": str(error)}
     else:
         resp["result"] = result
     sys.stdout.write(json.dumps(resp) + "\n")
     sys.stdout.flush()
-    log(f"→ {resp}")
+    log.debug("→ %s", resp, extra=sampled(0.1))
 
-log("weather_mcp started")
+log.info("weather_mcp started")
 
 # ----------------------------------------------------------------------
 # main JSON‑RPC loop
@@ -76,7 +106,7 @@ for line in sys.stdin:
     try:
         req = json.loads(line)
     except json.JSONDecodeError:
-        log("Skipping invalid JSON")
+        log.warning("Skipping invalid JSON")
         continue
 
     mth   = req.get("method")
@@ -92,7 +122,7 @@ for line in sys.stdin:
         })
 
     elif mth == "notifications/initialized":
-        log("Client initialised")
+        log.info("Client initialised")
 
     # ---- list tools --------------------------------------------------
     elif mth == "tools/list":
@@ -101,7 +131,9 @@ for line in sys.stdin:
                 {"name": n,
                  "description": t["description"],
                  "inputSchema":  t["inputSchema"],
-                 "outputSchema": t["outputSchema"]}
+                 # MCP only allows object output schemas; plain-text tools omit it
+                 **({"outputSchema": t["outputSchema"]}
+                    if t["outputSchema"].get("type") == "object" else {})}
                 for n, t in TOOLS.items()
             ]
         })
@@ -116,10 +148,15 @@ for line in sys.stdin:
             continue
 
         fn = getattr(TOOLS[name]["func"], "__wrapped__", TOOLS[name]["func"])
-        log(f"Executing {name}({args})")
+        log.debug("Executing %s(%s)", name, args)
+
+        # the client's remaining time budget bounds our upstream calls too, and
+        # its user counts against their own rate limits
+        meta = param.get("_meta") or {}
 
         try:
-            result_text = fn(**args)
+            with deadline.within(meta.get("timeout")), acting_as(meta.get("user_id")):
+                result_text = fn(**args)
             send(
                 id_,
                 result={
@@ -138,8 +175,8 @@ for line in sys.stdin:
     # ---- shutdown ----------------------------------------------------
     elif mth == "shutdown":
         send(id_, result={})
-        log("Shutdown")
+        log.info("Shutdown")
         sys.exit(0)
 
     else:
-        send(id_, error=f"Unknown method '{mth}'")
+        send(id_, error=f"Unknown method '{mth}'", code=-32601)
@@ -1,84 +1,69 @@
 # server.py
-import sys, os, asyncio
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, validator
-from typing import Optional
-from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+import sys, os, asyncio, json
+import time
+from datetime import datetime, timezone
+from core import startup
+
+with startup.phase("import_framework"):
+    from fastapi import FastAPI, HTTPException, Header, Request, WebSocket, WebSocketDisconnect
+    from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+    from pydantic import BaseModel, validator
+    from typing import Optional
+    from fastapi.middleware.cors import CORSMiddleware
+    from dotenv import load_dotenv
 
 # Windows subprocess workaround
 if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 load_dotenv()
-import openai
+with startup.phase("import_agents_sdk"):
+    import openai
+    from agents import RunHooks, Runner, add_trace_processor, set_default_openai_client, set_default_openai_api
 openai.api_key = os.getenv("OPENROUTER_API_KEY")
 openai.base_url = os.getenv("OPENROUTER_BASE_URL")
 
-from agents import Agent, Runner
-from agents.mcp.server import MCPServerStdio
-
-# stderr logger
-def log(msg: str):
-    print(f"[SERVER] {msg}", file=sys.stderr, flush=True)
-
-# 1) MCP server
-BASE_DIR = os.path.dirname(__file__)
-weather_mcp = MCPServerStdio(
-    params={
-        "command": sys.executable,
-        "args": [os.path.join(BASE_DIR, "mcp_servers", "weather_mcp.py")],
-        "cwd": BASE_DIR,
-    },
-    cache_tools_list=True
-)
+# The Agents SDK builds its own client; point it at OpenRouter (Chat Completions only)
+llm_client = None
+if os.getenv("OPENROUTER_BASE_URL"):
+    llm_client = openai.AsyncOpenAI(api_key=os.getenv("OPENROUTER_API_KEY"), base_url=os.getenv("OPENROUTER_BASE_URL"))
+    set_default_openai_client(llm_client, use_for_tracing=False)
+    set_default_openai_api("chat_completions")
 
-# 2) Agents
-from tools.local_files      import list_files, read_file
-from tools.drive            import list_drive_files, read_drive_file, upload_drive_file
-from tools.gmail            import list_recent_emails, read_emails, send_email
-from tools.calendar         import list_calendar_events, list_pending_invitations, respond_to_invitation, create_calendar_event
-from tools.weather          import get_weather, get_hourly_forecast, get_daily_forecast
-from tools.todo             import create_todo_task
-
-local_files_agent = Agent(
-    name="LocalFilesAgent",
-    instructions="Handles operations related to local file management.",
-    tools=[list_files, read_file]
-)
-google_services_agent = Agent(
-    name="GoogleServicesAgent",
-    instructions="Manages Google Drive and email (Gmail provider) operations. Don't ask for permission to access and exceute tasks. Just do it.",
-    tools=[list_drive_files, read_drive_file, upload_drive_file, list_recent_emails, read_emails, send_email]
-)
-google_calendar_agent = Agent(
-    name="GoogleCalendarAgent",
-    instructions="Manages Google Calendar operations, like checking schedules, responding to invites, and creating new events.",
-    tools=[list_calendar_events, list_pending_invitations, respond_to_invitation, create_calendar_event]
-)
-day_to_day_agent = Agent(
-    name="DayToDayAgent",
-    instructions="Takes care of day to day related requests like weather forecast, news, etc.",
-    mcp_servers=[weather_mcp]
-)
-todo_agent = Agent(
-    name="TodoAgent",
-    instructions="""
-    Handles task management using the user's to-do app.
-     When creating tasks:
-     1. Always include all required parameters (main_task, sub_task, category, importance, bucket, time_estimate, user_id)
-     2. For user_id, use the context's user_id value if available
-     3. Importance should be one of: Low, Medium, High
-     4. Bucket should be one of: Today, Tomorrow, Upcoming, Someday
-     5. time_estimate should be in minutes (e.g., 60 for 1 hour)
-     """,
-    tools=[create_todo_task]
-)
+from core import admission as admission_control
+from core import jobs as job_queue
+from core import warmup as startup_warmup
+from core import agent_graph, briefing, db, deadline, governor, hedging, history, identity, metrics, profiler, sessions, timing
+from core.logger import get_logger
 
-coordinator = Agent(
-    name="CoordinatorAgent",
-    instructions="You are a master coordinator. Delegate tasks to the correct agent based on user request.",    handoffs=[local_files_agent, google_services_agent, google_calendar_agent, day_to_day_agent, todo_agent]
-)
+log = get_logger("server")
+
+# 1) Tools the agent graph can use, by name
+# tool modules import their client libraries (Google, Supabase) lazily on first call
+with startup.phase("import_tools"):
+    from tools.local_files      import list_files, read_file
+    from tools.drive            import list_drive_files, read_drive_file, upload_drive_file
+    from tools.gmail            import list_recent_emails, read_emails, send_email
+    from tools.calendar         import (list_calendar_events, list_pending_invitations, respond_to_invitation, respond_to_invitations,
+                                        create_calendar_event, create_calendar_events, find_free_slots)
+    from tools.todo             import create_todo_task
+    from tools.paging           import read_more
+    from tools.briefing         import get_daily_briefing, prefetch as prefetch_briefing
+    from tools                  import auth as google_auth
+
+# results are fitted to each tool's token budget; read_more pages through the rest
+TOOLS = {t.name: governor.governed(t) for t in (
+    list_files, read_file,
+    list_drive_files, read_drive_file, upload_drive_file, list_recent_emails, read_emails, send_email,
+    list_calendar_events, list_pending_invitations, respond_to_invitation, respond_to_invitations,
+    create_calendar_event, create_calendar_events, find_free_slots,
+    create_todo_task, get_daily_briefing,
+)}
+
+# 2) Agents, handoffs and MCP servers come from agent_graph.json (AGENT_GRAPH_PATH), reloadable at runtime
+# each agent's model hedges slow completions and falls back on errors (LLM_* / HEDGE_* env)
+AGENT_GRAPH_WATCH = float(os.getenv("AGENT_GRAPH_WATCH", "0"))  # seconds between config file checks, 0 = off
+graphs = agent_graph.GraphManager(TOOLS, hedging.from_env, extra_tools=[read_more])
 
 # 3) FastAPI
 app = FastAPI()
@@ -87,9 +72,29 @@ app.add_middleware(
     allow_origins=["*"], allow_methods=["*"], allow_headers=["*"]
 )
 
+# Latency metrics: SDK spans (LLM calls, handoffs, tools) plus HTTP requests
+add_trace_processor(timing.SpanTimer())
+HTTP_SECONDS = metrics.Histogram("http_request_seconds", "HTTP request latency by route and status")
+STARTUP_SECONDS = metrics.Gauge("startup_phase_seconds", "Time spent in each startup phase")
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        path = getattr(route, "path", "unmatched")
+        HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method, route=path, status=status)
+
 class Query(BaseModel):
     message: str
     user_id: Optional[str] = None
+    session_id: Optional[str] = None  # chat session to store the message and reply in
+    include_timings: bool = False
 
     @validator("user_id")
     def not_empty(cls, v):
@@ -97,37 +102,545 @@ class Query(BaseModel):
             raise ValueError("user_id must be non-empty")
         return v
 
-# 4) Keep MCP server up across requests
+# Global and per-user concurrency limits for agent runs
+admission = admission_control.from_env()
+metrics.Gauge("admission_active", "Agent runs in progress", lambda: admission.stats()["active"])
+metrics.Gauge("admission_queued", "Requests waiting for an agent run slot", lambda: admission.stats()["queued"])
+metrics.Gauge("admission_wait_seconds_avg", "Moving average of admission queue wait", lambda: admission.stats()["wait_seconds_avg"])
+
+# 4) Keep MCP server and job workers up across requests
+# Warmup pays the cold costs before traffic arrives; /ready reports 503 until it is done (WARMUP_* env)
+warmup = startup_warmup.from_env()
+
+async def warm_llm():
+    if llm_client is None:
+        return False
+    try:
+        await llm_client.models.list()  # opens the pooled TLS connection the agents will reuse
+    except openai.APIStatusError:
+        pass  # any HTTP answer means the connection is up
+
+async def warm_geocode():
+    cities = startup_warmup.cities()
+    if not cities or not os.getenv("OPENWEATHER_API_KEY"):
+        return False
+    weather_mcp = graphs.current.mcp_server("weather_mcp")
+    if weather_mcp is None:
+        return False
+    # fills the MCP server's geocode and current-weather caches (shared with CACHE_BACKEND=sqlite)
+    await weather_mcp.call_tool("get_weather_batch", {"cities": cities, "current": True})
+
+async def replay_queries():
+    queries = startup_warmup.load_queries()
+    if not queries:
+        return False
+    limit = asyncio.Semaphore(4)
+
+    async def replay(q):
+        async with limit:
+            return await run_query(Query(**q), entry="warmup")
+
+    results = await asyncio.gather(*(replay(q) for q in queries), return_exceptions=True)
+    return f"{sum(not isinstance(r, Exception) for r in results)}/{len(queries)} queries replayed"
+
+async def run_warmup():
+    await warmup.run()
+    for name, result in warmup.results.items():
+        STARTUP_SECONDS.set(result["ms"] / 1000, phase=f"warmup_{name}")
+    log.info("🔥 Warm in %.0fms (%s)", warmup.total_ms,
+             ", ".join(f"{name} {r['status']} {r['ms']:.0f}ms" for name, r in warmup.results.items()) or "no steps")
+
+async def warm_mcp():
+    await asyncio.gather(*(server.list_tools() for server in graphs.current.mcp_servers()))
+
+warmup.step("mcp", warm_mcp)
+warmup.step("google", lambda: asyncio.to_thread(google_auth.warm))
+warmup.step("llm", warm_llm)
+warmup.step("geocode", warm_geocode)
+warmup.step("replay", replay_queries)
+
+# Daily briefings are prefetched in the background for recently active users (BRIEFING_* env)
+briefings = briefing.from_env(prefetch_briefing)
+metrics.Gauge("briefing_active_users", "Users whose daily briefing is kept warm", lambda: briefings.stats()["active_users"])
+
 @app.on_event("startup")
 async def startup_mcp():
-    log("🚀 Starting MCP server…")
-    await weather_mcp.__aenter__()
+    log.info("🚀 Loading the agent graph and starting MCP servers…")
+    with startup.phase("load_graph"):
+        await graphs.load()
+    graphs.watch(AGENT_GRAPH_WATCH)
+    await jobs.start()
+    report = startup.summary()
+    for name, ms in report["phases_ms"].items():
+        STARTUP_SECONDS.set(ms / 1000, phase=name)
+    log.info("✅ Ready in %.0fms (%s)", report["total_ms"],
+             ", ".join(f"{name} {ms:.0f}ms" for name, ms in report["phases_ms"].items()))
+    app.state.warmup = asyncio.create_task(run_warmup())
+    briefings.start()
 
 @app.on_event("shutdown")
 async def shutdown_mcp():
-    log("🛑 Shutting down MCP server…")
-    await weather_mcp.__aexit__(None, None, None)
+    log.info("🛑 Shutting down MCP servers…")
+    app.state.warmup.cancel()
+    await briefings.stop()
+    await jobs.stop()
+    await graphs.close()
 
 # 5) Single /query endpoint
 @app.post("/query")
-async def query_agent(q: Query):
-    log(f"🔍 Incoming query: {q.message!r} (user_id={q.user_id!r})")
+async def query_agent(q: Query, profile: bool = False, x_profile: Optional[str] = Header(None),
+                      authorization: Optional[str] = Header(None)):
+    """
+    With a session_id, the turn is saved to that chat session; the bearer token
+    must then be the user's Supabase access token. `?profile=1` or `X-Profile: 1`
+    (admin token required instead, so the turn isn't saved) adds a sampling
+    profile of the run as `profile`.
+    """
+    log.info("🔍 Incoming query (user_id=%r)", q.user_id)
+    log.debug("Query message: %r", q.message)
+    profile = profile or x_profile not in (None, "", "0", "false")
+    if profile:
+        require_admin(authorization)
+        q.session_id = None
+    await check_session(q, authorization)
     try:
-        log("📤 Calling Runner.run…")
-        result = await Runner.run(
-            coordinator,
-            q.message,
-            context={"user_id": q.user_id}
-        )
-        # extract text
-        if hasattr(result, "final_output"):
-            answer = result.final_output
-        else:
-            answer = str(result)
-        log(f"🎯 Final answer: {answer!r}")
-
-        return {"response": {"final_output": answer}}
-
+        async with admission.slot(q.user_id) as waited:
+            if waited:
+                log.info("⏳ Admitted after %.2fs in queue", waited)
+            if not profile:
+                return await run_query(q)
+            with profiler.profiling() as sampled:
+                response = await run_query(q)
+            return {**response, "profile": sampled.summary()}
+    except admission_control.AdmissionRejected as e:
+        log.warning("🚦 Rejected query (user_id=%r): %s", q.user_id, e)
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
-        log(f"❌ ERROR: {e}")
+        log.exception("❌ ERROR: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/ready")
+async def readiness():
+    """200 once startup warmup has finished (whether or not every step succeeded), 503 before."""
+    return JSONResponse(warmup.status(), status_code=200 if warmup.ready else 503)
+
+@app.get("/admission")
+async def admission_stats():
+    return admission.stats()
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# Every run gets a deadline; tools, MCP calls and upstream HTTP calls get what's left of it
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", "90"))
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "600"))
+RUN_DEADLINE_EXCEEDED = metrics.Counter(
+    "agent_run_deadline_exceeded_total", "Agent runs stopped at their deadline with a partial answer, by entry point"
+)
+
+class PartialResults(RunHooks):
+    """Collects tool results as a run goes, to answer with them if the run runs out of time."""
+
+    def __init__(self):
+        self.results = []
+
+    async def on_tool_end(self, context, agent, tool, result):
+        # MCP tools return content items ({"type": "text", "text": ...})
+        items = result if isinstance(result, list) else [result]
+        if items and all(isinstance(i, dict) and i.get("type") == "text" for i in items):
+            result = "\n".join(i["text"] for i in items)
+        self.results.append((tool.name, str(result)))
+
+    def answer(self) -> str:
+        reply = "Sorry, I ran out of time before I could finish this request."
+        if not self.results:
+            return reply + " Please try again, or ask for something smaller."
+        found = "\n\n".join(f"{name}:\n{text[:1000]}" for name, text in self.results[-3:])
+        return f"{reply} Here is what I had found so far:\n\n{found}"
+
+async def run_query(q: Query, timeout: float = REQUEST_TIMEOUT, entry: str = "query"):
+    """Run the agent graph for one query and return the response payload."""
+    log.debug("📤 Calling Runner.run…")
+    hooks = PartialResults()
+    partial = False
+    asked_at = datetime.now(timezone.utc)
+    if entry != "warmup":
+        briefings.seen(q.user_id)
+    # the run keeps the graph it started on, even if a reload swaps in a new one meanwhile
+    async with graphs.use() as graph:
+        with timing.track_request() as timings, identity.acting_as(q.user_id), deadline.within(timeout):
+            try:
+                result = await asyncio.wait_for(
+                    Runner.run(
+                        graph.entry,
+                        q.message,
+                        context={"user_id": q.user_id},
+                        hooks=hooks
+                    ),
+                    deadline.remaining()
+                )
+            except asyncio.TimeoutError:
+                log.warning("⏰ Run exceeded its %gs deadline (user_id=%r)", timeout, q.user_id)
+                RUN_DEADLINE_EXCEEDED.inc(entry=entry)
+                result, partial = hooks.answer(), True
+    # extract text
+    if hasattr(result, "final_output"):
+        answer = result.final_output
+    else:
+        answer = str(result)
+    log.debug("🎯 Final answer: %r", answer)
+
+    response = {"response": {"final_output": answer}}
+    if partial:
+        response["response"]["partial"] = True
+    if q.session_id and history.enabled():
+        stored = await save_turn(q.session_id, q.message, answer, asked_at)
+        if stored:
+            response["messages"] = stored
+    if q.include_timings:
+        response["timings"] = timings.summary()
+    return response
+
+# 6) Background jobs for long-running queries
+async def run_job(payload: dict):
+    q = Query(**payload)
+    # jobs count against the same per-user and overall limits as /query; they wait in its queue
+    async with admission.slot(q.user_id):
+        return await run_query(q, timeout=JOB_TIMEOUT, entry="job")
+
+jobs = job_queue.from_env(run_job)
+metrics.Gauge("jobs_pending", "Background jobs waiting for a worker", lambda: jobs.stats()["pending"])
+
+async def job_caller(authorization: Optional[str]) -> Optional[str]:
+    """The signed-in user (by their Supabase access token), or None for the admin token, which sees every job."""
+    if ADMIN_TOKEN and authorization == f"Bearer {ADMIN_TOKEN}":
+        return None
+    return await authenticated_user(bearer_token(authorization))
+
+async def caller_job(job_id: str, authorization: Optional[str]) -> job_queue.Job:
+    caller = await job_caller(authorization)
+    job = jobs.get(job_id)
+    if not job or (caller is not None and job.owner != caller):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/jobs", status_code=202)
+async def submit_job(q: Query, idempotency_key: Optional[str] = Header(None), authorization: Optional[str] = Header(None)):
+    """Runs as the signed-in user (bearer: Supabase access token); only they (or the admin token) can read the job."""
+    caller = await job_caller(authorization)
+    if caller is not None:
+        if q.user_id and q.user_id != caller:
+            raise HTTPException(status_code=403, detail="user_id doesn't match the signed-in user")
+        q.user_id = caller
+    await check_session(q, authorization)
+    try:
+        job, created = jobs.submit(q.dict(), idempotency_key, owner=caller)
+    except job_queue.IdempotencyConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except job_queue.JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    log.info("🧾 Job %s %s (user_id=%r)", job.id, "queued" if created else "replayed", q.user_id)
+    return {"job_id": job.id, "status": job.status, "status_url": f"/jobs/{job.id}"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, authorization: Optional[str] = Header(None)):
+    return (await caller_job(job_id, authorization)).to_dict()
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str, authorization: Optional[str] = Header(None)):
+    """Server-sent events: one `status` event per change, ending with the finished job."""
+    job = await caller_job(job_id, authorization)
+
+    async def events():
+        sent = job.to_dict()
+        yield f"event: status\ndata: {json.dumps(sent)}\n\n"
+        while not job.done:
+            if await job.wait_changed(timeout=15):
+                sent = job.to_dict()
+                yield f"event: status\ndata: {json.dumps(sent)}\n\n"
+            else:
+                yield ": keep-alive\n\n"
+        # the job may have finished while the last event was being sent, with no wait to see it
+        if job.to_dict() != sent:
+            yield f"event: status\ndata: {json.dumps(job.to_dict())}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+# 7) Per-user Google credentials (called server-side, e.g. by the frontend's OAuth callback)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+metrics.Gauge("google_client_pool_users", "Users with pooled Google API clients", lambda: google_auth.pool_stats()["users"])
+
+def require_admin(authorization: Optional[str]):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled: set ADMIN_TOKEN")
+    if authorization != f"Bearer {ADMIN_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.put("/users/{user_id}/google-credentials", status_code=204)
+async def put_google_credentials(user_id: str, info: dict, authorization: Optional[str] = Header(None)):
+    """Store a user's Google authorized-user info (token, refresh_token, client_id, client_secret, …)."""
+    require_admin(authorization)
+    try:
+        google_auth.store_user_credentials(user_id, info)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    log.info("🔑 Stored Google credentials (user_id=%r)", user_id)
+
+@app.delete("/users/{user_id}/google-credentials", status_code=204)
+async def delete_google_credentials(user_id: str, authorization: Optional[str] = Header(None)):
+    require_admin(authorization)
+    if not google_auth.delete_user_credentials(user_id):
+        raise HTTPException(status_code=404, detail="No stored credentials for this user")
+
+# 8) WebSocket chat: one connection per chat, conversation state kept on the server
+chat_sessions = sessions.from_env()
+ws_connections = 0
+metrics.Gauge("ws_connections", "Open WebSocket chat connections", lambda: ws_connections)
+metrics.Gauge("ws_sessions", "Chat sessions held in memory", lambda: len(chat_sessions))
+
+def stream_event_payload(event, tool_names: dict) -> Optional[dict]:
+    """The client-facing form of an SDK stream event, or None for events the client doesn't need."""
+    if event.type == "raw_response_event":
+        if getattr(event.data, "type", None) == "response.output_text.delta":
+            return {"type": "delta", "text": event.data.delta}
+    elif event.type == "agent_updated_stream_event":
+        return {"type": "agent", "name": event.new_agent.name}
+    elif event.name == "tool_called":
+        raw = event.item.raw_item
+        call_id, name = getattr(raw, "call_id", None), getattr(raw, "name", None)
+        tool_names[call_id] = name
+        return {"type": "tool_call", "tool": name, "call_id": call_id}
+    elif event.name == "tool_output":
+        raw = event.item.raw_item
+        call_id = raw.get("call_id") if isinstance(raw, dict) else getattr(raw, "call_id", None)
+        return {"type": "tool_output", "tool": tool_names.get(call_id), "call_id": call_id}
+    return None
+
+async def stream_turn(websocket: WebSocket, session: sessions.ChatSession, message: str, include_timings: bool,
+                      persist: bool = False):
+    """Run one chat turn with the session's history, forwarding progress as it happens."""
+    hooks = PartialResults()
+    asked_at = datetime.now(timezone.utc)
+    briefings.seen(session.user_id)
+    async with session.lock, graphs.use() as graph:
+        with timing.track_request() as timings, identity.acting_as(session.user_id), deadline.within(REQUEST_TIMEOUT):
+            result = Runner.run_streamed(
+                graph.entry,
+                session.input_for(message),
+                context={"user_id": session.user_id},
+                hooks=hooks
+            )
+            tool_names = {}
+
+            async def forward():
+                async for event in result.stream_events():
+                    payload = stream_event_payload(event, tool_names)
+                    if payload:
+                        await websocket.send_json(payload)
+
+            try:
+                await asyncio.wait_for(forward(), deadline.remaining())
+            except asyncio.TimeoutError:
+                result.cancel()
+                log.warning("⏰ Turn exceeded its %gs deadline (session %s)", REQUEST_TIMEOUT, session.id)
+                RUN_DEADLINE_EXCEEDED.inc(entry="ws")
+                answer = hooks.answer()
+                # the cancelled run's items may end mid tool call; keep just the exchange
+                session.record(session.input_for(message) + [{"role": "assistant", "content": answer}])
+                reply = {"type": "final", "final_output": answer, "partial": True, "turn": session.turns}
+            except BaseException:
+                result.cancel()  # e.g. the client went away mid-run
+                raise
+            else:
+                session.record(result.to_input_list())
+                reply = {"type": "final", "final_output": result.final_output, "turn": session.turns}
+        chat_sessions.touch(session)
+    if persist:
+        stored = await save_turn(session.id, message, reply["final_output"], asked_at)
+        if stored:
+            reply["messages"] = stored
+    if include_timings:
+        reply["timings"] = timings.summary()
+    await websocket.send_json(reply)
+
+@app.websocket("/ws")
+async def chat_socket(websocket: WebSocket, user_id: Optional[str] = None, session_id: Optional[str] = None,
+                      access_token: Optional[str] = None):
+    """
+    Chat over one connection: send {"message": ...}, receive `agent`, `tool_call`,
+    `tool_output` and `delta` events, then a `final` answer. Reconnecting with the
+    same session_id resumes the conversation while the server still holds it.
+    Turns in one of the user's stored chat sessions are also saved to its history,
+    given the user's Supabase `access_token` (browsers can't set WebSocket headers).
+    """
+    global ws_connections
+    await websocket.accept()
+    try:
+        session = chat_sessions.open(session_id, user_id)
+    except sessions.SessionMismatch as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    ws_connections += 1
+    persist = await stored_session(session_id, user_id, access_token)
+    log.info("🔌 WebSocket session %s opened (user_id=%r, turns=%d, stored=%s)", session.id, user_id, session.turns, persist)
+    try:
+        await websocket.send_json({"type": "session", "session_id": session.id, "turns": session.turns})
+        while True:
+            try:
+                data = json.loads(await websocket.receive_text())
+                message = data["message"].strip()
+            except (ValueError, TypeError, KeyError, AttributeError):
+                await websocket.send_json({"type": "error", "status": 400, "detail": "Expected {\"message\": \"...\"}"})
+                continue
+            try:
+                async with admission.slot(session.user_id):
+                    await stream_turn(websocket, session, message, bool(data.get("include_timings")), persist)
+            except admission_control.AdmissionRejected as e:
+                log.warning("🚦 Rejected WebSocket message (user_id=%r): %s", session.user_id, e)
+                await websocket.send_json({"type": "error", "status": 429, "detail": str(e), "retry_after": e.retry_after})
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                log.exception("❌ ERROR: %s", e)
+                await websocket.send_json({"type": "error", "status": 500, "detail": str(e)})
+    except WebSocketDisconnect:
+        log.info("🔌 WebSocket session %s closed", session.id)
+    finally:
+        ws_connections -= 1
+
+# 9) Chat history (Supabase chat_sessions/messages, paged and cached; see core/history.py)
+class ChatMessage(BaseModel):
+    sender: str
+    content: str
+
+    @validator("sender")
+    def known_sender(cls, v):
+        if v not in ("user", "ai"):
+            raise ValueError("sender must be 'user' or 'ai'")
+        return v
+
+async def history_call(fn, *args, **kwargs):
+    """Run a (blocking) history call in a worker thread, mapping its errors to HTTP ones."""
+    try:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    except history.SessionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except history.HistoryUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    scheme, _, token = (authorization or "").partition(" ")
+    return (token.strip() or None) if scheme.lower() == "bearer" else None
+
+async def authenticated_user(token: Optional[str]) -> str:
+    """The id of the user whose Supabase access token `token` is; 401 if it isn't one."""
+    if not token:
+        raise HTTPException(status_code=401, detail="Sign-in required: send your Supabase access token as a bearer token")
+    try:
+        return await asyncio.to_thread(db.verify_access_token, token)
+    except db.InvalidToken as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    except Exception as e:
+        log.warning("Couldn't verify an access token: %s", e)
+        raise HTTPException(status_code=503, detail="Sign-in can't be verified right now")
+
+async def session_owner(session_id: str, user_id: Optional[str], token: Optional[str]) -> str:
+    """
+    The verified user, if `token` is their access token, `user_id` (when given)
+    names them and `session_id` is one of their sessions; raises HTTPException.
+    """
+    verified = await authenticated_user(token)
+    if user_id and user_id != verified:
+        raise HTTPException(status_code=403, detail="user_id doesn't match the signed-in user")
+    await history_call(history.check_owner, session_id, verified)
+    return verified
+
+async def check_session(q: Query, authorization: Optional[str]):
+    """
+    Before any work is done for the query: 401/403/404 unless the session is
+    the signed-in user's. If it can't be checked, the query is answered but not saved.
+    """
+    if not q.session_id or not history.enabled():
+        return
+    try:
+        q.user_id = await session_owner(q.session_id, q.user_id, bearer_token(authorization))
+    except HTTPException as e:
+        if e.status_code < 500:
+            raise
+        log.warning("Couldn't check chat session %s, not saving the turn: %s", q.session_id, e.detail)
+        q.session_id = None
+
+async def stored_session(session_id: Optional[str], user_id: Optional[str], token: Optional[str]) -> bool:
+    """Whether `session_id` is one of the signed-in user's stored chat sessions (whose turns get saved)."""
+    if not session_id or not history.enabled():
+        return False
+    try:
+        await session_owner(session_id, user_id, token)
+        return True
+    except HTTPException as e:
+        log.info("Not saving WebSocket turns to chat session %s: %s", session_id, e.detail)
+        return False
+
+async def save_turn(session_id: str, message: str, reply: str, asked_at: datetime) -> Optional[list]:
+    """Store the exchange; a failure is logged rather than failing a turn the user already has an answer to."""
+    try:
+        return await asyncio.to_thread(history.record_turn, session_id, message, reply, asked_at)
+    except Exception as e:
+        log.error("❌ Couldn't save the turn to chat session %s: %s", session_id, e)
+        return None
+
+# the user is always the one whose access token is the bearer token, never a parameter
+@app.get("/sessions")
+async def get_chat_sessions(before: Optional[str] = None, limit: int = 20, authorization: Optional[str] = Header(None)):
+    """The signed-in user's chat sessions, newest first; pass `next_before` as `before` for older ones."""
+    user_id = await authenticated_user(bearer_token(authorization))
+    return await history_call(history.list_sessions, user_id, before, limit)
+
+@app.get("/sessions/{session_id}/messages")
+async def get_chat_messages(session_id: str, before: Optional[str] = None, limit: int = history.PAGE_SIZE,
+                            authorization: Optional[str] = Header(None)):
+    """A page of the session's messages, oldest first; pass `next_before` as `before` for older ones."""
+    await session_owner(session_id, None, bearer_token(authorization))
+    return await history_call(history.messages, session_id, before, limit)
+
+@app.post("/sessions/{session_id}/messages", status_code=201)
+async def post_chat_message(session_id: str, m: ChatMessage, authorization: Optional[str] = Header(None)):
+    """Store a message that didn't come from /query (e.g. a welcome or error message)."""
+    await session_owner(session_id, None, bearer_token(authorization))
+    stored = await history_call(history.append, session_id, [{"sender": m.sender, "content": m.content}])
+    return stored[0]
+
+# 10) Agent graph reloads: new runs use the new graph, runs in progress finish on theirs
+metrics.Gauge("agent_graph_version", "Version of the agent graph new runs start on", lambda: graphs.current.version if graphs.current else 0)
+metrics.Gauge("agent_graph_draining", "Replaced agent graphs with runs still in progress", lambda: len(graphs.stats()["draining"]))
+
+@app.get("/graph")
+async def graph_status():
+    return graphs.stats()
+
+@app.post("/admin/graph/reload")
+async def reload_graph(authorization: Optional[str] = Header(None)):
+    """Re-read agent_graph.json; on any error the running graph stays in place."""
+    require_admin(authorization)
+    try:
+        return await graphs.load()
+    except agent_graph.GraphError as e:
+        raise HTTPException(status_code=422, detail=e.errors)
+    except Exception as e:
+        log.exception("❌ Agent graph reload failed: %s", e)
+        raise HTTPException(status_code=500, detail=f"Reload failed, keeping v{graphs.current.version}: {e}")
+
+# 11) Sampling profiler (see core/profiler.py): collapsed stacks for flamegraph tools
+@app.get("/admin/profile")
+async def profile_process(seconds: float = 10, mode: str = "wall", authorization: Optional[str] = Header(None)):
+    """Profile the whole process for `seconds`; `mode` is wall (all threads, waiting included) or cpu."""
+    require_admin(authorization)
+    if mode not in ("wall", "cpu") or seconds <= 0:
+        raise HTTPException(status_code=400, detail="seconds must be positive and mode one of wall, cpu")
+    sampled = await profiler.profile_process(seconds)
+    return PlainTextResponse(sampled.collapsed(mode) + "\n")
@@ -0,0 +1,81 @@
+import httplib2
+import pytest
+
+from core import ratelimit
+from tools import auth
+
+
+@pytest.fixture
+def google_bucket(monkeypatch):
+    """A Google limit of 100 tokens refilling at 1/s, on fresh in-memory buckets."""
+    buckets = ratelimit.MemoryBuckets()
+    limiter = ratelimit.RateLimiter({"google": (ratelimit.Limit(1, 100), None)}, buckets)
+    monkeypatch.setattr(ratelimit, "_limiter", limiter)
+    return lambda: buckets._state["google"][0]
+
+
+class FakeAuthorizedHttp:
+    def __init__(self):
+        self.http = httplib2.Http()
+        self.sent = 0
+
+    def request(self, *args, **kwargs):
+        self.sent += 1
+        return httplib2.Response({"status": "200"}), b"{}"
+
+
+class FakeBatch:
+    """Sends its calls the way BatchHttpRequest does: as one HTTP request."""
+
+    def __init__(self):
+        self.calls = []
+
+    def add(self, request, request_id=None):
+        self.calls.append(request_id)
+
+    def execute(self, http=None):
+        http.request("https://www.googleapis.com/batch/calendar/v3", method="POST")
+
+
+def thread_local_http():
+    http = auth._ThreadLocalHttp(creds=None)
+    http._local.http = FakeAuthorizedHttp()
+    return http
+
+
+def test_request_takes_one_token(google_bucket):
+    http = thread_local_http()
+    http.request("https://www.googleapis.com/calendar/v3/calendars/primary/events")
+    assert google_bucket() == pytest.approx(99, abs=0.1)
+
+
+def test_batch_takes_a_token_per_call(google_bucket):
+    http = thread_local_http()
+    batch = auth._CountedBatch(FakeBatch())
+    for n in range(30):
+        batch.add(object(), request_id=str(n))
+    batch.execute(http=http)
+    assert http._local.http.sent == 1
+    assert google_bucket() == pytest.approx(70, abs=0.1)
+
+
+def test_batch_larger_than_burst_goes_into_debt():
+    buckets = ratelimit.MemoryBuckets()
+    limit = ratelimit.Limit(10, 10)
+    assert buckets.reserve("google", limit, max_wait=0, cost=50) == 0
+    # the next call waits for the debt (40 tokens) plus its own token, at 10/s
+    assert buckets.reserve("google", limit, max_wait=0) == pytest.approx(4.1, abs=0.05)
+
+
+def test_backoff_applies_without_a_limit():
+    limiter = ratelimit.RateLimiter({"google": (None, None)}, ratelimit.MemoryBuckets(), max_wait=1)
+    limiter.backoff("google", retry_after=30)
+    with pytest.raises(ratelimit.RateLimited):
+        limiter.acquire("google")
+
+
+def test_backoff_on_an_unused_key_starts_full():
+    buckets = ratelimit.MemoryBuckets()
+    limiter = ratelimit.RateLimiter({"google": (ratelimit.Limit(1, 100), None)}, buckets)
+    limiter.backoff("google", retry_after=30)
+    assert buckets._state["google"][0] == 100
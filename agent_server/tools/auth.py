@@ -1,9 +1,18 @@
+import contextvars
+import json
 import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from agents import default_tool_error_function
 from dotenv import load_dotenv
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+from core import credentials, deadline, ratelimit
+from core.cache import get_cache
+from core.identity import current_user_id
+from core.logger import get_logger
+
+log = get_logger("tools.auth")
 
 load_dotenv()
 
@@ -15,14 +24,62 @@ SCOPES = [
 ]
 
 CREDENTIALS_PATH = os.getenv("GOOGLE_CREDENTIALS_PATH", "credentials.json")
-TOKEN_PATH = "token.json" # Define token path constant
+TOKEN_PATH = os.getenv("GOOGLE_TOKEN_PATH", "token.json") # Define token path constant
+# Optional root URL override for all Google APIs (e.g. the offline benchmark stubs)
+API_ENDPOINT = os.getenv("GOOGLE_API_ENDPOINT")
+# servicePath of each API's discovery document, appended to API_ENDPOINT
+_SERVICE_PATHS = {"drive": "drive/v3/", "gmail": "", "calendar": "calendar/v3/"}
+# batchPath of each discovery document; batch requests don't follow api_endpoint on their own
+_BATCH_PATHS = {"drive": "batch/drive/v3", "gmail": "batch/gmail/v1", "calendar": "batch/calendar/v3"}
+
+# rate-limit tokens the next Google HTTP request takes: one per call, so a batch request sets its size
+_request_cost = contextvars.ContextVar("google_request_cost", default=1)
+
+# per-user tokens, encrypted at rest (CREDENTIALS_KEY); token.json is the identity of requests
+# without a user_id, and of signed-in users without stored credentials only if
+# GOOGLE_SHARED_TOKEN_FALLBACK=1 (they'd be reading and writing the operator's account)
+_store = credentials.from_env("google_credentials")
+SHARED_TOKEN_FALLBACK = os.getenv("GOOGLE_SHARED_TOKEN_FALLBACK", "0") in ("1", "true", "yes")
+REFRESH_INTERVAL = 60  # seconds between background refresh/eviction passes
+REFRESH_MARGIN = 300   # refresh tokens expiring within this many seconds
+
+# token.json's current access token, shared so that workers don't each refresh it; the refresh
+# token and client secret never go into the cache (it is a plain file with CACHE_BACKEND=sqlite)
+_tokens = get_cache("google:token")
+
+def _share_token(creds):
+    """Publishes a refreshed access token and its expiry to the cache until shortly before it expires."""
+    if creds.expiry is None or not creds.token:
+        return
+    # google-auth keeps expiry as a naive UTC datetime
+    ttl = creds.expiry.replace(tzinfo=timezone.utc).timestamp() - time.time() - 60
+    if ttl > 0:
+        _tokens.set(TOKEN_PATH, {"token": creds.token, "expiry": creds.expiry.isoformat()}, ttl=ttl)
+
+def _adopt_shared_token(creds) -> bool:
+    """Use the access token another worker published, if it is newer than `creds`'."""
+    shared = _tokens.get(TOKEN_PATH)
+    if not shared:
+        return False
+    expiry = datetime.fromisoformat(shared["expiry"])
+    if creds.expiry is None or expiry > creds.expiry:
+        creds.token, creds.expiry = shared["token"], expiry
+    return True
 
 def _get_google_credentials():
     """Gets valid Google credentials, initiating OAuth flow if needed."""
+    # The Google client libraries take a noticeable time to import, so load them on first use
+    from google.oauth2.credentials import Credentials
+    from google_auth_oauthlib.flow import InstalledAppFlow
+    from google.auth.transport.requests import Request
+
     creds = None
+    shared = False
     # Load existing token if it exists
     if os.path.exists(TOKEN_PATH):
         creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
+        # Prefer the access token another worker already refreshed
+        shared = _adopt_shared_token(creds)
     
     # If there are no (valid) credentials available, let the user log in.
     if not creds or not creds.valid:
@@ -30,41 +87,283 @@ def _get_google_credentials():
             try:
                 creds.refresh(Request())
             except Exception as e:
-                print(f"Error refreshing token: {e}. Initiating full auth flow.")
+                log.warning("Error refreshing token: %s. Initiating full auth flow.", e)
                 creds = None # Force re-authentication
         
         # Only run the flow if refresh failed or no valid creds
         if not creds or not creds.valid: 
-            print(f"No valid credentials found at {TOKEN_PATH}. Initiating OAuth flow...")
-            print(f"Using credentials file: {CREDENTIALS_PATH}")
+            log.info("No valid credentials found at %s. Initiating OAuth flow using %s...", TOKEN_PATH, CREDENTIALS_PATH)
             if not os.path.exists(CREDENTIALS_PATH):
                  raise FileNotFoundError(f"Credentials file not found at {CREDENTIALS_PATH}. Please ensure it's correctly placed and the path is set in .env")
             
             flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
             # Important: run_local_server() opens the browser for user consent
             creds = flow.run_local_server(port=0) 
-            print("OAuth flow completed. Credentials obtained.")
+            log.info("OAuth flow completed. Credentials obtained.")
         
         # Save the credentials for the next run
-        print(f"Saving credentials to {TOKEN_PATH}")
-        with open(TOKEN_PATH, "w") as token:
-            token.write(creds.to_json())
+        log.info("Saving credentials to %s", TOKEN_PATH)
+        _save_shared_token(creds)
     else:
-        print(f"Loaded valid credentials from {TOKEN_PATH}")
+        log.debug("Loaded valid credentials from %s", "cache" if shared else TOKEN_PATH)
+        if not shared:
+            _share_token(creds)
 
     return creds
 
+def _save_shared_token(creds):
+    with open(TOKEN_PATH, "w") as token:
+        token.write(creds.to_json())
+    _share_token(creds)
+
+class GoogleNotConnected(PermissionError):
+    """A signed-in user without stored Google credentials."""
+
+def google_tool_error(ctx, error: Exception) -> str:
+    """Failure message of a Google tool: the missing connection is explained, other errors aren't exposed."""
+    if isinstance(error, GoogleNotConnected):
+        return str(error)
+    return default_tool_error_function(ctx, error)
+
+def _set_timeout(http, seconds: float):
+    """Apply `seconds` to an httplib2.Http, including its already-open connections."""
+    http.timeout = seconds
+    for conn in http.connections.values():
+        conn.timeout = seconds
+        if conn.sock is not None:
+            conn.sock.settimeout(seconds)
+
+def rate_limited(response, content) -> bool:
+    """Whether a Google API response is a rate-limit error (429, or 403 rateLimitExceeded)."""
+    if response.status == 429:
+        return True
+    return response.status == 403 and b"ratelimitexceeded" in (content or b"").lower()
+
+class _ThreadLocalHttp:
+    """
+    Authorized HTTP transport for a pooled service client.
+
+    httplib2 connections aren't thread-safe and tools run in worker threads, so
+    each thread gets its own connection over the user's shared credentials.
+    """
+
+    def __init__(self, creds):
+        self.credentials = creds
+        self._local = threading.local()
+
+    def _http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+            http = self._local.http = AuthorizedHttp(self.credentials, http=httplib2.Http())
+        return http
+
+    def request(self, *args, **kwargs):
+        http = self._http()
+        for _ in range(2):
+            ratelimit.acquire("google", _request_cost.get())
+            _set_timeout(http.http, deadline.timeout())
+            response, content = http.request(*args, **kwargs)
+            if not rate_limited(response, content):
+                break
+            # a 429 (or 403 rateLimitExceeded) pauses Google for everyone; retried once
+            ratelimit.backoff("google", response.get("retry-after"))
+        return response, content
+
+    def __getattr__(self, name):
+        return getattr(self._http(), name)
+
+class _UserClients:
+    """One user's credentials and the service clients built on them."""
+
+    def __init__(self, user_id, creds, save):
+        self.user_id = user_id
+        self.creds = creds
+        self.save = save  # persists refreshed credentials
+        self.http = _ThreadLocalHttp(creds)
+        self.services = {}
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+class ClientPool:
+    """
+    LRU-bounded pool of Google service clients per user.
+
+    Credentials come from the encrypted per-user store (or token.json for the
+    shared identity). A background thread refreshes tokens shortly before they
+    expire and evicts users idle for longer than `idle_seconds`.
+    """
+
+    def __init__(self, max_users: int = 256, idle_seconds: float = 900.0):
+        self.max_users = max_users
+        self.idle_seconds = idle_seconds
+        self._users = OrderedDict()
+        self._shared = None  # token.json identity, used by everyone without stored credentials
+        self._lock = threading.Lock()
+        self._maintainer = None
+
+    def _load(self, user_id):
+        if user_id is not None:
+            info = _store.get(user_id)
+            if info is not None:
+                from google.oauth2.credentials import Credentials
+                creds = Credentials.from_authorized_user_info(info, SCOPES)
+                return _UserClients(user_id, creds, lambda c: _store.put(user_id, json.loads(c.to_json())))
+            if not SHARED_TOKEN_FALLBACK:
+                raise GoogleNotConnected("No Google account is connected for this user: ask them to connect Google first.")
+        if self._shared is None:
+            self._shared = _UserClients(None, _get_google_credentials(), _save_shared_token)
+        return self._shared
+
+    def _entry(self, user_id):
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None:
+                self._users.move_to_end(user_id)
+        if entry is None:
+            entry = self._load(user_id)
+            with self._lock:
+                entry = self._users.setdefault(user_id, entry)
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.max_users:
+                    evicted, _ = self._users.popitem(last=False)
+                    log.debug("Evicted Google clients of user %s (pool full)", evicted)
+            self._start_maintainer()
+        entry.last_used = time.monotonic()
+        return entry
+
+    def service(self, user_id, api: str, version: str):
+        """The (cached) `api` client for `user_id`."""
+        entry = self._entry(user_id)
+        with entry.lock:
+            service = entry.services.get(api)
+            if service is None:
+                from googleapiclient.discovery import build
+                client_options = None
+                if API_ENDPOINT:
+                    client_options = {"api_endpoint": API_ENDPOINT.rstrip("/") + "/" + _SERVICE_PATHS[api]}
+                service = entry.services[api] = build(
+                    api, version, http=entry.http, client_options=client_options, cache_discovery=False
+                )
+        return service
+
+    def evict(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"users": len(self._users), "max_users": self.max_users}
+
+    def _start_maintainer(self):
+        if self._maintainer is None:
+            with self._lock:
+                if self._maintainer is None:
+                    self._maintainer = threading.Thread(target=self._maintain, name="google-clients", daemon=True)
+                    self._maintainer.start()
+
+    def _maintain(self):
+        from google.auth.transport.requests import Request
+        while True:
+            time.sleep(REFRESH_INTERVAL)
+            now = time.monotonic()
+            with self._lock:
+                idle = [u for u, e in self._users.items() if now - e.last_used > self.idle_seconds]
+                for user_id in idle:
+                    del self._users[user_id]
+                entries = list({id(e): e for e in self._users.values()}.values())
+            if idle:
+                log.debug("Evicted Google clients of %d idle user(s)", len(idle))
+            for entry in entries:
+                creds = entry.creds
+                expiry = creds.expiry.replace(tzinfo=timezone.utc).timestamp() if creds.expiry else None
+                if not creds.refresh_token or (expiry and expiry - time.time() > REFRESH_MARGIN):
+                    continue
+                try:
+                    creds.refresh(Request())
+                    entry.save(creds)
+                    log.debug("Refreshed Google token of user %s", entry.user_id)
+                except Exception as e:
+                    log.warning("Could not refresh Google token of user %s: %s", entry.user_id, e)
+
+_pool = ClientPool(
+    max_users=int(os.getenv("GOOGLE_CLIENT_POOL_SIZE", "256")),
+    idle_seconds=float(os.getenv("GOOGLE_CLIENT_IDLE_SECONDS", "900")),
+)
+
+def store_user_credentials(user_id: str, info: dict):
+    """Validates and stores a user's authorized-user info (as in token.json), replacing pooled clients."""
+    from google.oauth2.credentials import Credentials
+    Credentials.from_authorized_user_info(info, SCOPES)  # raises ValueError if fields are missing
+    _store.put(user_id, info)
+    _forget_account(user_id)
+
+def delete_user_credentials(user_id: str) -> bool:
+    deleted = _store.delete(user_id)
+    _forget_account(user_id)
+    return deleted
+
+def _forget_account(user_id: str):
+    """Drop what was built or looked up with the user's previous Google account."""
+    from tools.calendar import forget_primary_id  # tools.calendar imports this module
+    _pool.evict(user_id)
+    forget_primary_id(user_id)
+
+def pool_stats() -> dict:
+    return _pool.stats()
+
+def warm() -> bool:
+    """
+    Loads (and if needed refreshes) the shared token and builds every API client,
+    so the first request doesn't pay for it. Returns False when there is no
+    token.json yet, as the interactive OAuth flow can't run during startup.
+    """
+    if not os.path.exists(TOKEN_PATH):
+        return False
+    for api, version in (("drive", "v3"), ("gmail", "v1"), ("calendar", "v3")):
+        _pool.service(None, api, version)
+    return True
+
 def get_drive_service():
-    """Builds and returns a Google Drive service client."""
-    creds = _get_google_credentials()
-    return build("drive", "v3", credentials=creds)
+    """Returns the Google Drive client for the current user."""
+    return _pool.service(current_user_id(), "drive", "v3")
 
 def get_gmail_service():
-    """Builds and returns a Gmail service client."""
-    creds = _get_google_credentials()
-    return build("gmail", "v1", credentials=creds)
+    """Returns the Gmail client for the current user."""
+    return _pool.service(current_user_id(), "gmail", "v1")
 
 def get_calendar_service():
-    """Builds and returns a Google Calendar service client."""
-    creds = _get_google_credentials()
-    return build("calendar", "v3", credentials=creds)
+    """Returns the Google Calendar client for the current user."""
+    return _pool.service(current_user_id(), "calendar", "v3")
+
+class _CountedBatch:
+    """A BatchHttpRequest whose HTTP request takes a rate-limit token for every call in it."""
+
+    def __init__(self, batch):
+        self._batch = batch
+        self._calls = 0
+
+    def add(self, *args, **kwargs):
+        self._batch.add(*args, **kwargs)
+        self._calls += 1
+
+    def __len__(self):
+        return self._calls
+
+    def execute(self, http=None):
+        token = _request_cost.set(max(1, self._calls))
+        try:
+            return self._batch.execute(http=http)
+        finally:
+            _request_cost.reset(token)
+
+    def __getattr__(self, name):
+        return getattr(self._batch, name)
+
+def new_batch_request(api: str, service, callback=None):
+    """A BatchHttpRequest for `service` (an `api` client), sent to API_ENDPOINT when it is set."""
+    if not API_ENDPOINT:
+        return _CountedBatch(service.new_batch_http_request(callback=callback))
+    from googleapiclient.http import BatchHttpRequest
+    return _CountedBatch(BatchHttpRequest(callback=callback, batch_uri=API_ENDPOINT.rstrip("/") + "/" + _BATCH_PATHS[api]))
@@ -0,0 +1,75 @@
+# briefing.py
+import os
+import time
+from typing import Optional
+from agents import function_tool
+from core import briefing
+from core.identity import current_user_id
+from core.logger import get_logger
+from tools.calendar import fetch_calendar_events, fetch_pending_invitations, home_city
+from tools.gmail import fetch_recent_emails
+from tools.weather import get_weather
+
+log = get_logger("tools.briefing")
+
+BRIEFING_EMAILS = int(os.getenv("BRIEFING_EMAILS", "10"))
+BRIEFING_DEFAULT_CITY = os.getenv("BRIEFING_DEFAULT_CITY")
+
+def _failed(result) -> bool:
+    # the Google tools report failures as [{"error": ...}] / {"error": ...} rather than raising
+    if isinstance(result, dict):
+        return "error" in result
+    return isinstance(result, list) and any(isinstance(r, dict) and "error" in r for r in result)
+
+_FETCHERS = {
+    "events": lambda: fetch_calendar_events(0, 1),
+    "invitations": fetch_pending_invitations,
+    "emails": lambda: fetch_recent_emails(BRIEFING_EMAILS),
+}
+
+def _fetch(names, user_id: Optional[str]) -> dict:
+    """The named Google sections; one that fails is left out rather than stored as an error."""
+    sections = {}
+    for name in names:
+        fetch = _FETCHERS[name]
+        try:
+            result = fetch()
+        except Exception as e:
+            log.warning("Briefing section %s failed (user_id=%r): %s", name, user_id, e)
+            continue
+        if not _failed(result):
+            sections[name] = result
+    return sections
+
+def prefetch(user_id: Optional[str]) -> dict:
+    """Fetch every briefing section for the current user (the scheduler runs this on their behalf)."""
+    sections = _fetch(_FETCHERS, user_id)
+    try:
+        city = home_city() or BRIEFING_DEFAULT_CITY
+    except Exception as e:
+        log.warning("Couldn't look up the home city (user_id=%r): %s", user_id, e)
+        city = BRIEFING_DEFAULT_CITY
+    if city:
+        sections["weather"] = {"city": city, "current": get_weather(city)}
+    return sections
+
+@function_tool
+def get_daily_briefing() -> dict:
+    """
+    Returns the user's daily briefing in one call: today's calendar events, pending
+    invitations, recent email metadata and the current weather at home, with how
+    old the snapshot is. Use it for general "what's my day look like" questions.
+    """
+    user_id = current_user_id()
+    snap = briefing.snapshot(user_id)
+    if snap is None or time.time() - snap["fetched_at"] > briefing.MAX_AGE:
+        briefing.store(user_id, prefetch(user_id))
+        snap = briefing.snapshot(user_id)
+    # sections dropped by a write since (or that failed to prefetch) are fetched live
+    missing = [name for name in _FETCHERS if name not in snap["sections"]]
+    return {
+        **snap["sections"],
+        **_fetch(missing, user_id),
+        "as_of": time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(snap["fetched_at"])),
+        "age_minutes": round((time.time() - snap["fetched_at"]) / 60, 1),
+    }
@@ -1,28 +1,48 @@
 import datetime
 import os
+import uuid
+from typing import Optional
 from agents import function_tool
-from tools.auth import get_calendar_service
-from googleapiclient.errors import HttpError
+from pydantic import BaseModel
+from core import briefing, ratelimit
+from core.cache import get_cache
+from core.identity import current_user_id
+from tools.auth import get_calendar_service, google_tool_error, new_batch_request, rate_limited
+from core.logger import get_logger
+
+log = get_logger("tools.calendar")
+
+VALID_RESPONSES = ('accepted', 'declined', 'tentative')
+BATCH_SIZE = 50  # the Calendar API's limit of calls per batch request
+PRIMARY_ID_TTL = 86400
+
+_primary_ids = get_cache("calendar:primary_id")  # the user's email, as the primary calendar's id
 
 # Helper to format datetime objects for the API
 def _format_datetime(dt):
     return dt.isoformat() + 'Z' # 'Z' indicates UTC time
 
-@function_tool
+@function_tool(failure_error_function=google_tool_error)
 def list_calendar_events(start_days_from_now: int, end_days_from_now: int) -> list[dict]:
     """Lists events from the user's primary Google Calendar within a specified time range.
     Args:
         start_days_from_now: The starting day offset from today (e.g., 0 for today, 1 for tomorrow).
         end_days_from_now: The ending day offset from today (e.g., 1 for today, 7 for the next week).
     """
+    return fetch_calendar_events(start_days_from_now, end_days_from_now)  # always live, unlike get_daily_briefing
+
+
+def fetch_calendar_events(start_days_from_now: int, end_days_from_now: int) -> list[dict]:
+    """Events in the given day range, fetched live."""
     # Apply defaults internally if needed, or rely on LLM to provide based on description
     # For simplicity, we'll assume the LLM provides them for now.
+    from googleapiclient.errors import HttpError  # imported on first use to keep server startup fast
     service = get_calendar_service()
     now = datetime.datetime.utcnow()
     time_min = _format_datetime(now + datetime.timedelta(days=start_days_from_now))
     time_max = _format_datetime(now + datetime.timedelta(days=end_days_from_now))
 
-    print(f"Fetching events from {time_min} to {time_max}")
+    log.debug("Fetching events from %s to %s", time_min, time_max)
     try:
         events_result = service.events().list(
             calendarId='primary', timeMin=time_min, timeMax=time_max,
@@ -47,19 +67,25 @@ def list_calendar_events(start_days_from_now: int, end_days_from_now: int) -> li
             })
         return output
     except HttpError as error:
-        print(f"An error occurred: {error}")
+        log.error("An error occurred: %s", error)
         return [{"error": f"Failed to fetch calendar events: {error}"}]
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        log.exception("An unexpected error occurred: %s", e)
         return [{"error": f"An unexpected error occurred: {e}"}]
 
 
-@function_tool
+@function_tool(failure_error_function=google_tool_error)
 def list_pending_invitations() -> list[dict]:
     """Lists events the user is invited to but hasn't responded to yet."""
+    return fetch_pending_invitations()  # always live, unlike get_daily_briefing
+
+
+def fetch_pending_invitations() -> list[dict]:
+    """Pending invitations, fetched live."""
+    from googleapiclient.errors import HttpError
     service = get_calendar_service()
     now = datetime.datetime.utcnow().isoformat() + 'Z' # 'Z' indicates UTC time
-    print("Fetching pending invitations...")
+    log.debug("Fetching pending invitations...")
     try:
         events_result = service.events().list(
             calendarId='primary',
@@ -73,10 +99,10 @@ def list_pending_invitations() -> list[dict]:
         events = events_result.get('items', [])
 
         pending_invitations = []
-        user_email = service.calendarList().get(calendarId='primary').execute().get('id') # Get user's primary calendar email
+        user_email = _primary_id(service) # Get user's primary calendar email
 
         if not user_email:
-            print("Could not determine primary calendar user email.")
+            log.warning("Could not determine primary calendar user email.")
             return [{"error": "Could not determine primary calendar user email."}]
 
         for event in events:
@@ -108,73 +134,169 @@ def list_pending_invitations() -> list[dict]:
 
         return pending_invitations
     except HttpError as error:
-        print(f"An error occurred: {error}")
+        log.error("An error occurred: %s", error)
         return [{"error": f"Failed to fetch pending invitations: {error}"}]
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        log.exception("An unexpected error occurred: %s", e)
         return [{"error": f"An unexpected error occurred: {e}"}]
 
 
-@function_tool
+def _primary_id(service) -> Optional[str]:
+    """The user's email address, which is their primary calendar's id (cached)."""
+    return _primary_ids.get_or_compute(
+        current_user_id() or "",
+        lambda: service.calendarList().get(calendarId='primary').execute().get('id'),
+        ttl=PRIMARY_ID_TTL,
+    )
+
+
+def forget_primary_id(user_id: Optional[str]):
+    """Drop the cached primary calendar id of a user whose Google credentials changed."""
+    _primary_ids.delete(user_id or "")
+
+
+def _response_patch(service, event_id: str, email: str, response: str):
+    # attendeesOmitted: the patch carries only our own attendee entry and leaves the others alone
+    # sendUpdates='all' notifies the organizer and the other attendees
+    return service.events().patch(
+        calendarId='primary',
+        eventId=event_id,
+        body={'attendeesOmitted': True, 'attendees': [{'email': email, 'responseStatus': response}]},
+        sendUpdates='all',
+    )
+
+
+def _response_error(error, event_id: str) -> str:
+    if getattr(error, 'resp', None) is None:  # not an API answer: the batch request itself failed
+        return f"Failed to respond to invitation: {error}"
+    if error.resp.status == 404:
+        return f"Event with ID '{event_id}' not found."
+    if error.resp.status == 403:
+        return "Permission denied. You might not have rights to modify this event or respond."
+    return f"Failed to respond to invitation: {error}"
+
+
+def _error_details(error) -> str:
+    """The message in a Google API error's JSON body, or the HTTP reason."""
+    try:
+        import json
+        return json.loads(error.content.decode('utf-8'))['error']['message']
+    except Exception:
+        return getattr(getattr(error, 'resp', None), 'reason', None) or str(error)
+
+
+def _execute_batch(service, requests: list) -> list[tuple]:
+    """
+    Execute `requests` (callables building Calendar API requests) as batch HTTP
+    requests of up to BATCH_SIZE calls. Items that were rate limited are
+    retried once after the pause, so every request must be safe to send twice
+    (patches that set a value; inserts with a client-chosen event id).
+
+    Returns (response, error) per item, in order: the item's HttpError, or the
+    exception that stopped its batch request (RateLimited, DeadlineExceeded, a
+    socket timeout…). A failed batch request never loses the results of the
+    batches already applied, and a failed retry leaves its items rate limited.
+    """
+    from googleapiclient.errors import HttpError
+    results = [None] * len(requests)
+
+    def done(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+
+    def run(pending):
+        for i in range(0, len(pending), BATCH_SIZE):
+            batch = new_batch_request("calendar", service, done)
+            for n in pending[i:i + BATCH_SIZE]:
+                batch.add(requests[n](), request_id=str(n))
+            try:
+                batch.execute()
+            except Exception as e:
+                log.warning("Calendar batch request failed, %d calls not sent: %s", len(pending) - i, e)
+                for n in pending[i:]:
+                    if results[n] is None:
+                        results[n] = (None, e)
+                return
+
+    run(list(range(len(requests))))
+    limited = [n for n, (_, error) in enumerate(results)
+               if isinstance(error, HttpError) and rate_limited(error.resp, error.content)]
+    if limited:
+        ratelimit.backoff("google", results[limited[0]][1].resp.get('retry-after'))
+        run(limited)
+    return results
+
+
+@function_tool(failure_error_function=google_tool_error)
 def respond_to_invitation(event_id: str, response: str) -> dict:
     """Responds to a specific event invitation. Response must be 'accepted', 'declined', or 'tentative'."""
+    from googleapiclient.errors import HttpError
     service = get_calendar_service()
-    valid_responses = ['accepted', 'declined', 'tentative']
     response_lower = response.lower()
-    if response_lower not in valid_responses:
-        return {"error": f"Invalid response. Must be one of: {', '.join(valid_responses)}"}
+    if response_lower not in VALID_RESPONSES:
+        return {"error": f"Invalid response. Must be one of: {', '.join(VALID_RESPONSES)}"}
 
     try:
-        # Get the event to ensure it exists and to get current attendees
-        event = service.events().get(calendarId='primary', eventId=event_id).execute()
-
-        # Find the current user's attendee record based on the 'self' field if available
-        user_attendee_found = False
-        attendees = event.get('attendees', [])
-        for attendee in attendees:
-            if attendee.get('self', False):
-                attendee['responseStatus'] = response_lower
-                user_attendee_found = True
-                break
-
-        # Fallback: If 'self' field is not present, find by email (less reliable)
-        if not user_attendee_found:
-            user_email = service.calendarList().get(calendarId='primary').execute().get('id')
-            if not user_email:
-                 return {"error": "Could not determine primary calendar user email to update status."}
-            for attendee in attendees:
-                 if attendee.get('email') == user_email:
-                    attendee['responseStatus'] = response_lower
-                    user_attendee_found = True
-                    break
-
-        if not user_attendee_found:
-            return {"error": "Could not find your attendee record for this event, or you might not be an attendee."}
-
-        # Update the event with the modified attendee list
-        # Crucially, sendUpdates='all' notifies other attendees
-        updated_event = service.events().update(
-            calendarId='primary',
-            eventId=event_id,
-            body={'attendees': attendees}, # Only send updated attendees
-            sendUpdates='all'
-        ).execute()
+        user_email = _primary_id(service)
+        if not user_email:
+            return {"error": "Could not determine primary calendar user email to update status."}
+        updated_event = _response_patch(service, event_id, user_email, response_lower).execute()
 
+        briefing.invalidate("events", "invitations")
         return {"success": f"Successfully responded '{response_lower}' to event '{updated_event.get('summary', event_id)}'."}
 
     except HttpError as error:
-        print(f"An error occurred: {error}")
-        if error.resp.status == 404:
-             return {"error": f"Event with ID '{event_id}' not found."}
-        elif error.resp.status == 403:
-             return {"error": f"Permission denied. You might not have rights to modify this event or respond."}
-        return {"error": f"Failed to respond to invitation: {error}"}
+        log.error("An error occurred: %s", error)
+        return {"error": _response_error(error, event_id)}
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        log.exception("An unexpected error occurred: %s", e)
         return {"error": f"An unexpected error occurred: {e}"}
 
 
-@function_tool
+class InvitationResponse(BaseModel):
+    event_id: str
+    response: str  # 'accepted', 'declined' or 'tentative'
+
+
+@function_tool(failure_error_function=google_tool_error)
+def respond_to_invitations(responses: list[InvitationResponse]) -> list[dict]:
+    """Responds to several event invitations at once (e.g. "decline all my meetings on Friday").
+    Args:
+        responses: One entry per invitation: its event ID and 'accepted', 'declined' or 'tentative'.
+    """
+    from googleapiclient.errors import HttpError
+    service = get_calendar_service()
+    results = [{"event_id": r.event_id} for r in responses]
+    valid = [i for i, r in enumerate(responses) if r.response.lower() in VALID_RESPONSES]
+    for i in set(range(len(responses))) - set(valid):
+        results[i]["error"] = f"Invalid response. Must be one of: {', '.join(VALID_RESPONSES)}"
+    if not valid:
+        return results
+
+    try:
+        user_email = _primary_id(service)
+        if not user_email:
+            return [{"error": "Could not determine primary calendar user email to update status."}]
+        outcomes = _execute_batch(service, [
+            lambda r=responses[i]: _response_patch(service, r.event_id, user_email, r.response.lower()) for i in valid
+        ])
+    except HttpError as error:
+        log.error("An error occurred: %s", error)
+        return [{"error": f"Failed to respond to invitations: {error}"}]
+    except Exception as e:
+        log.exception("An unexpected error occurred: %s", e)
+        return [{"error": f"An unexpected error occurred: {e}"}]
+
+    for i, (event, error) in zip(valid, outcomes):
+        if error is not None:
+            results[i]["error"] = _response_error(error, responses[i].event_id)
+        else:
+            results[i]["success"] = f"Responded '{responses[i].response.lower()}' to event '{event.get('summary', responses[i].event_id)}'."
+    if any("success" in r for r in results):
+        briefing.invalidate("events", "invitations")
+    return results
+
+
+@function_tool(failure_error_function=google_tool_error)
 def create_calendar_event(summary: str, start_datetime: str, end_datetime: str, attendees: list[str] = None, description: str = None) -> dict:
     """Creates a new event in the user's primary Google Calendar.
     Args:
@@ -184,8 +306,31 @@ def create_calendar_event(summary: str, start_datetime: str, end_datetime: str,
         attendees: A list of email addresses of people to invite. Can be None or empty.
         description: An optional description or notes for the event.
     """
+    from googleapiclient.errors import HttpError
     service = get_calendar_service()
+    event_body = _event_body(summary, start_datetime, end_datetime, attendees, description)
+
+    log.debug("Creating event: %s from %s to %s", summary, start_datetime, end_datetime)
+    try:
+        # Use sendUpdates='all' to notify attendees
+        created_event = service.events().insert(
+            calendarId='primary', 
+            body=event_body,
+            sendUpdates='all' 
+        ).execute()
+        
+        log.debug("Event created: %s", created_event.get('htmlLink'))
+        briefing.invalidate("events")
+        return {"success": f"Event '{summary}' created successfully.", "event_link": created_event.get('htmlLink')}
 
+    except HttpError as error:
+        log.error("An error occurred: %s", error)
+        return {"error": f"Failed to create event: {_error_details(error)}"}
+    except Exception as e:
+        log.exception("An unexpected error occurred: %s", e)
+        return {"error": f"An unexpected error occurred: {e}"} 
+
+def _event_body(summary, start_datetime, end_datetime, attendees=None, description=None) -> dict:
     event_body = {
         'summary': summary,
         'description': description if description else '',
@@ -205,32 +350,184 @@ def create_calendar_event(summary: str, start_datetime: str, end_datetime: str,
 
     if attendees:
         event_body['attendees'] = [{'email': email} for email in attendees]
+    return event_body
+
+class NewEvent(BaseModel):
+    summary: str
+    start_datetime: str  # ISO 8601, e.g. '2024-07-21T10:00:00+02:00'
+    end_datetime: str
+    attendees: Optional[list[str]] = None
+    description: Optional[str] = None
 
-    print(f"Creating event: {summary} from {start_datetime} to {end_datetime}")
+@function_tool(failure_error_function=google_tool_error)
+def create_calendar_events(events: list[NewEvent]) -> list[dict]:
+    """Creates several events in the user's primary Google Calendar at once.
+    Args:
+        events: The events: summary, start and end datetimes in ISO 8601 format (e.g. '2024-07-21T10:00:00+02:00'),
+            optional attendee email addresses and an optional description.
+    """
+    from googleapiclient.errors import HttpError
+    service = get_calendar_service()
+    log.debug("Creating %d events", len(events))
+    # each event gets its id up front, so a retried insert that had gone through answers 409 instead of duplicating it
+    event_ids = [uuid.uuid4().hex for _ in events]
     try:
-        # Use sendUpdates='all' to notify attendees
-        created_event = service.events().insert(
-            calendarId='primary', 
-            body=event_body,
-            sendUpdates='all' 
-        ).execute()
-        
-        print(f"Event created: {created_event.get('htmlLink')}")
-        return {"success": f"Event '{summary}' created successfully.", "event_link": created_event.get('htmlLink')}
+        outcomes = _execute_batch(service, [
+            lambda e=e, event_id=event_id: service.events().insert(
+                calendarId='primary',
+                body={**_event_body(e.summary, e.start_datetime, e.end_datetime, e.attendees, e.description), 'id': event_id},
+                sendUpdates='all',
+            ) for e, event_id in zip(events, event_ids)
+        ])
+    except HttpError as error:
+        log.error("An error occurred: %s", error)
+        return [{"error": f"Failed to create events: {_error_details(error)}"}]
+    except Exception as e:
+        log.exception("An unexpected error occurred: %s", e)
+        return [{"error": f"An unexpected error occurred: {e}"}]
 
+    results = []
+    for event, (created, error) in zip(events, outcomes):
+        if isinstance(error, HttpError) and error.resp.status == 409:  # created by the first attempt
+            results.append({"summary": event.summary, "success": "Event created."})
+        elif error is not None:
+            results.append({"summary": event.summary, "error": f"Failed to create event: {_error_details(error)}"})
+        else:
+            results.append({"summary": event.summary, "success": "Event created.", "event_link": created.get('htmlLink')})
+    if any("success" in r for r in results):
+        briefing.invalidate("events")
+    return results
+
+def home_city() -> str | None:
+    """The city of the primary calendar's time zone (e.g. "Europe/Lisbon" -> "Lisbon"), if it names one."""
+    zone = get_calendar_service().calendarList().get(calendarId='primary').execute().get('timeZone') or ''
+    if '/' not in zone:
+        return None
+    return zone.rsplit('/', 1)[1].replace('_', ' ')
+
+def _parse_rfc3339(value: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def _merge_intervals(intervals):
+    """Merges overlapping or touching (start, end) intervals; O(n log n)."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return merged
+
+def _free_windows(busy, windows, min_duration):
+    """Gaps of at least `min_duration` inside each window, given merged, sorted busy intervals."""
+    free = []
+    i = 0
+    for win_start, win_end in windows:
+        # busy intervals are sorted and windows ascend, so the pointer never moves back
+        while i < len(busy) and busy[i][1] <= win_start:
+            i += 1
+        cursor = win_start
+        j = i
+        while j < len(busy) and busy[j][0] < win_end:
+            if busy[j][0] - cursor >= min_duration:
+                free.append((cursor, busy[j][0]))
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if win_end - cursor >= min_duration:
+            free.append((cursor, win_end))
+    return free
+
+@function_tool(failure_error_function=google_tool_error)
+def find_free_slots(
+    duration_minutes: int,
+    start_days_from_now: int = 0,
+    end_days_from_now: int = 7,
+    calendars: list[str] = None,
+    work_start_hour: int = 9,
+    work_end_hour: int = 17,
+    timezone: str = "UTC",
+    include_weekends: bool = False,
+    max_slots: int = 10,
+) -> list[dict]:
+    """Finds free time slots of at least `duration_minutes` across your calendar and, optionally,
+    other people's calendars, using the free/busy API (no event details are downloaded).
+    Args:
+        duration_minutes: Minimum length of a slot in minutes.
+        start_days_from_now: The starting day offset from today (0 for today).
+        end_days_from_now: The ending day offset from today (e.g., 7 for the next week).
+        calendars: Extra calendar IDs or attendee email addresses that must also be free.
+        work_start_hour: Start of working hours (0-23) in `timezone`.
+        work_end_hour: End of working hours (1-24) in `timezone`.
+        timezone: IANA time zone for working hours and results, e.g. 'Europe/Lisbon'.
+        include_weekends: Whether Saturdays and Sundays count as working days.
+        max_slots: Maximum number of slots to return.
+    """
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+    from googleapiclient.errors import HttpError
+
+    if duration_minutes <= 0:
+        return [{"error": "duration_minutes must be positive."}]
+    if not 0 <= work_start_hour < work_end_hour <= 24:
+        return [{"error": "Working hours must satisfy 0 <= work_start_hour < work_end_hour <= 24."}]
+    if end_days_from_now <= start_days_from_now:
+        return [{"error": "end_days_from_now must be greater than start_days_from_now."}]
+    try:
+        tz = ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        return [{"error": f"Unknown time zone '{timezone}'."}]
+
+    now = datetime.datetime.now(tz)
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    range_start = max(now, midnight + datetime.timedelta(days=start_days_from_now))
+    range_end = midnight + datetime.timedelta(days=end_days_from_now)
+    calendar_ids = ['primary'] + [c for c in (calendars or []) if c and c != 'primary']
+
+    service = get_calendar_service()
+    log.debug("Querying free/busy for %d calendar(s) from %s to %s", len(calendar_ids), range_start, range_end)
+    try:
+        result = service.freebusy().query(body={
+            'timeMin': range_start.isoformat(),
+            'timeMax': range_end.isoformat(),
+            'timeZone': timezone,
+            'items': [{'id': c} for c in calendar_ids],
+        }).execute()
     except HttpError as error:
-        print(f"An error occurred: {error}")
-        error_details = error.resp.reason
-        try:
-            # Attempt to parse more specific error details from the response body
-            error_content = error.content.decode('utf-8')
-            import json
-            error_json = json.loads(error_content)
-            if 'error' in error_json and 'message' in error_json['error']:
-                error_details = error_json['error']['message']
-        except Exception:
-            pass # Stick with the reason if parsing fails
-        return {"error": f"Failed to create event: {error_details}"}
+        log.error("An error occurred: %s", error)
+        return [{"error": f"Failed to query free/busy: {error}"}]
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
-        return {"error": f"An unexpected error occurred: {e}"} 
\ No newline at end of file
+        log.exception("An unexpected error occurred: %s", e)
+        return [{"error": f"An unexpected error occurred: {e}"}]
+
+    intervals, problems = [], []
+    for cal_id, info in result.get('calendars', {}).items():
+        for err in info.get('errors', []):
+            # e.g. 'notFound' for calendars the user can't see; they're treated as free
+            problems.append({"calendar": cal_id, "error": err.get('reason', 'unknown')})
+        for b in info.get('busy', []):
+            intervals.append((_parse_rfc3339(b['start']), _parse_rfc3339(b['end'])))
+    busy = _merge_intervals(intervals)
+
+    windows = []
+    day = range_start.date()
+    while day < range_end.date():
+        if include_weekends or day.weekday() < 5:
+            win_start = datetime.datetime.combine(day, datetime.time(work_start_hour), tz)
+            win_end = (datetime.datetime.combine(day, datetime.time(0), tz)
+                       + datetime.timedelta(hours=work_end_hour))
+            win_start, win_end = max(win_start, range_start), min(win_end, range_end)
+            if win_start < win_end:
+                windows.append((win_start, win_end))
+        day += datetime.timedelta(days=1)
+
+    slots = [
+        {
+            "start": start.astimezone(tz).isoformat(timespec='minutes'),
+            "end": end.astimezone(tz).isoformat(timespec='minutes'),
+            "free_minutes": int((end - start).total_seconds() // 60),
+        }
+        for start, end in _free_windows(busy, windows, datetime.timedelta(minutes=duration_minutes))[:max_slots]
+    ]
+    if not slots:
+        slots = [{"info": "No free slots of that length found in the specified range."}]
+    return slots + problems
@@ -1,7 +1,6 @@
 import io
 from agents import function_tool
-from tools.auth import get_drive_service
-from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload
+from tools.auth import get_drive_service, google_tool_error
 
 def get_drive_file_id_by_name(service, name, parent_folder_id=None):
     query = f"name = '{name}'"
@@ -11,7 +10,7 @@ def get_drive_file_id_by_name(service, name, parent_folder_id=None):
     files = results.get("files", [])
     return files[0]["id"] if files else None
 
-@function_tool
+@function_tool(failure_error_function=google_tool_error)
 def list_drive_files(folder_name: str) -> list[dict]:
     """Lists files within a specified Google Drive folder."""
     service = get_drive_service()
@@ -20,9 +19,11 @@ def list_drive_files(folder_name: str) -> list[dict]:
     results = service.files().list(q=query, pageSize=10, fields="files(id, name)").execute()
     return results.get("files", [])
 
-@function_tool
+@function_tool(failure_error_function=google_tool_error)
 def read_drive_file(file_name: str, folder_name: str) -> str:
     """Reads the content of a specified file from Google Drive."""
+    from googleapiclient.http import MediaIoBaseDownload
+
     service = get_drive_service()
     folder_id = get_drive_file_id_by_name(service, folder_name) if folder_name else None
     file_id = get_drive_file_id_by_name(service, file_name, parent_folder_id=folder_id)
@@ -45,9 +46,11 @@ def read_drive_file(file_name: str, folder_name: str) -> str:
     fh.seek(0)
     return fh.read().decode("utf-8")
 
-@function_tool
+@function_tool(failure_error_function=google_tool_error)
 def upload_drive_file(file_path: str, drive_filename: str) -> str:
     """Uploads a local file to Google Drive with a specified name."""
+    from googleapiclient.http import MediaFileUpload
+
     service = get_drive_service()
     media = MediaFileUpload(file_path, resumable=True)
     file_metadata = {"name": drive_filename}
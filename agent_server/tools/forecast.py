@@ -0,0 +1,146 @@
+# forecast.py
+"""
+Columnar forecasts: OpenWeather One Call `hourly` / `daily` lists kept as
+parallel typed columns (stdlib `array`) instead of lists of JSON dicts.
+
+An hour takes ~30 bytes instead of a ~1 KB dict, the cached form is the raw
+column bytes, and aggregates run over contiguous machine values with
+builtins (min/max/sum/accumulate) rather than per-row Python code.
+"""
+import base64
+from array import array
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from operator import sub
+from typing import Callable, Optional
+
+# column name -> (array typecode, extractor from one One Call entry)
+Schema = dict[str, tuple[str, Callable[[dict], float]]]
+
+HOURLY: Schema = {
+    "dt": ("q", lambda h: h["dt"]),
+    "temp": ("f", lambda h: h["temp"]),
+    "feels_like": ("f", lambda h: h.get("feels_like", h["temp"])),
+    "pop": ("f", lambda h: h.get("pop", 0.0)),
+    "rain": ("f", lambda h: (h.get("rain") or {}).get("1h", 0.0)),
+    "wind_speed": ("f", lambda h: h.get("wind_speed", 0.0)),
+    "humidity": ("B", lambda h: h.get("humidity", 0)),
+}
+
+DAILY: Schema = {
+    "dt": ("q", lambda d: d["dt"]),
+    "temp_day": ("f", lambda d: d["temp"]["day"]),
+    "temp_night": ("f", lambda d: d["temp"]["night"]),
+    "temp_min": ("f", lambda d: d["temp"].get("min", min(d["temp"]["day"], d["temp"]["night"]))),
+    "temp_max": ("f", lambda d: d["temp"].get("max", max(d["temp"]["day"], d["temp"]["night"]))),
+    "pop": ("f", lambda d: d.get("pop", 0.0)),
+    "rain": ("f", lambda d: d.get("rain", 0.0)),
+    "wind_speed": ("f", lambda d: d.get("wind_speed", 0.0)),
+    "humidity": ("B", lambda d: d.get("humidity", 0)),
+}
+
+RAIN_LIKELY = 0.5  # precipitation probability from which an hour counts as rainy
+COMFORT_TEMP = 21.0  # °C, the feels-like temperature the outdoor score prefers
+
+
+class Forecast:
+    """
+    A forecast series as typed columns, one entry per hour (or day).
+
+    Descriptions are interned: `codes` holds an index into `descriptions` per entry.
+    Slicing returns a Forecast over the same window of every column.
+    """
+
+    def __init__(self, schema: Schema, columns: dict[str, array], codes: array,
+                 descriptions: list[str], tz_offset: int = 0):
+        self.schema = schema
+        self.columns = columns
+        self.codes = codes
+        self.descriptions = descriptions
+        self.tz_offset = tz_offset
+
+    @classmethod
+    def parse(cls, schema: Schema, entries: list[dict], tz_offset: int = 0) -> "Forecast":
+        descriptions: list[str] = []
+        index: dict[str, int] = {}
+        codes = array("H")
+        for entry in entries:
+            weather = entry.get("weather") or [{}]
+            description = weather[0].get("description", "")
+            codes.append(index.setdefault(description, len(index)))
+            if len(index) > len(descriptions):
+                descriptions.append(description)
+        columns = {name: array(code, map(get, entries)) for name, (code, get) in schema.items()}
+        return cls(schema, columns, codes, descriptions, tz_offset)
+
+    def to_json(self) -> dict:
+        """JSON-serializable form for the cache: each column's raw bytes, base64-encoded."""
+        return {
+            "columns": {name: base64.b64encode(col.tobytes()).decode() for name, col in self.columns.items()},
+            "codes": base64.b64encode(self.codes.tobytes()).decode(),
+            "descriptions": self.descriptions,
+            "tz_offset": self.tz_offset,
+        }
+
+    @classmethod
+    def from_json(cls, schema: Schema, data: dict) -> "Forecast":
+        def column(typecode: str, encoded: str) -> array:
+            values = array(typecode)
+            values.frombytes(base64.b64decode(encoded))
+            return values
+
+        columns = {name: column(code, data["columns"][name]) for name, (code, _) in schema.items()}
+        return cls(schema, columns, column("H", data["codes"]), data["descriptions"], data["tz_offset"])
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, name: str) -> array:
+        return self.columns[name]
+
+    def window(self, start: int, stop: int) -> "Forecast":
+        columns = {name: col[start:stop] for name, col in self.columns.items()}
+        return Forecast(self.schema, columns, self.codes[start:stop], self.descriptions, self.tz_offset)
+
+    def time(self, i: int) -> datetime:
+        """Local time of entry `i` (the location's UTC offset as reported by OpenWeather)."""
+        tz = timezone(timedelta(seconds=self.tz_offset))
+        return datetime.fromtimestamp(self["dt"][i], tz)
+
+    def description(self, i: int) -> str:
+        return self.descriptions[self.codes[i]]
+
+    def most_common_description(self) -> str:
+        if not self.codes:
+            return "n/a"
+        counts = [0] * len(self.descriptions)
+        for code in self.codes:
+            counts[code] += 1
+        return self.descriptions[counts.index(max(counts))]
+
+
+def spread(column: array) -> tuple[float, float, float]:
+    """(min, max, mean) of a non-empty column."""
+    return min(column), max(column), sum(column) / len(column)
+
+
+def rain_hours(forecast: Forecast) -> int:
+    """Entries with rain falling or a precipitation probability of at least RAIN_LIKELY."""
+    return sum(map(lambda pop, rain: pop >= RAIN_LIKELY or rain > 0, forecast["pop"], forecast["rain"]))
+
+
+def outdoor_scores(forecast: Forecast) -> array:
+    """Per-hour discomfort (lower is better): rain chance and rain, distance from COMFORT_TEMP, strong wind."""
+    return array("f", map(
+        lambda pop, rain, feels, wind: 4 * pop + 2 * (rain > 0) + abs(feels - COMFORT_TEMP) / 4 + max(0.0, wind - 6) / 2,
+        forecast["pop"], forecast["rain"], forecast["feels_like"], forecast["wind_speed"],
+    ))
+
+
+def best_window(forecast: Forecast, hours: int) -> Optional[int]:
+    """Start index of the `hours`-long window with the lowest total outdoor score, or None if too short."""
+    if hours <= 0 or hours > len(forecast):
+        return None
+    prefix = array("d", accumulate(outdoor_scores(forecast), initial=0.0))
+    totals = list(map(sub, prefix[hours:], prefix[:-hours]))
+    return totals.index(min(totals))
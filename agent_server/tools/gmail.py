@@ -2,11 +2,16 @@ import base64
 from datetime import datetime, timedelta
 from email.mime.text import MIMEText
 from agents import function_tool
-from tools.auth import get_gmail_service
+from core import briefing
+from tools.auth import get_gmail_service, google_tool_error
 
-@function_tool
+@function_tool(failure_error_function=google_tool_error)
 def list_recent_emails(max_results: int) -> list[dict]:
     """Lists recent emails from the user's Gmail account."""
+    return fetch_recent_emails(max_results)  # always live; only get_daily_briefing serves the snapshot
+
+def fetch_recent_emails(max_results: int) -> list[dict]:
+    """Metadata of the most recent emails, fetched live."""
     gmail = get_gmail_service()
     results = gmail.users().messages().list(userId="me", maxResults=max_results).execute()
     messages = results.get("messages", [])
@@ -22,7 +27,7 @@ def list_recent_emails(max_results: int) -> list[dict]:
         })
     return output
 
-@function_tool
+@function_tool(failure_error_function=google_tool_error)
 def read_emails(max_results: int, sender: str = None, since_days: int = None) -> list[dict]:
     """Reads emails from the user's Gmail account, optionally filtering by sender and time."""
     gmail = get_gmail_service()
@@ -50,7 +55,7 @@ def read_emails(max_results: int, sender: str = None, since_days: int = None) ->
         })
     return emails
 
-@function_tool
+@function_tool(failure_error_function=google_tool_error)
 def send_email(to: str, subject: str, body: str) -> str:
     """Sends an email using the user's Gmail account."""
     gmail = get_gmail_service()
@@ -59,4 +64,5 @@ def send_email(to: str, subject: str, body: str) -> str:
     message["subject"] = subject
     raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode("utf-8")
     gmail.users().messages().send(userId="me", body={"raw": raw_message}).execute()
+    briefing.invalidate("emails")  # sent mail shows up among the recent messages
     return "Email sent successfully."
@@ -0,0 +1,10 @@
+from agents import function_tool
+from core import governor
+
+@function_tool
+def read_more(cursor: str):
+    """Returns the next page of a tool result that was truncated. Pass the cursor from its "read_more" marker."""
+    page = governor.next_page(cursor)
+    if page is None:
+        return f"Cursor {cursor!r} is unknown or expired. Call the original tool again."
+    return page
@@ -1,28 +1,23 @@
 import os
-import requests
 from agents import function_tool
 from dotenv import load_dotenv
-from supabase import create_client, Client  # install with `pip install supabase`
-import json
+from core import db, deadline, ratelimit
+from core.cache import MemoryCache
+from core.logger import get_logger
+
+log = get_logger("tools.todo")
 
 load_dotenv()
 
-SUPABASE_URL = os.getenv("SUPABASE_URL")  # AI assistant's Supabase project
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")  # Service role key (used only server-side)
 TODO_APP_URL = os.getenv("TODO_APP_URL")  # E.g., https://todo-organisor.vercel.app
 
-# Add debug prints for environment variables
-print(f"[TODO DEBUG] SUPABASE_URL: {'set' if SUPABASE_URL else 'not set'}")
-print(f"[TODO DEBUG] SUPABASE_KEY: {'set' if SUPABASE_KEY else 'not set'}")
-print(f"[TODO DEBUG] TODO_APP_URL: {TODO_APP_URL}")
+log.debug("SUPABASE_URL: %s, SUPABASE_KEY: %s, TODO_APP_URL: %s",
+          "set" if db.SUPABASE_URL else "not set", "set" if db.SUPABASE_KEY else "not set", TODO_APP_URL)
+
+API_KEY_TTL = float(os.getenv("TODO_API_KEY_CACHE_TTL", "300"))
 
-# Initialize Supabase client with error handling
-try:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    print("[TODO DEBUG] Supabase client initialized successfully")
-except Exception as e:
-    print(f"[TODO ERROR] Failed to initialize Supabase client: {str(e)}")
-    supabase = None
+# API keys are secrets: kept in process memory, never in the shared (possibly on-disk) cache
+_api_keys = MemoryCache(max_entries=1000)
 
 @function_tool
 def create_todo_task(
@@ -58,32 +53,34 @@ def create_todo_task(
         env_user_id = os.environ.get("CURRENT_USER_ID")
         if env_user_id:
             user_id = env_user_id
-            print(f"[TODO DEBUG] Using CURRENT_USER_ID from environment: {user_id}")
+            log.debug("Using CURRENT_USER_ID from environment: %s", user_id)
         else:
             return "Error: No user ID provided. Please ensure you are logged in."
     
-    print(f"[TODO DEBUG] create_todo_task called with user_id: {user_id}")
-    
-    if not supabase:
-        return "Error: Unable to connect to the database. Please check server configuration."
+    log.debug("create_todo_task called with user_id: %s", user_id)
     
-    # Look up the user's saved API key
-    try:
-        print(f"[TODO DEBUG] Querying todo_api_keys table for user_id: {user_id}")
+    import requests
+
+    # Look up the user's saved API key (found keys are cached, so workers don't each hit Supabase)
+    def lookup_token():
+        supabase = db.get_supabase()
+        if not supabase:
+            raise ConnectionError("Unable to connect to the database. Please check server configuration.")
+        deadline.timeout()  # don't start the lookup once the request is out of time
         response = supabase.table("todo_api_keys").select("token").eq("user_id", user_id).execute()
-        
-        print(f"[TODO DEBUG] API key query response: {json.dumps(response.dict(), default=str, indent=2)}")
-        
-        # Check if data exists and is not empty
-        if not response.data or len(response.data) == 0:
-            return "No API key found for your account. Please add an API key in the API Keys management page."
-        
+        log.debug("API key lookup for user_id %s returned %d row(s)", user_id, len(response.data or []))
         # Use the first API key found
-        token = response.data[0]["token"]
-        print(f"[TODO DEBUG] Found API key: {token[:5]}...{token[-5:] if len(token) > 10 else ''}")
+        return response.data[0]["token"] if response.data else None
+
+    try:
+        token = _api_keys.get_or_compute(user_id, lookup_token, ttl=API_KEY_TTL)
+    except ConnectionError as e:
+        return f"Error: {e}"
     except Exception as e:
-        print(f"[TODO ERROR] Exception when fetching API key: {str(e)}")
+        log.error("Exception when fetching API key: %s", e)
         return f"Error retrieving API key: {str(e)}"
+    if not token:
+        return "No API key found for your account. Please add an API key in the API Keys management page."
 
     # Construct payload
     payload = {
@@ -96,30 +93,36 @@ def create_todo_task(
         "time_estimate": time_estimate
     }
     
-    print(f"[TODO DEBUG] Sending request to {TODO_APP_URL}/api/new_tasks")
-    print(f"[TODO DEBUG] Payload: {json.dumps(payload, indent=2)}")
+    log.debug("Sending request to %s/api/new_tasks, payload: %s", TODO_APP_URL, payload)
 
     # Send request
     try:
         if not TODO_APP_URL:
             return "Error: TODO_APP_URL is not configured in the server environment."
             
+        ratelimit.acquire("todo")
         r = requests.post(
             f"{TODO_APP_URL}/api/new_tasks",
             json=payload,
-            headers={"x-api-key": token}
+            headers={"x-api-key": token},
+            timeout=deadline.timeout(),
         )
         
-        print(f"[TODO DEBUG] Response status: {r.status_code}")
-        print(f"[TODO DEBUG] Response body: {r.text[:500]}")  # Limit output length
+        log.debug("Response: HTTP %s %.500s", r.status_code, r.text)
 
         if r.status_code == 200:
             return "Task successfully created in your to-do app."
+        elif r.status_code == 429:
+            # not retried: the task may have been created after all
+            ratelimit.backoff("todo", r.headers.get("Retry-After"))
+            return "The to-do app is busy right now. Please try again in a moment."
         else:
             return f"Failed to create task. API responded with: HTTP {r.status_code} - {r.text}"
-    except requests.RequestException as e:
-        print(f"[TODO ERROR] Request exception: {str(e)}")
+    except ratelimit.RateLimited as e:
+        return f"The to-do app is busy right now, try again in {e.retry_after:.1f}s."
+    except (requests.RequestException, deadline.DeadlineExceeded) as e:
+        log.error("Request exception: %s", e)
         return f"Error calling to-do API: {str(e)}"
     except Exception as e:
-        print(f"[TODO ERROR] Unexpected exception: {str(e)}")
+        log.exception("Unexpected exception: %s", e)
         return f"Unexpected error: {str(e)}"
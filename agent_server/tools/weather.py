@@ -2,27 +2,102 @@
 import os
 import requests
 from dotenv import load_dotenv
-from datetime import datetime
-import sys
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from core import deadline, ratelimit
+from tools.forecast import DAILY, HOURLY, Forecast, best_window, rain_hours, spread
+from core.cache import get_cache
+from core.logger import get_logger
+
+log = get_logger("tools.weather")
 
 load_dotenv()
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+OPENWEATHER_BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org").rstrip("/")
+GEOCODE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", str(30 * 86400)))  # cities don't move
+FORECAST_TTL = float(os.getenv("FORECAST_CACHE_TTL", "600"))
+
+# shared with other workers and the MCP subprocess when CACHE_BACKEND=sqlite
+_geocodes = get_cache("weather:geocode")
+_forecasts = get_cache("weather:forecast")
+
+def _get(url: str, retry: bool = True) -> requests.Response:
+    """
+    GET from OpenWeather within the request's remaining time budget and its
+    rate limit; a 429 pauses OpenWeather for its Retry-After and is retried once.
+    """
+    try:
+        ratelimit.acquire("openweather")
+        response = requests.get(url, timeout=deadline.timeout())
+    except ratelimit.RateLimited as e:
+        raise ValueError(f"Weather service is busy, try again in {e.retry_after:.1f}s")
+    except requests.RequestException as e:
+        raise ValueError(f"Weather service unavailable: {e.__class__.__name__}")
+    if response.status_code == 429:
+        ratelimit.backoff("openweather", response.headers.get("Retry-After"))
+        if retry:
+            return _get(url, retry=False)
+    return response
 
 def get_coordinates(city: str):
     """
     Get latitude and longitude for a given city using OpenWeatherMap's Geocoding API.
     """
-    geocode_url = (
-        f"http://api.openweathermap.org/geo/1.0/direct"
-        f"?q={city}&limit=1&appid={OPENWEATHER_API_KEY}"
-    )
-    print(f"[DEBUG] Geocoding URL: {geocode_url}", file=sys.stderr)
-    response = requests.get(geocode_url)
-    print(f"[DEBUG] Geocode status: {response.status_code}", file=sys.stderr)
-    if response.status_code != 200 or not response.json():
-        raise ValueError(f"Could not retrieve coordinates for {city}")
-    data = response.json()[0]
-    return data['lat'], data['lon']
+    def lookup():
+        geocode_url = (
+            f"{OPENWEATHER_BASE_URL}/geo/1.0/direct"
+            f"?q={city}&limit=1&appid={OPENWEATHER_API_KEY}"
+        )
+        response = _get(geocode_url)
+        log.debug("Geocode %r -> HTTP %s", city, response.status_code)
+        if response.status_code != 200 or not response.json():
+            raise ValueError(f"Could not retrieve coordinates for {city}")
+        data = response.json()[0]
+        return [data['lat'], data['lon']]
+
+    lat, lon = _geocodes.get_or_compute(city.strip().casefold(), lookup, ttl=GEOCODE_TTL)
+    return lat, lon
+
+def _fetch_current(lat: float, lon: float) -> dict:
+    """Fetch the current conditions for a coordinate pair (cached for FORECAST_TTL)."""
+    def fetch():
+        url = (
+            f"{OPENWEATHER_BASE_URL}/data/2.5/weather"
+            f"?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
+        )
+        response = _get(url)
+        log.debug("Current weather (%s, %s) -> HTTP %s", lat, lon, response.status_code)
+        if response.status_code != 200:
+            raise ValueError(f"Failed to retrieve weather data: {response.text}")
+        return response.json()
+
+    return _forecasts.get_or_compute(f"current:{lat:.4f},{lon:.4f}", fetch, ttl=FORECAST_TTL)
+
+def _fetch_forecast(lat: float, lon: float) -> tuple[Forecast, Forecast]:
+    """
+    Fetch the hourly and daily One Call forecast in one request, as columnar
+    Forecasts (cached in their compact form for FORECAST_TTL).
+    """
+    def fetch():
+        url = (
+            f"{OPENWEATHER_BASE_URL}/data/3.0/onecall"
+            f"?lat={lat}&lon={lon}&exclude=current,minutely,alerts"
+            f"&appid={OPENWEATHER_API_KEY}&units=metric"
+        )
+        response = _get(url)
+        log.debug("One Call forecast (%s, %s) -> HTTP %s", lat, lon, response.status_code)
+        if response.status_code != 200:
+            raise ValueError(f"Failed to retrieve forecast: {response.text}")
+        data = response.json()
+        offset = data.get("timezone_offset", 0)
+        return {
+            "hourly": Forecast.parse(HOURLY, data.get("hourly", []), offset).to_json(),
+            "daily": Forecast.parse(DAILY, data.get("daily", []), offset).to_json(),
+        }
+
+    cached = _forecasts.get_or_compute(f"forecast:{lat:.4f},{lon:.4f}", fetch, ttl=FORECAST_TTL)
+    return Forecast.from_json(HOURLY, cached["hourly"]), Forecast.from_json(DAILY, cached["daily"])
 
 def get_weather(city: str) -> str:
     """
@@ -30,21 +105,10 @@ def get_weather(city: str) -> str:
     """
     try:
         lat, lon = get_coordinates(city)
+        data = _fetch_current(lat, lon)
     except ValueError as e:
         return str(e)
 
-    url = (
-        f"https://api.openweathermap.org/data/2.5/weather"
-        f"?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}&units=metric"
-    )
-    print(f"[DEBUG] Weather URL: {url}", file=sys.stderr)
-    response = requests.get(url)
-    print(f"[DEBUG] Weather status: {response.status_code}", file=sys.stderr)
-
-    if response.status_code != 200:
-        return f"Failed to retrieve weather data: {response.text}"
-
-    data = response.json()
     weather = data["weather"][0]["description"]
     temperature = data["main"]["temp"]
     feels_like = data["main"]["feels_like"]
@@ -60,58 +124,189 @@ def get_hourly_forecast(city: str, hours: int) -> str:
     """
     Get hourly weather forecast (up to 48 hours)
     """
-    print(f"[DEBUG] get_hourly_forecast(city={city!r}, hours={hours})", file=sys.stderr)
+    log.debug("get_hourly_forecast(city=%r, hours=%s)", city, hours)
     if hours <= 0 or hours > 48:
         return "Please specify a number of hours between 1 and 48."
     try:
         lat, lon = get_coordinates(city)
+        hourly = _fetch_forecast(lat, lon)[0].window(0, hours)
     except ValueError as e:
         return str(e)
 
-    url = (
-        f"https://api.openweathermap.org/data/3.0/onecall"
-        f"?lat={lat}&lon={lon}&exclude=current,minutely,daily,alerts"
-        f"&appid={OPENWEATHER_API_KEY}&units=metric"
+    temp, pop, wind = hourly["temp"], hourly["pop"], hourly["wind_speed"]
+    rows = [f"Hourly forecast for {city} (local time):"]
+    rows.extend(
+        f" - {hourly.time(i):%Y-%m-%d %H:%M}: {hourly.description(i)}, {temp[i]:.1f}°C, "
+        f"rain {pop[i]:.0%}, wind {wind[i]:.1f} m/s"
+        for i in range(len(hourly))
     )
-    print(f"[DEBUG] Hourly URL: {url}", file=sys.stderr)
-    response = requests.get(url)
-    if response.status_code != 200:
-        return f"Failed to retrieve hourly forecast: {response.text}"
-
-    data = response.json().get("hourly", [])
-    output = f"Hourly forecast for {city}:\n"
-    for hour in data[:hours]:
-        ts = datetime.utcfromtimestamp(hour["dt"]).strftime("%Y-%m-%d %H:%M")
-        output += f" - {ts}: {hour['weather'][0]['description']}, {hour['temp']}°C\n"
-    return output.strip()
+    return "\n".join(rows)
 
 def get_daily_forecast(city: str, days: int) -> str:
     """
     Get daily weather forecast (up to 7 days)
     """
-    print(f"[DEBUG] get_daily_forecast(city={city!r}, days={days})", file=sys.stderr)
+    log.debug("get_daily_forecast(city=%r, days=%s)", city, days)
     if days <= 0 or days > 7:
         return "Please specify a number of days between 1 and 7."
     try:
         lat, lon = get_coordinates(city)
+        daily = _fetch_forecast(lat, lon)[1].window(0, days)
     except ValueError as e:
         return str(e)
 
-    url = (
-        f"https://api.openweathermap.org/data/3.0/onecall"
-        f"?lat={lat}&lon={lon}&exclude=current,minutely,hourly,alerts"
-        f"&appid={OPENWEATHER_API_KEY}&units=metric"
+    day, night, pop = daily["temp_day"], daily["temp_night"], daily["pop"]
+    rows = [f"{days}-day forecast for {city}:"]
+    rows.extend(
+        f" - {daily.time(i):%a %d %b}: {daily.description(i)}, "
+        f"Day {day[i]:.1f}°C / Night {night[i]:.1f}°C, rain {pop[i]:.0%}"
+        for i in range(len(daily))
     )
-    print(f"[DEBUG] Daily URL: {url}", file=sys.stderr)
-    response = requests.get(url)
-    if response.status_code != 200:
-        return f"Failed to retrieve daily forecast: {response.text}"
-
-    data = response.json().get("daily", [])
-    output = f"{days}-day forecast for {city}:\n"
-    for i, d in enumerate(data[:days], 1):
-        output += (
-            f" - Day {i}: {d['weather'][0]['description']}, "
-            f"Day {d['temp']['day']}°C / Night {d['temp']['night']}°C\n"
+    return "\n".join(rows)
+
+def summarize_forecast(city: str, from_hour: int = 0, to_hour: int = 24, outdoor_hours: int = 2) -> str:
+    """
+    Summarize the hourly forecast between `from_hour` and `to_hour` hours from now
+    (0-48): temperature, wind and humidity ranges, rain hours and total, the
+    prevailing conditions and the best `outdoor_hours`-long window for being
+    outside (dry, mild, calm). Prefer this over get_hourly_forecast for
+    questions like "will it rain this afternoon" or "when should I go for a run".
+    """
+    log.debug("summarize_forecast(city=%r, from_hour=%s, to_hour=%s, outdoor_hours=%s)",
+              city, from_hour, to_hour, outdoor_hours)
+    if not 0 <= from_hour < to_hour <= 48:
+        return "Please specify 0 <= from_hour < to_hour <= 48."
+    try:
+        lat, lon = get_coordinates(city)
+        hourly = _fetch_forecast(lat, lon)[0].window(from_hour, to_hour)
+    except ValueError as e:
+        return str(e)
+    if not len(hourly):
+        return f"No hourly forecast available for {city} in that window."
+
+    t_min, t_max, t_mean = spread(hourly["temp"])
+    f_min, f_max, _ = spread(hourly["feels_like"])
+    _, w_max, w_mean = spread(hourly["wind_speed"])
+    h_min, h_max, _ = spread(hourly["humidity"])
+    lines = [
+        f"{city}, {hourly.time(0):%a %H:%M} to {hourly.time(len(hourly) - 1):%a %H:%M} local time ({len(hourly)}h):",
+        f"temperature {t_min:.0f}–{t_max:.0f}°C (mean {t_mean:.1f}°C), feels like {f_min:.0f}–{f_max:.0f}°C",
+        f"wind mean {w_mean:.1f} m/s, max {w_max:.1f} m/s; humidity {h_min}–{h_max}%",
+        f"rain likely in {rain_hours(hourly)}h, {sum(hourly['rain']):.1f} mm total; "
+        f"mostly {hourly.most_common_description()}",
+    ]
+    start = best_window(hourly, outdoor_hours)
+    if start is not None:
+        best = hourly.window(start, start + outdoor_hours)
+        b_min, b_max, _ = spread(best["feels_like"])
+        lines.append(
+            f"best {outdoor_hours}h outdoors: {best.time(0):%a %H:%M}–"
+            f"{best.time(len(best) - 1) + timedelta(hours=1):%H:%M}, feels {b_min:.0f}–{b_max:.0f}°C, "
+            f"rain chance up to {max(best['pop']):.0%}, {best.most_common_description()}"
         )
-    return output.strip()
+    return "\n".join(lines)
+
+
+def _summarize_hours(hourly: Forecast) -> str:
+    if not len(hourly):
+        return "n/a"
+    t_min, t_max, _ = spread(hourly["temp"])
+    return f"{t_min:.0f}–{t_max:.0f}°C, {hourly.most_common_description()}, rain {rain_hours(hourly)}h"
+
+def _summarize_days(daily: Forecast) -> str:
+    day, night = daily["temp_day"], daily["temp_night"]
+    return "; ".join(
+        f"D{i + 1} {day[i]:.0f}/{night[i]:.0f}°C {daily.description(i)}"
+        for i in range(len(daily))
+    ) or "n/a"
+
+def get_weather_batch(cities: list[str], current: bool = True, hourly_hours: int = 0, daily_days: int = 0) -> str:
+    """
+    Get weather for several cities in one call, as a compact table.
+
+    Each requested window is optional: `current` conditions, a summary of the next
+    `hourly_hours` hours (up to 48) and `daily_days` days (up to 7). Geocoding and
+    forecast requests run concurrently, and cities resolving to the same
+    coordinates share a single fetch.
+    """
+    log.debug("get_weather_batch(cities=%r, current=%s, hourly_hours=%s, daily_days=%s)",
+              cities, current, hourly_hours, daily_days)
+    if hourly_hours < 0 or hourly_hours > 48:
+        return "Please specify a number of hours between 0 and 48."
+    if daily_days < 0 or daily_days > 7:
+        return "Please specify a number of days between 0 and 7."
+    if not current and not hourly_hours and not daily_days:
+        return "Please request at least one of: current, hourly_hours, daily_days."
+
+    # de-duplicate city names (case-insensitively), keeping the caller's order
+    unique = {}
+    for c in cities:
+        if c and c.strip():
+            unique.setdefault(c.strip().casefold(), c.strip())
+    names = list(unique.values())
+    if not names:
+        return "Please specify at least one city."
+
+    parts = set()
+    if hourly_hours:
+        parts.add("hourly")
+    if daily_days:
+        parts.add("daily")
+
+    with ThreadPoolExecutor(max_workers=min(8, 2 * len(names))) as pool:
+        geo = {}
+        for name, fut in [(n, pool.submit(copy_context().run, get_coordinates, n)) for n in names]:
+            try:
+                geo[name] = fut.result()
+            except Exception as e:
+                geo[name] = e
+
+        # one set of upstream requests per distinct location
+        coords = {tuple(round(v, 4) for v in c) for c in geo.values() if not isinstance(c, Exception)}
+        current_futs = {c: pool.submit(copy_context().run, _fetch_current, *c) for c in coords} if current else {}
+        forecast_futs = {c: pool.submit(copy_context().run, _fetch_forecast, *c) for c in coords} if parts else {}
+
+        def _get(futs, c):
+            try:
+                return futs[c].result()
+            except Exception as e:
+                return e
+
+        columns = ["city"]
+        if current:
+            columns.append("now")
+        if hourly_hours:
+            columns.append(f"next {hourly_hours}h")
+        if daily_days:
+            columns.append(f"{daily_days}-day")
+        rows = [" | ".join(columns)]
+
+        for name in names:
+            loc = geo[name]
+            if isinstance(loc, Exception):
+                rows.append(f"{name} | {loc}")
+                continue
+            c = tuple(round(v, 4) for v in loc)
+            row = [name]
+            if current:
+                data = _get(current_futs, c)
+                if isinstance(data, Exception):
+                    row.append(str(data))
+                else:
+                    row.append(
+                        f"{data['main']['temp']:.0f}°C (feels {data['main']['feels_like']:.0f}°C), "
+                        f"{data['weather'][0]['description']}, {data['main']['humidity']}%"
+                    )
+            if parts:
+                data = _get(forecast_futs, c)
+                if isinstance(data, Exception):
+                    row.extend([str(data)] * len(parts))
+                else:
+                    hourly, daily = data
+                    if hourly_hours:
+                        row.append(_summarize_hours(hourly.window(0, hourly_hours)))
+                    if daily_days:
+                        row.append(_summarize_days(daily.window(0, daily_days)))
+            rows.append(" | ".join(row))
+
+    return "\n".join(rows)